@@ -0,0 +1,163 @@
+"""Relatórios de custos servidos por uma cópia colunar (DuckDB) do banco
+
+As agregações dos relatórios percorrem a tabela `maintenance` inteira, o
+que no SQLite (orientado a linhas) custa caro a cada abertura da página.
+Cada processo mantém uma cópia em DuckDB, em memória, por garagem:
+carregada por completo na primeira consulta e, a partir daí, atualizada
+pelo log de alterações (`export_changes`) sempre que a sequência avança,
+então os relatórios nunca ficam defasados. Sem o pacote duckdb (ou com
+ANALYTICS_ENGINE=sqlite), as mesmas consultas rodam direto no SQLite.
+"""
+import os
+import threading
+import time
+from database import (
+    get_db, get_db_path, get_change_sequence, export_changes, get_maintenance_totals_by_author
+)
+from logger import setup_logger
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = setup_logger('analytics')
+
+ANALYTICS_ENGINE = os.environ.get("ANALYTICS_ENGINE", "duckdb")  # 'duckdb' ou 'sqlite'
+
+# Colunas copiadas para o DuckDB (a foto e as chaves de deduplicação ficam de fora)
+TABLES = {
+    'vehicles': {
+        'id': 'INTEGER', 'brand': 'VARCHAR', 'model': 'VARCHAR', 'year': 'VARCHAR',
+        'purchase_price': 'DOUBLE', 'additional_costs': 'DOUBLE', 'fipe_price': 'DOUBLE',
+    },
+    'maintenance': {
+        'id': 'INTEGER', 'vehicle_id': 'INTEGER', 'date': 'VARCHAR', 'description': 'VARCHAR',
+        'cost': 'DOUBLE', 'mileage': 'INTEGER', 'author': 'VARCHAR',
+    },
+}
+
+REPORT_QUERY = '''
+    SELECT m.date, v.brand, v.model, v.year, m.description, m.cost, m.mileage
+    FROM maintenance m
+    JOIN vehicles v ON m.vehicle_id = v.id
+    ORDER BY m.date DESC
+'''
+MONTHLY_COSTS_QUERY = '''
+    SELECT substr(date, 1, 7) AS month, author, SUM(cost) AS total
+    FROM maintenance
+    GROUP BY month, author
+    ORDER BY month, author
+'''
+
+def get_engine(engine=None):
+    """Motor efetivo: o pedido (ou o configurado), caindo para SQLite sem o duckdb"""
+    engine = engine or ANALYTICS_ENGINE
+    if engine == 'duckdb' and duckdb is None:
+        return 'sqlite'
+    return engine
+
+class ColumnarCopy:
+    """Cópia em DuckDB das colunas de TABLES de um arquivo SQLite"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = duckdb.connect(':memory:')
+        for table, columns in TABLES.items():
+            self.conn.execute(f'''
+                CREATE TABLE {table} ({', '.join(f'{name} {kind}' for name, kind in columns.items())})
+            ''')
+        self.sequence = None
+        self._lock = threading.Lock()
+
+    def _insert(self, table, rows):
+        import pandas as pd
+        frame = pd.DataFrame.from_records(rows, columns=list(TABLES[table]))  # noqa: F841 (lido pelo DuckDB)
+        self.conn.execute(f"INSERT INTO {table} SELECT * FROM frame")
+
+    def _load(self):
+        """Carga completa, lida direto do SQLite sem montar dicionários por linha"""
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            c.execute('BEGIN')
+            sequence = get_change_sequence(c)
+            for table, columns in TABLES.items():
+                self.conn.execute(f"DELETE FROM {table}")
+                self._insert(table, c.execute(f"SELECT {', '.join(columns)} FROM {table}").fetchall())
+            conn.commit()
+        finally:
+            conn.close()
+        return sequence
+
+    def _apply(self, since_seq):
+        changes = export_changes(since_seq, include_images=False)
+        for table, columns in TABLES.items():
+            upserts, deletes = changes[table]['upserts'], changes[table]['deletes']
+            ids = deletes + [row['id'] for row in upserts]
+            if changes['reset']:
+                self.conn.execute(f"DELETE FROM {table}")  # Intervalo podado do log: veio tudo
+            elif ids:
+                self.conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT UNNEST(?))", [ids])
+            if upserts:
+                self._insert(table, [tuple(row[column] for column in columns) for row in upserts])
+        return changes['until']
+
+    def refresh(self):
+        """Traz a cópia até a sequência atual do log de alterações"""
+        with self._lock:
+            current = get_change_sequence()
+            if current == self.sequence:
+                return False
+            start = time.perf_counter()
+            if self.sequence is None:
+                self.sequence = self._load()
+                logger.info(f"Cópia analítica de {self.db_path} carregada em "
+                            f"{(time.perf_counter() - start) * 1000:.0f} ms")
+            else:
+                self.sequence = self._apply(self.sequence)
+            return True
+
+    def cursor(self):
+        self.refresh()
+        return self.conn.cursor()
+
+# Uma cópia por arquivo de banco (uma por garagem) em cada processo
+_copies = {}
+_copies_lock = threading.Lock()
+
+def get_columnar_copy():
+    path = os.path.abspath(get_db_path())
+    with _copies_lock:
+        if path not in _copies:
+            _copies[path] = ColumnarCopy(path)
+        return _copies[path]
+
+def _sqlite_frame(query):
+    import pandas as pd
+    conn = get_db()
+    try:
+        return pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+
+def maintenance_totals_by_author(engine=None):
+    """Total de manutenções por autor"""
+    if get_engine(engine) == 'sqlite':
+        return get_maintenance_totals_by_author()
+    rows = get_columnar_copy().cursor().execute(
+        'SELECT author, SUM(cost) FROM maintenance GROUP BY author'
+    ).fetchall()
+    return dict(rows)
+
+def maintenance_report(engine=None):
+    """DataFrame de todas as manutenções com marca, modelo e ano, da mais recente para a mais antiga"""
+    if get_engine(engine) == 'sqlite':
+        return _sqlite_frame(REPORT_QUERY)
+    return get_columnar_copy().cursor().execute(REPORT_QUERY).df()
+
+def monthly_costs(engine=None):
+    """DataFrame com o custo de manutenção por mês (AAAA-MM) e autor"""
+    if get_engine(engine) == 'sqlite':
+        return _sqlite_frame(MONTHLY_COSTS_QUERY)
+    return get_columnar_copy().cursor().execute(MONTHLY_COSTS_QUERY).df()
@@ -0,0 +1,306 @@
+"""API HTTP em JSON para clientes móveis, ao lado do app Streamlit
+
+Usa as mesmas funções de database.py e fipe_api.py. As listas são
+paginadas (`page`, `per_page`), aceitam `fields` para escolher os campos
+(a foto só vem se pedida) e respondem com gzip quando o cliente aceita.
+Respostas do banco levam um ETag derivado da versão dos dados: enquanto
+nada for gravado, um GET com If-None-Match recebe 304 sem ler o banco.
+
+As rotas /sync atendem o cliente offline (offline_client.py). A garagem é
+escolhida pelo cabeçalho X-Tenant; sem ele, vale a principal.
+
+    python api.py [porta]
+"""
+import base64
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from database import (
+    init_tenants, get_data_version, get_vehicles, get_vehicle, get_vehicle_image,
+    get_vehicle_maintenance, get_all_maintenance_records, get_due_maintenance, DUE_WINDOW_DAYS,
+    export_changes, sync_push
+)
+from logger import setup_logger
+from tenants import DEFAULT_TENANT, tenant_exists, tenant_context
+
+logger = setup_logger('api')
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", "8502"))
+API_TOKEN = os.environ.get("API_TOKEN")  # Se definido, exigido em Authorization: Bearer
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+GZIP_MIN_BYTES = 1024  # Respostas menores vão sem compressão
+MAX_BODY_BYTES = 10 * 1024 * 1024  # Corpo máximo de um POST
+
+VEHICLE_FIELDS = ('id', 'brand', 'model', 'year', 'color', 'purchase_price', 'additional_costs',
+                  'fipe_price', 'natural_key', 'suffix', 'fipe_code', 'planned_sale_date',
+                  'fipe_brand_code', 'fipe_model_code', 'fipe_year_code', 'has_image', 'image_data')
+MAINTENANCE_FIELDS = ('id', 'vehicle_id', 'date', 'description', 'cost', 'mileage', 'author',
+                      'next_maintenance_date')
+REPORT_FIELDS = MAINTENANCE_FIELDS + ('brand', 'model', 'year')
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _query_int(query, name, default, minimum=1, maximum=None):
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(400, f"Parâmetro '{name}' deve ser um número inteiro")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ApiError(400, f"Parâmetro '{name}' fora do intervalo permitido")
+    return value
+
+def _fields(query, available, default):
+    """Campos pedidos em `fields=a,b`; sem o parâmetro, `default`"""
+    if 'fields' not in query:
+        return default
+    fields = [f for f in query['fields'][0].split(',') if f]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ApiError(400, f"Campo(s) desconhecido(s): {', '.join(unknown)}")
+    return fields
+
+def _paginate(items, query):
+    page = _query_int(query, 'page', 1)
+    per_page = _query_int(query, 'per_page', DEFAULT_PER_PAGE, maximum=MAX_PER_PAGE)
+    start = (page - 1) * per_page
+    return {
+        'page': page,
+        'per_page': per_page,
+        'total': len(items),
+        'pages': (len(items) + per_page - 1) // per_page,
+    }, items[start:start + per_page]
+
+def _vehicle_dict(vehicle, fields):
+    # A foto só é lida do banco se 'image_data' estiver entre os campos
+    data = vehicle.to_dict(include_image='image_data' in fields)
+    data['has_image'] = vehicle.has_image
+    return {field: data[field] for field in fields}
+
+def _select(record, fields):
+    data = record.to_dict()
+    return {field: data[field] for field in fields}
+
+def list_vehicles(query):
+    fields = _fields(query, VEHICLE_FIELDS, VEHICLE_FIELDS[:-1])
+    vehicles = sorted(get_vehicles(), key=lambda v: v.id)
+    meta, page = _paginate(vehicles, query)
+    return dict(meta, items=[_vehicle_dict(v, fields) for v in page])
+
+def vehicle_detail(query, vehicle_id):
+    vehicle = get_vehicle(int(vehicle_id))
+    if vehicle is None:
+        raise ApiError(404, f"Veículo {vehicle_id} não encontrado")
+    return _vehicle_dict(vehicle, _fields(query, VEHICLE_FIELDS, VEHICLE_FIELDS[:-1]))
+
+def vehicle_image(query, vehicle_id):
+    image_data = get_vehicle_image(int(vehicle_id))
+    if image_data is None:
+        raise ApiError(404, f"Veículo {vehicle_id} sem foto")
+    image = base64.b64decode(image_data)
+    return image, 'image/png' if image.startswith(b'\x89PNG') else 'image/jpeg'
+
+def list_vehicle_maintenance(query, vehicle_id):
+    fields = _fields(query, MAINTENANCE_FIELDS, MAINTENANCE_FIELDS)
+    meta, page = _paginate(get_vehicle_maintenance(int(vehicle_id)), query)
+    return dict(meta, items=[_select(record, fields) for record in page])
+
+def list_maintenance(query):
+    fields = _fields(query, REPORT_FIELDS, REPORT_FIELDS)
+    meta, page = _paginate(get_all_maintenance_records(), query)
+    return dict(meta, items=[_select(record, fields) for record in page])
+
+def due_maintenance(query):
+    within_days = _query_int(query, 'within_days', DUE_WINDOW_DAYS, minimum=0)
+    meta, page = _paginate(get_due_maintenance(within_days), query)
+    return dict(meta, items=page)
+
+def sync_changes(query):
+    since = _query_int(query, 'since', 0, minimum=0)
+    return export_changes(since, include_images=False)
+
+def sync_push_ops(body):
+    if not isinstance(body.get('client_id'), str) or not isinstance(body.get('ops'), list):
+        raise ApiError(400, "Corpo deve ter 'client_id' e 'ops'")
+    return sync_push(body['client_id'], body['ops'])
+
+def _fipe_records(frame):
+    return {'items': frame.to_dict('records'), 'stale': bool(frame.attrs.get('stale'))}
+
+def fipe_brands(query):
+    from fipe_api import get_fipe_brands
+    return _fipe_records(get_fipe_brands())
+
+def fipe_models(query, brand_code):
+    from fipe_api import get_fipe_models
+    return _fipe_records(get_fipe_models(brand_code))
+
+def fipe_years(query, brand_code, model_code):
+    from fipe_api import get_fipe_years
+    return _fipe_records(get_fipe_years(brand_code, model_code))
+
+def fipe_price(query, brand_code, model_code, year_code):
+    from fipe_api import get_fipe_price
+    return get_fipe_price(brand_code, model_code, year_code)
+
+def _version_tag():
+    return str(get_data_version())
+
+def _due_tag():
+    # A lista de vencimentos também muda com a data, não só com as escritas
+    return f"{get_data_version()}-{datetime.now().date()}"
+
+# (padrão do caminho, função, validador do ETag). Com validador, o ETag é
+# calculado antes de ler os dados; sem ele (FIPE), vem do hash da resposta.
+ROUTES = [
+    (r'/vehicles', list_vehicles, _version_tag),
+    (r'/vehicles/(\d+)', vehicle_detail, _version_tag),
+    (r'/vehicles/(\d+)/image', vehicle_image, _version_tag),
+    (r'/vehicles/(\d+)/maintenance', list_vehicle_maintenance, _version_tag),
+    (r'/maintenance', list_maintenance, _version_tag),
+    (r'/maintenance/due', due_maintenance, _due_tag),
+    (r'/sync/changes', sync_changes, _version_tag),
+    (r'/fipe/brands', fipe_brands, None),
+    (r'/fipe/brands/([^/]+)/models', fipe_models, None),
+    (r'/fipe/brands/([^/]+)/models/([^/]+)/years', fipe_years, None),
+    (r'/fipe/brands/([^/]+)/models/([^/]+)/years/([^/]+)', fipe_price, None),
+]
+ROUTES = [(re.compile(f"^{pattern}/?$"), handler, validator) for pattern, handler, validator in ROUTES]
+POST_ROUTES = {'/sync/push': sync_push_ops}
+
+def _etag(*parts):
+    return 'W/"' + hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20] + '"'
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "GerenciamentoCarroAPI/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            self._authorize()
+            for pattern, handler, validator in ROUTES:
+                match = pattern.match(url.path)
+                if match:
+                    break
+            else:
+                raise ApiError(404, "Rota não encontrada")
+
+            tenant = self._tenant()
+            with tenant_context(tenant):
+                query = parse_qs(url.query)
+                etag = None
+                if validator is not None:
+                    # Chave do ETag: garagem + versão dos dados + URL; o 304 dispensa ler os dados
+                    etag = _etag(tenant, validator(), self.path)
+                    if _etag_matches(self.headers.get('If-None-Match'), etag):
+                        return self._send(304, b'', etag=etag)
+
+                result = handler(query, *match.groups())
+            if isinstance(result, tuple):
+                body, content_type = result
+            else:
+                body, content_type = json.dumps(result, ensure_ascii=False).encode(), 'application/json'
+            if etag is None:
+                etag = _etag(hashlib.sha1(body).hexdigest())
+                if _etag_matches(self.headers.get('If-None-Match'), etag):
+                    return self._send(304, b'', etag=etag)
+            self._send(200, body, content_type, etag)
+        except ApiError as e:
+            self._send_error(e.status, str(e))
+        except Exception as e:
+            logger.error(f"Erro em GET {self.path}: {e}")
+            self._send_error(500, "Erro interno")
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        try:
+            self._authorize()
+            handler = POST_ROUTES.get(urlsplit(self.path).path.rstrip('/'))
+            if handler is None:
+                raise ApiError(404, "Rota não encontrada")
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY_BYTES:
+                raise ApiError(413, "Corpo da requisição muito grande")
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                raise ApiError(400, "Corpo da requisição não é um JSON válido")
+            with tenant_context(self._tenant()):
+                result = handler(body)
+            self._send(200, json.dumps(result, ensure_ascii=False).encode(), 'application/json')
+        except ApiError as e:
+            self._send_error(e.status, str(e))
+        except Exception as e:
+            logger.error(f"Erro em POST {self.path}: {e}")
+            self._send_error(500, "Erro interno")
+
+    def _tenant(self):
+        tenant = self.headers.get('X-Tenant') or DEFAULT_TENANT
+        if not tenant_exists(tenant):
+            raise ApiError(404, f"Garagem não encontrada: {tenant}")
+        return tenant
+
+    def _authorize(self):
+        if API_TOKEN is None:
+            return
+        header = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(header, f"Bearer {API_TOKEN}"):
+            raise ApiError(401, "Token inválido ou ausente")
+
+    def _send_error(self, status, message):
+        self._send(status, json.dumps({'error': message}, ensure_ascii=False).encode(), 'application/json')
+
+    def _send(self, status, body, content_type=None, etag=None):
+        compress = (len(body) >= GZIP_MIN_BYTES and content_type == 'application/json'
+                    and 'gzip' in self.headers.get('Accept-Encoding', ''))
+        if compress:
+            body = gzip.compress(body, compresslevel=6)
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', f"{content_type}; charset=utf-8" if content_type == 'application/json' else content_type)
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding, Authorization, X-Tenant')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+def create_server(host=API_HOST, port=API_PORT):
+    init_tenants()
+    return ThreadingHTTPServer((host, port), ApiHandler)
+
+if __name__ == "__main__":
+    server = create_server(port=int(sys.argv[1]) if len(sys.argv) > 1 else API_PORT)
+    logger.info(f"API em http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
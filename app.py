@@ -1,20 +1,43 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
 import io
 from database import (
-    init_db, add_vehicle, get_vehicles, update_vehicle, delete_vehicle,
+    init_db, add_vehicle, get_vehicles, get_vehicle, update_vehicle, delete_vehicle,
     add_maintenance, get_vehicle_maintenance, update_maintenance, delete_maintenance,
-    get_all_maintenance_records, check_vehicle_exists, get_vehicle_by_details, get_maintenance_totals_by_author
+    find_existing_vehicles, get_change_sequence, export_changes, apply_changes, get_writer_stats,
+    refresh_due_maintenance, get_scheduled_due_maintenance, export_vehicles, enqueue_job, get_jobs,
+    get_tenants_report, get_tenants_fleet_models, get_storage_report, reclaim_free_pages,
+    prune_change_log
+)
+from fipe_api import (
+    get_fipe_brands, get_fipe_models, get_fipe_years, get_fipe_price, start_fipe_prefetch, parse_fipe_value,
+    breaker as fipe_breaker
+)
+from scheduler import start_daily_task
+from jobs import start_workers, submit_import, JOB_LABELS
+from cache_manager import cache_stats, evict_cache
+from tenants import (
+    DEFAULT_TENANT, list_tenants, tenant_exists, get_tenant_name, set_current_tenant, tenant_context,
+    create_tenant
 )
-from fipe_api import get_fipe_brands, get_fipe_models, get_fipe_years, get_fipe_price
 from vehicle_manager import save_image
+from models import Vehicle, Maintenance
+from dataclasses import replace
 import base64
 from io import BytesIO
 from datetime import datetime, timedelta
 import os
 import json
 import time  # Adicione esta importação no topo do arquivo
+
+STYLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
+
+@st.cache_resource
+def load_styles():
+    """Lê static/style.css uma vez por processo"""
+    with open(STYLE_FILE, encoding='utf-8') as f:
+        return f"<style>\n{f.read()}</style>"
+
 def get_log_files():
     """Retorna lista de arquivos de log disponíveis"""
     log_dir = "logs"
@@ -58,10 +81,13 @@ def admin_section():
         - Confirme as alterações antes de salvar
     """)
 
-    tab1, tab2, tab3 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📥 Importar/Exportar Veículos",
         "📁 Gerenciar Logs",
-        "📊 Relatório de Custos"
+        "📊 Relatório de Custos",
+        "📉 Depreciação",
+        "⏳ Tarefas",
+        "🏢 Garagens"
     ])
     with tab1:
         st.header("Importar/Exportar Veículos")
@@ -69,15 +95,8 @@ def admin_section():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("💾 Exportar Dados", use_container_width=True):
-                json_str = export_vehicles_data()
-                if json_str:
-                    st.download_button(
-                        label="📥 Baixar Backup (JSON)",
-                        data=json_str,
-                        file_name=f"backup_veiculos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json",
-                        key="download_backup"
-                    )
+                job_id = enqueue_job('export_vehicles')
+                st.success(f"✅ Exportação enviada para a fila (tarefa #{job_id}). Baixe o arquivo na aba Tarefas.")
         
         with col2:
             uploaded_file = st.file_uploader(
@@ -88,21 +107,21 @@ def admin_section():
             
             if uploaded_file and st.button("📤 Importar Dados", use_container_width=True):
                 try:
-                    data = json.load(uploaded_file)
+                    file_data = uploaded_file.getvalue()
+                    data = json.loads(file_data)
+                    if 'since' in data and 'until' in data:
+                        # Arquivo incremental gerado por "Exportar Alterações"
+                        applied = apply_changes(data)
+                        st.success(
+                            f"✅ Alterações aplicadas: {applied['vehicles']} veículo(s), "
+                            f"{applied['maintenance']} manutenção(ões) (sequência {data['until']})"
+                        )
+                        st.stop()
                     vehicles = data.get('vehicles', [])
                     
-                    # Lista para armazenar veículos duplicados
-                    duplicates = []
-                    
-                    # Verifica duplicatas antes de importar
-                    for vehicle in vehicles:
-                        if check_vehicle_exists(
-                            vehicle['brand'],
-                            vehicle['model'],
-                            vehicle['year'],
-                            vehicle.get('color', '')
-                        ):
-                            duplicates.append(vehicle)
+                    # Verifica duplicatas antes de importar (uma consulta para o arquivo todo)
+                    existing = find_existing_vehicles(vehicles)
+                    duplicates = [v for i, v in enumerate(vehicles) if i in existing]
                     
                     if duplicates:
                         st.warning(f"Encontrados {len(duplicates)} veículos que já existem no sistema.")
@@ -113,34 +132,109 @@ def admin_section():
                         col1, col2 = st.columns(2)
                         with col1:
                             if st.button("🔄 Substituir Existentes", key="replace_vehicles"):
-                                imported = import_vehicles_with_progress(vehicles, replace=True)
-                                st.success(f"✅ Importação concluída! {imported} veículos importados com sucesso!")
-                                st.balloons()
-                                st.rerun()
+                                job_id = submit_import(file_data, replace=True)
+                                st.success(f"✅ Importação de {len(vehicles)} veículos enviada para a fila (tarefa #{job_id})")
                         with col2:
                             if st.button("➕ Manter Ambos", key="keep_both"):
-                                imported = import_vehicles_with_progress(vehicles, replace=False)
-                                st.success(f"✅ Importação concluída! {imported} veículos importados com sucesso!")
-                                st.balloons()
-                                st.rerun()
+                                job_id = submit_import(file_data, replace=False)
+                                st.success(f"✅ Importação de {len(vehicles)} veículos enviada para a fila (tarefa #{job_id})")
                     else:
                         # Se não houver duplicatas, importa normalmente
-                        imported = import_vehicles_with_progress(vehicles, replace=False)
-                        st.success(f"✅ Importação concluída! {imported} veículos importados com sucesso!")
-                        st.balloons()
-                        st.rerun()
+                        job_id = submit_import(file_data, replace=False)
+                        st.success(f"✅ Importação de {len(vehicles)} veículos enviada para a fila (tarefa #{job_id})")
                 except Exception as e:
                     st.error(f"❌ Erro ao importar dados: {str(e)}")
 
+        st.subheader("Exportação Incremental")
+        st.caption(f"Sequência atual do log de alterações: {get_change_sequence()}")
+        since_seq = st.number_input(
+            "Exportar alterações desde a sequência",
+            min_value=0,
+            step=1,
+            help="Use o valor 'until' (ou 'sequence') do último arquivo exportado"
+        )
+        if st.button("🔁 Exportar Alterações", use_container_width=True):
+            changes = export_changes(int(since_seq))
+            st.download_button(
+                label=f"📥 Baixar Alterações ({changes['since']} → {changes['until']})",
+                data=json.dumps(changes, ensure_ascii=False),
+                file_name=f"alteracoes_{changes['since']}_{changes['until']}.json",
+                mime="application/json",
+                key="download_changes"
+            )
+
     with tab2:
         st.header("Gerenciar Logs do Sistema")
         download_logs()
 
+        st.subheader("Fila de Escrita do Banco")
+        writer_stats = get_writer_stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Operações na fila", writer_stats['queue_depth'])
+        col2.metric("Commit médio", f"{writer_stats['avg_commit_ms']:.1f} ms")
+        col3.metric("Último commit", f"{writer_stats['last_commit_ms']:.1f} ms")
+        st.caption(
+            f"{writer_stats['operations']} operação(ões) em {writer_stats['commits']} commit(s), "
+            f"maior grupo: {writer_stats['max_batch_size']}, falhas: {writer_stats['failed_operations']}"
+        )
+
+        st.subheader("API FIPE")
+        st.caption(
+            f"Circuito {fipe_breaker.state()}: abre após {fipe_breaker.failure_threshold} falha(s) "
+            f"seguidas e testa a API de novo a cada {fipe_breaker.reset_timeout:.0f} s"
+        )
+
+        st.subheader("Cache em Disco")
+        stats = cache_stats()
+        st.dataframe(
+            [
+                {
+                    'Namespace': namespace,
+                    'Entradas': item['entries'],
+                    'Tamanho (KB)': round(item['bytes'] / 1024, 1),
+                    'Limite (KB)': round(item['max_bytes'] / 1024) if item['max_bytes'] else None,
+                    'Acertos (%)': round(item['hit_ratio'] * 100, 1) if item['hit_ratio'] is not None else None,
+                }
+                for namespace, item in stats.items()
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+        if st.button("🧹 Liberar Espaço do Cache"):
+            removed, freed = evict_cache()
+            st.success(f"{removed} entrada(s) removida(s), {freed / 1024:.0f} KB liberados")
+
+        st.subheader("Armazenamento do Banco")
+        storage = get_storage_report(include_objects=False)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Tamanho do arquivo", f"{storage['file_bytes'] / 1024 / 1024:.1f} MB")
+        col2.metric("Páginas livres", f"{storage['free_ratio'] * 100:.1f}%")
+        col3.metric("auto_vacuum", storage['auto_vacuum'])
+        st.caption(f"{storage['free_pages']} de {storage['page_count']} página(s) de "
+                   f"{storage['page_size']} bytes livres; devolvidas ao sistema diariamente.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("📊 Analisar Espaço por Tabela", use_container_width=True):
+                objects = get_storage_report()['objects']
+                if objects is None:
+                    st.warning("Este SQLite não tem a tabela dbstat.")
+                else:
+                    st.dataframe([
+                        {'Nome': item['name'], 'Tipo': item['type'], 'Tabela': item['table'],
+                         'Páginas': item['pages'], 'Tamanho (KB)': round(item['bytes'] / 1024, 1)}
+                        for item in objects
+                    ], hide_index=True, use_container_width=True)
+        with col2:
+            if st.button("♻️ Recuperar Espaço do Banco", use_container_width=True):
+                enqueue_job('reclaim_free_pages')
+                st.success("Recuperação enfileirada; acompanhe na aba Tarefas.")
+
     with tab3:
         st.header("Relatório de Custos por Autor")
         
-        # Busca totais do banco de dados
-        totals = get_maintenance_totals_by_author()
+        # Agregações servidas pela cópia colunar (analytics.py), carregada sob demanda
+        from analytics import maintenance_totals_by_author, monthly_costs
+        totals = maintenance_totals_by_author()
         
         # Cria colunas para exibir os totais
         col1, col2 = st.columns(2)
@@ -163,41 +257,204 @@ def admin_section():
             f"R$ {sum(totals.values()):,.2f}",
         )
 
-def import_vehicles_with_progress(vehicles, replace=False):
-    """Função auxiliar para importar veículos com barra de progresso"""
-    imported = 0
-    progress_bar = st.progress(0)
-    
-    for i, vehicle in enumerate(vehicles):
-        maintenance_records = vehicle.pop('maintenance', [])
-        
-        try:
-            if replace:
-                # Remove veículo existente se estiver substituindo
-                existing_vehicle = get_vehicle_by_details(
-                    vehicle['brand'],
-                    vehicle['model'],
-                    vehicle['year'],
-                    vehicle.get('color', '')
+        costs = monthly_costs()
+        if not costs.empty:
+            st.subheader("Custos por Mês")
+            st.bar_chart(costs.pivot(index='month', columns='author', values='total').fillna(0))
+
+    with tab4:
+        st.header("Depreciação e Valor de Revenda")
+        st.caption(
+            "Taxa mensal ajustada sobre o histórico de preços FIPE guardado a cada consulta; "
+            "o valor é projetado para a data de venda planejada de cada veículo (ou para hoje)."
+        )
+        vehicles = get_vehicles()
+        if not vehicles:
+            st.info("Não há veículos cadastrados.")
+        else:
+            # pandas/numpy só são carregados quando o relatório é aberto
+            from fipe_analytics import fleet_projection
+            projection = fleet_projection(vehicles)
+            report = projection[[
+                'vehicle', 'fipe_code', 'last_reference', 'months', 'monthly_rate',
+                'planned_sale_date', 'projected_value', 'projected_result'
+            ]].copy()
+            report['monthly_rate'] = report['monthly_rate'] * 100
+            report.columns = [
+                'Veículo', 'Código FIPE', 'Última Referência', 'Meses no Histórico', 'Taxa Mensal (%)',
+                'Venda Planejada', 'Valor Projetado (R$)', 'Resultado Projetado (R$)'
+            ]
+            st.dataframe(report, hide_index=True, use_container_width=True)
+
+    with tab5:
+        st.header("Tarefas em Segundo Plano")
+        st.caption("Importações, exportações, backups e atualizações FIPE rodam fora da sessão; "
+                   "é possível fechar a página e voltar depois.")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            if st.button("🗄️ Backup do Banco", use_container_width=True):
+                enqueue_job('backup')
+        with col2:
+            if st.button("🔄 Atualizar Valores FIPE", use_container_width=True):
+                enqueue_job('refresh_fipe_prices')
+        with col3:
+            if st.button("🔎 Preencher Códigos FIPE", use_container_width=True):
+                enqueue_job('backfill_fipe_codes')
+        with col4:
+            if st.button("🗜️ Recomprimir Fotos", use_container_width=True,
+                         help="Reduz as fotos gravadas antes da compressão automática"):
+                enqueue_job('reencode_images')
+        show_jobs()
+
+    with tab6:
+        tenants_section()
+
+def tenants_section():
+    """Relatório consolidado de todas as garagens e cadastro de novas"""
+    st.header("Garagens")
+    st.caption("Cada garagem tem seu próprio banco, backups e cache. O relatório abaixo "
+               "soma todas, lendo os bancos diretamente.")
+    report = get_tenants_report()
+    totals = report['totals']
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Veículos", totals['vehicles'])
+    col2.metric("Total Investido", f"R$ {totals['invested']:,.2f}")
+    col3.metric("Valor FIPE", f"R$ {totals['fipe_value']:,.2f}")
+
+    st.subheader("Por Garagem")
+    st.dataframe([
+        {
+            'Garagem': row['name'],
+            'Veículos': row['vehicles'],
+            'Investido (R$)': row['invested'],
+            'Valor FIPE (R$)': row['fipe_value'],
+            'Manutenções': row['maintenance_records'],
+            'Custo de Manutenção (R$)': row['maintenance_cost'],
+        }
+        for row in report['tenants']
+    ], hide_index=True, use_container_width=True)
+
+    st.subheader("Por Marca")
+    st.dataframe([
+        {'Marca': row['brand'], 'Veículos': row['vehicles'],
+         'Investido (R$)': row['invested'], 'Valor FIPE (R$)': row['fipe_value']}
+        for row in report['by_brand']
+    ], hide_index=True, use_container_width=True)
+
+    st.subheader("Nova Garagem")
+    with st.form("new_tenant_form"):
+        tenant_id = st.text_input("Identificador", help="Letras minúsculas, números, '-' e '_' (ex.: filial-centro)")
+        tenant_name = st.text_input("Nome")
+        if st.form_submit_button("➕ Criar Garagem"):
+            try:
+                create_tenant(tenant_id.strip(), tenant_name.strip() or None)
+                initialize_tenant(tenant_id.strip())
+                st.success(f"✅ Garagem '{tenant_name or tenant_id}' criada.")
+            except ValueError as e:
+                st.error(f"❌ {e}")
+
+JOB_STATUS_LABELS = {'queued': "⏳ Na fila", 'running': "⚙️ Em execução", 'done': "✅ Concluída", 'failed': "❌ Falhou"}
+
+def _job_summary(job):
+    result = job['result'] or {}
+    if job['status'] == 'failed':
+        return job['error']
+    if job['status'] != 'done':
+        return job['message'] or ''
+    if job['kind'] == 'import_vehicles':
+        summary = f"{result['imported']} veículo(s) importado(s)"
+        return summary + (f", {len(result['errors'])} erro(s)" if result['errors'] else '')
+    if job['kind'] == 'export_vehicles':
+        return f"{result['vehicles']} veículo(s) exportado(s)"
+    if job['kind'] == 'backup':
+        return result.get('path') or ''
+    if job['kind'] == 'reencode_images':
+        return (f"{result['reencoded']} foto(s) recomprimida(s), {result['skipped']} mantida(s), "
+                f"{result['failed']} com erro; {result['bytes_saved'] / 1024 / 1024:.1f} MB economizados")
+    if job['kind'] == 'reclaim_free_pages':
+        return f"{result['pages']} página(s) devolvida(s), {result['bytes'] / 1024 / 1024:.1f} MB"
+    if job['kind'] == 'backfill_fipe_codes':
+        return f"{result['updated']} veículo(s) com códigos gravados, {result['not_found']} não encontrado(s)"
+    if job['kind'] == 'refresh_fipe_prices':
+        return (f"{result['updated']} atualizado(s), {result['unchanged']} sem mudança, "
+                f"{result['not_found']} não encontrado(s), {result['stale']} com API indisponível, "
+                f"{result.get('failed', 0)} com erro")
+    return ''
+
+def _show_job(job):
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        st.markdown(f"**#{job['id']} {JOB_LABELS.get(job['kind'], job['kind'])}** — "
+                    f"{JOB_STATUS_LABELS.get(job['status'], job['status'])}")
+        st.caption(f"Criada em {job['created_at']}. {_job_summary(job)}")
+        if job['result'] and job['result'].get('errors'):
+            with st.expander("Erros"):
+                for error in job['result']['errors']:
+                    st.write(f"- {error}")
+    with col2:
+        if job['status'] == 'running':
+            st.progress(job['progress'])
+        elif job['status'] == 'done' and job['kind'] == 'export_vehicles' and os.path.exists(job['result']['path']):
+            with open(job['result']['path'], 'rb') as f:
+                st.download_button(
+                    label="📥 Baixar Backup (JSON)",
+                    data=f.read(),
+                    file_name=f"backup_veiculos_{job['finished_at'][:19].replace(':', '').replace('-', '')}.json",
+                    mime="application/json",
+                    key=f"download_export_{job['id']}"
                 )
-                if existing_vehicle:
-                    delete_vehicle(existing_vehicle['id'])
-            
-            new_vehicle_id = add_vehicle(vehicle)
-            
-            # Adiciona manutenções
-            for maintenance in maintenance_records:
-                maintenance['vehicle_id'] = new_vehicle_id
-                add_maintenance(maintenance)
-                
-            imported += 1
-            progress_bar.progress((i + 1) / len(vehicles))
-            
-        except Exception as e:
-            st.warning(f"Erro ao importar veículo {vehicle['brand']} {vehicle['model']}: {str(e)}")
-            continue
-            
-    return imported
+
+@st.fragment(run_every=2)
+def show_active_jobs():
+    """Tarefas na fila e em execução, relidas a cada 2 s sem recarregar a página"""
+    use_session_tenant()  # O fragmento pode rodar em outra thread, sem a garagem definida
+    active = get_jobs(active=True)
+    finished = st.session_state.get('active_jobs', set()) - {job['id'] for job in active}
+    st.session_state.active_jobs = {job['id'] for job in active}
+    if finished:
+        # Alguma tarefa terminou: recarrega a página para atualizar a lista de encerradas
+        st.rerun()
+    for job in active:
+        _show_job(job)
+
+def show_jobs():
+    show_active_jobs()
+    jobs = get_jobs(active=False)
+    if not jobs and not st.session_state.active_jobs:
+        st.info("Nenhuma tarefa executada ainda.")
+    for job in jobs:
+        _show_job(job)
+
+@st.cache_resource
+def initialize_app():
+    """Tarefas em segundo plano, uma vez por processo e não a cada rerun"""
+    for tenant in list_tenants():
+        initialize_tenant(tenant)
+    start_fipe_prefetch(get_tenants_fleet_models)
+    start_workers()
+
+@st.cache_resource
+def initialize_tenant(tenant):
+    """Banco e tarefa diária de uma garagem, uma vez por processo"""
+    with tenant_context(tenant):
+        init_db()
+    start_daily_task('due_maintenance', refresh_due_maintenance, tenant=tenant)
+    start_daily_task('prune_change_log', prune_change_log, tenant=tenant)
+    start_daily_task('incremental_vacuum', reclaim_free_pages, tenant=tenant)
+
+def use_session_tenant():
+    """Define a garagem da sessão como a ativa: o banco e o cache desta execução
+
+    A garagem inicial pode vir na URL (?garagem=filial-centro); depois vale
+    a escolhida no menu lateral.
+    """
+    if 'tenant' not in st.session_state:
+        st.session_state.tenant = st.query_params.get('garagem', DEFAULT_TENANT)
+    if not tenant_exists(st.session_state.tenant):
+        st.session_state.tenant = DEFAULT_TENANT
+    set_current_tenant(st.session_state.tenant)
+    initialize_tenant(st.session_state.tenant)
+    return st.session_state.tenant
 
 def main():
     # Configurar diretório de dados persistente
@@ -214,163 +471,10 @@ def main():
         }
     )
 
-    # Configurações para melhor experiência mobile
-    st.markdown("""
-        <style>
-        [data-testid="stSidebar"][aria-expanded="true"] {
-            max-width: 80%;
-            width: 80%;
-        }
-        .streamlit-expanderHeader {
-            font-size: 1em;
-        }
-        .stButton > button {
-            width: 100%;
-            border-radius: 20px;
-            height: 3em;
-        }
-        @media (max-width: 640px) {
-            .main > div {
-                padding-left: 0.5rem;
-                padding-right: 0.5rem;
-            }
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Folha de estilos única, lida do disco uma vez por processo
+    st.markdown(load_styles(), unsafe_allow_html=True)
     st._config.set_option('server.address', '0.0.0.0')
 
-    # CSS para melhorar a interface mobile e tornar imagens responsivas
-    st.markdown("""
-        <style>
-        .stButton>button {
-            width: 100%;
-            height: 50px;
-            margin: 5px 0;
-        }
-        .stSelectbox {
-            margin: 10px 0;
-        }
-        .vehicle-info {
-            font-size: 18px !important;
-            line-height: 2 !important;
-            padding: 10px 0;
-        }
-        .vehicle-info p {
-            margin: 10px 0 !important;
-        }
-        .delete-button {
-            background-color: #ff4b4b !important;
-            color: white !important;
-            border: none !important;
-            padding: 0.5rem !important;
-            border-radius: 0.3rem !important;
-            cursor: pointer !important;
-        }
-        .maintenance-card {
-            background-color: #f0f2f6;
-            padding: 1rem;
-            border-radius: 0.5rem;
-            margin: 0.5rem 0;
-        }
-        /* Estilos para imagens responsivas */
-        .responsive-img {
-            max-width: 100%;
-            height: auto;
-            margin: 0 auto;
-            display: block;
-            border-radius: 10px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
-        .img-container {
-            position: relative;
-            width: 100%;
-            max-width: 800px;
-            margin: 0 auto;
-            padding: 10px;
-        }
-        /* Media queries para diferentes tamanhos de tela */
-        @media (max-width: 768px) {
-            .img-container {
-                max-width: 100%;
-                padding: 5px;
-            }
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    # Substitua os estilos CSS existentes por versões que usam variáveis de tema
-    st.markdown("""
-        <style>
-        /* Estilos responsivos ao tema */
-        .maintenance-card {
-            background-color: var(--background-color);
-            border: 1px solid var(--secondary-background-color);
-            padding: 1rem;
-            border-radius: 0.5rem;
-            margin: 0.5rem 0;
-            color: var(--text-color);
-        }
-        
-        .vehicle-info {
-            font-size: 18px !important;
-            line-height: 2 !important;
-            padding: 10px;
-            background-color: var(--background-color);
-            border: 1px solid var(--secondary-background-color);
-            border-radius: 0.5rem;
-            color: var(--text-color);
-        }
-
-        /* Menu lateral com cores dinâmicas */
-        .sidebar .sidebar-content {
-            background: var(--background-color);
-        }
-        
-        .menu-button {
-            background-color: var(--secondary-background-color);
-            color: var(--text-color);
-            transition: all 0.3s ease;
-        }
-        
-        .menu-button:hover {
-            background-color: var(--primary-color);
-            color: var(--text-color);
-        }
-        
-        /* Header do menu com tema responsivo */
-        .menu-header {
-            background: var(--secondary-background-color);
-            padding: 10px;
-            border-radius: 5px;
-            color: var(--text-color);
-        }
-        
-        /* Cards e containers */
-        .img-container {
-            background: var(--background-color);
-            border: 1px solid var(--secondary-background-color);
-        }
-
-        /* Tabelas e grids responsivos ao tema */
-        table {
-            background-color: var(--background-color);
-            color: var(--text-color);
-        }
-
-        /* Botões com cores do tema */
-        .stButton>button {
-            background-color: var(--secondary-background-color);
-            color: var(--text-color);
-            border: 1px solid var(--primary-color);
-        }
-        
-        .stButton>button:hover {
-            background-color: var(--primary-color);
-            color: white;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
     # Inicialização dos estados da sessão
     if 'editing_vehicle' not in st.session_state:
         st.session_state.editing_vehicle = None
@@ -382,38 +486,8 @@ def main():
         st.session_state.current_vehicle = None
 
     st.title("Gerenciador de Veículos")
-    init_db()
-
-    # Adicionar estilo personalizado para o menu lateral
-    st.markdown("""
-        <style>
-        /* Estilo para o menu lateral */
-        .sidebar .sidebar-content {
-            background-image: linear-gradient(180deg, #2e7bcf 0%, #1565C0 100%);
-        }
-        
-        /* Estilo para os botões do menu */
-        .stRadio > label {
-            background-color: rgba(255, 255, 255, 0.1);
-            padding: 15px;
-            border-radius: 10px;
-            margin: 5px 0;
-            transition: all 0.3s;
-        }
-        
-        .stRadio > label:hover {
-            background-color: rgba(255, 255, 255, 0.2);
-        }
-        
-        /* Estilo para o título do menu */
-        .sidebar .sidebar-content [data-testid="stMarkdownContainer"] p {
-            color: white;
-            font-size: 1.2em;
-            font-weight: bold;
-            padding: 10px 0;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    initialize_app()
+    use_session_tenant()
 
     # Atualizar o header do menu lateral para usar as classes de tema
     with st.sidebar:
@@ -430,55 +504,16 @@ def main():
             </div>
         """.format((datetime.now() - timedelta(hours=3)).strftime("%d/%m/%Y às %H:%M")), unsafe_allow_html=True)
 
+        tenants = list_tenants()
+        if len(tenants) > 1:
+            st.selectbox("🏢 Garagem", tenants, format_func=get_tenant_name, key="tenant")
+
         menu_items = [
             {"label": "Visualizar Veículos", "icon": "📋", "id": "view"},
             {"label": "Adicionar Veículo", "icon": "➕", "id": "add"},
             {"label": "Administração", "icon": "⚙️", "id": "admin"}
         ]
 
-        # Adiciona estilo personalizado para os botões do menu
-        st.markdown("""
-            <style>
-                div[data-testid="stVerticalBlock"] div[data-testid="stVerticalBlock"] {
-                    gap: 0.5rem;
-                }
-                .menu-button {
-                    width: 100%;
-                    padding: 15px;
-                    margin: 5px 0;
-                    border-radius: 10px;
-                    background-color: rgba(255, 255, 255, 0.1);
-                    color: white;
-                    text-align: left;
-                    cursor: pointer;
-                    border: none;
-                    transition: all 0.3s ease;
-                }
-                .menu-button:hover {
-                    background-color: rgba(255, 255, 255, 0.2);
-                    transform: translateX(5px);
-                }
-                .menu-button.selected {
-                    background-color: rgba(255, 255, 255, 0.3);
-                    border-left: 4px solid #FFFFFF;
-                }
-                .menu-icon {
-                    margin-right: 10px;
-                    font-size: 1.2em;
-                }
-                .menu-footer {
-                    position: absolute;
-                    bottom: 20px;
-                    left: 0;
-                    right: 0;
-                    text-align: center;
-                    color: #FFFFFF;
-                    font-size: 0.8em;
-                    padding: 10px;
-                }
-            </style>
-        """, unsafe_allow_html=True)
-        
         for item in menu_items:
             selected = st.button(
                 f"{item['icon']} {item['label']}", 
@@ -496,7 +531,6 @@ def main():
         admin_section()
     elif st.session_state.current_page == "add":
         add_vehicle_form()
-        backup_after_changes()
     else:  # view
         view_vehicles()
 
@@ -508,17 +542,17 @@ def add_maintenance_form(vehicle_id, maintenance_data=None):
     with st.form(key=f"maintenance_form_{vehicle_id}"):
         date = st.date_input(
             "Data da Manutenção",
-            value=datetime.strptime(maintenance_data['date'], '%Y-%m-%d').date() if is_editing else datetime.now()
+            value=datetime.strptime(maintenance_data.date, '%Y-%m-%d').date() if is_editing else datetime.now()
         )
 
         description = st.text_area(
             "Descrição do Serviço",
-            value=maintenance_data['description'] if is_editing else ""
+            value=maintenance_data.description if is_editing else ""
         )
 
         cost = st.number_input(
             "Custo (R$)",
-            value=maintenance_data['cost'] if is_editing else 0.0,
+            value=maintenance_data.cost if is_editing else 0.0,
             min_value=0.0,
             step=10.0,
             format="%.2f"
@@ -526,13 +560,13 @@ def add_maintenance_form(vehicle_id, maintenance_data=None):
 
         mileage = st.number_input(
             "Quilometragem",
-            value=maintenance_data['mileage'] if is_editing else 0,
+            value=maintenance_data.mileage if is_editing else 0,
             min_value=0
         )
 
         next_date = st.date_input(
             "Próxima Manutenção",
-            value=datetime.strptime(maintenance_data['next_maintenance_date'], '%Y-%m-%d').date() if is_editing and maintenance_data['next_maintenance_date'] else (datetime.now() + timedelta(days=180)).date()
+            value=datetime.strptime(maintenance_data.next_maintenance_date, '%Y-%m-%d').date() if is_editing and maintenance_data.next_maintenance_date else (datetime.now() + timedelta(days=180)).date()
         )
 
         # Seleção do autor simplificada
@@ -541,7 +575,7 @@ def add_maintenance_form(vehicle_id, maintenance_data=None):
             ["Antonio", "Fernando"],
             key=f"author_{vehicle_id}",
             index=0 if not is_editing else (
-                0 if maintenance_data['author'] == "Antonio" else 1
+                0 if maintenance_data.author == "Antonio" else 1
             )
         )
 
@@ -549,18 +583,18 @@ def add_maintenance_form(vehicle_id, maintenance_data=None):
 
         if submit:
             try:
-                maintenance_info = {
-                    'vehicle_id': vehicle_id,
-                    'date': date.strftime('%Y-%m-%d'),
-                    'description': description,
-                    'cost': cost,
-                    'mileage': mileage,
-                    'next_maintenance_date': next_date.strftime('%Y-%m-%d'),
-                    'author': author
-                }
+                maintenance_info = Maintenance(
+                    vehicle_id=vehicle_id,
+                    date=date.strftime('%Y-%m-%d'),
+                    description=description,
+                    cost=cost,
+                    mileage=mileage,
+                    next_maintenance_date=next_date.strftime('%Y-%m-%d'),
+                    author=author
+                )
 
                 if is_editing:
-                    update_maintenance(maintenance_data['id'], maintenance_info)
+                    update_maintenance(maintenance_data.id, maintenance_info)
                     st.success("Manutenção atualizada com sucesso!")
                 else:
                     add_maintenance(maintenance_info)
@@ -570,6 +604,7 @@ def add_maintenance_form(vehicle_id, maintenance_data=None):
                 st.error(f"Erro ao {'atualizar' if is_editing else 'registrar'} manutenção: {str(e)}")
 
 def view_maintenance_history(vehicle_id):
+    """Histórico e formulário de manutenções; roda dentro do fragmento do veículo"""
     maintenance_records = get_vehicle_maintenance(vehicle_id)
     
     if 'delete_confirmation' not in st.session_state:
@@ -588,6 +623,7 @@ def view_maintenance_history(vehicle_id):
             description = st.text_area("Descrição do Serviço")
             cost = st.number_input("Custo (R$)", min_value=0.0, step=10.0, format="%.2f")
             mileage = st.number_input("Quilometragem", min_value=0)
+            next_date = st.date_input("Próxima Manutenção (opcional)", value=None)
             author = st.selectbox("Autor da Manutenção", ["Antonio", "Fernando"])
             
             col1, col2 = st.columns(2)
@@ -596,98 +632,119 @@ def view_maintenance_history(vehicle_id):
             
             if submitted:
                 try:
-                    maintenance_info = {
-                        'vehicle_id': vehicle_id,
-                        'date': date.strftime('%Y-%m-%d'),
-                        'description': description,
-                        'cost': cost,
-                        'mileage': mileage,
-                        'author': author,
-                        'next_maintenance_date': None  # Campo opcional
-                    }
+                    maintenance_info = Maintenance(
+                        vehicle_id=vehicle_id,
+                        date=date.strftime('%Y-%m-%d'),
+                        description=description,
+                        cost=cost,
+                        mileage=mileage,
+                        author=author,
+                        next_maintenance_date=next_date.strftime('%Y-%m-%d') if next_date else None
+                    )
                     add_maintenance(maintenance_info)
                     st.success("✅ Manutenção registrada com sucesso!")
                     st.session_state.show_maintenance_form = False
-                    st.rerun()
+                    st.rerun(scope="fragment")
                 except Exception as e:
                     st.error(f"❌ Erro ao registrar manutenção: {str(e)}")
         
         if st.button("❌ Cancelar", key=f"cancel_add_{vehicle_id}"):
             st.session_state.show_maintenance_form = False
-            st.rerun()
+            st.rerun(scope="fragment")
 
     # Exibir manutenções existentes
     if maintenance_records:
         st.markdown("### Histórico de Manutenções")
         for record in maintenance_records:
             st.markdown("---")  # Separador entre registros
-            st.markdown(f"### 📅 {record['date']} - {record['description'][:30]}...")
+            st.markdown(f"### 📅 {record.date} - {record.description[:30]}...")
             st.markdown("""
                 <div class="maintenance-card">
                     <p><strong>Autor:</strong> {author}</p>
                     <p><strong>Descrição:</strong> {description}</p>
                     <p><strong>Custo:</strong> R$ {cost:.2f}</p>
                     <p><strong>Quilometragem:</strong> {mileage} km</p>
+                    <p><strong>Próxima Manutenção:</strong> {next_date}</p>
                 </div>
             """.format(
-                author=record['author'],
-                description=record['description'],
-                cost=record['cost'],
-                mileage=record['mileage']
+                author=record.author,
+                description=record.description,
+                cost=record.cost,
+                mileage=record.mileage,
+                next_date=record.next_maintenance_date or 'Não agendada'
             ), unsafe_allow_html=True)
 
             col1, col2 = st.columns([3, 1])
             with col2:
-                if st.button("🗑️", key=f"delete_maint_{record['id']}"):
-                    st.session_state.delete_confirmation = record['id']
+                if st.button("🗑️", key=f"delete_maint_{record.id}"):
+                    st.session_state.delete_confirmation = record.id
 
-            if st.session_state.delete_confirmation == record['id']:
+            if st.session_state.delete_confirmation == record.id:
                 col1, col2 = st.columns(2)
                 with col1:
-                    if st.button("⚠️ Confirmar", key=f"confirm_delete_maint_{record['id']}"):
-                        delete_maintenance(record['id'])
+                    if st.button("⚠️ Confirmar", key=f"confirm_delete_maint_{record.id}"):
+                        delete_maintenance(record.id)
                         st.success("Manutenção excluída com sucesso!")
                         st.session_state.delete_confirmation = None
-                        st.rerun()
+                        st.rerun(scope="fragment")
                 with col2:
-                    if st.button("❌ Cancelar", key=f"cancel_delete_maint_{record['id']}"):
+                    if st.button("❌ Cancelar", key=f"cancel_delete_maint_{record.id}"):
                         st.session_state.delete_confirmation = None
-                        st.rerun()
+                        st.rerun(scope="fragment")
     else:
         st.info("Nenhuma manutenção registrada para este veículo.")
 
+def _option_index(options, code):
+    """Posição do código FIPE gravado entre as opções do selectbox (0 se não estiver)"""
+    return next((i for i, option in enumerate(options) if str(option) == code), 0)
+
 def add_vehicle_form(vehicle_data=None):
     is_editing = vehicle_data is not None
     st.header("Editar Veículo" if is_editing else "Adicionar Novo Veículo")
 
     with st.container():
+        # Na edição, os códigos gravados (ou achados pelo nome) posicionam as listas
+        codes = (None, None, None)
+        if is_editing:
+            from fipe_index import vehicle_fipe_codes
+            try:
+                codes = vehicle_fipe_codes(vehicle_data) or codes
+            except Exception:
+                pass
+
         brands = get_fipe_brands()
+        brand_options = brands['codigo'].tolist()
         selected_brand = st.selectbox(
             "Marca do Veículo",
-            options=brands['codigo'].tolist(),
+            options=brand_options,
             format_func=lambda x: brands[brands['codigo'] == x]['nome'].iloc[0],
-            index=0 if not is_editing else next((i for i, row in brands.iterrows() if row['nome'] == vehicle_data['brand']), 0)
+            index=_option_index(brand_options, codes[0])
         )
 
         models = get_fipe_models(selected_brand)
+        model_options = models['codigo'].tolist()
         selected_model = st.selectbox(
             "Modelo do Veículo",
-            options=models['codigo'].tolist(),
+            options=model_options,
             format_func=lambda x: models[models['codigo'] == x]['nome'].iloc[0],
-            index=0 if not is_editing else next((i for i, row in models.iterrows() if row['nome'] == vehicle_data['model']), 0)
+            index=_option_index(model_options, codes[1]) if str(selected_brand) == codes[0] else 0
         )
 
         years = get_fipe_years(selected_brand, selected_model)
+        year_options = years['codigo'].tolist()
         selected_year = st.selectbox(
             "Ano do Veículo",
-            options=years['codigo'].tolist(),
+            options=year_options,
             format_func=lambda x: years[years['codigo'] == x]['nome'].iloc[0],
-            index=0 if not is_editing else next((i for i, row in years.iterrows() if row['nome'] == vehicle_data['year']), 0)
+            index=_option_index(year_options, codes[2]) if str(selected_model) == codes[1] else 0
         )
 
+        if any(frame.attrs.get('stale') for frame in (brands, models, years)):
+            st.warning("⚠️ API FIPE indisponível: mostrando a última lista consultada, que pode estar desatualizada.")
+
         color = st.text_input(
             "Cor do Veículo",
-            value=vehicle_data.get('color', '') if is_editing else ""
+            value=(vehicle_data.color or '') if is_editing else ""
         )
 
         purchase_price = st.number_input(
@@ -695,7 +752,7 @@ def add_vehicle_form(vehicle_data=None):
             min_value=0.0,
             step=100.0,
             format="%.2f",
-            value=vehicle_data['purchase_price'] if is_editing else 0.0
+            value=vehicle_data.purchase_price if is_editing else 0.0
         )
 
         additional_costs = st.number_input(
@@ -703,7 +760,13 @@ def add_vehicle_form(vehicle_data=None):
             min_value=0.0,
             step=100.0,
             format="%.2f",
-            value=vehicle_data['additional_costs'] if is_editing else 0.0
+            value=vehicle_data.additional_costs if is_editing else 0.0
+        )
+
+        planned_sale_date = st.date_input(
+            "Data de Venda Planejada",
+            value=datetime.strptime(vehicle_data.planned_sale_date, '%Y-%m-%d').date()
+            if is_editing and vehicle_data.planned_sale_date else None
         )
 
         uploaded_file = st.file_uploader(
@@ -711,10 +774,18 @@ def add_vehicle_form(vehicle_data=None):
             type=['jpg', 'jpeg', 'png']
         )
 
+        fipe_code = vehicle_data.fipe_code if is_editing else None
         try:
             fipe_data = get_fipe_price(selected_brand, selected_model, selected_year)
-            fipe_price = float(fipe_data['Valor'].replace('R$ ', '').replace('.', '').replace(',', '.'))
-            st.info(f"Valor FIPE: R$ {fipe_price:,.2f}")
+            fipe_price = parse_fipe_value(fipe_data['Valor'])
+            fipe_code = fipe_data.get('CodigoFipe', fipe_code)
+            if fipe_data.get('stale'):
+                st.warning(
+                    f"⚠️ Valor FIPE desatualizado: R$ {fipe_price:,.2f} "
+                    f"(referência {fipe_data.get('MesReferencia', 'desconhecida')}, API indisponível)"
+                )
+            else:
+                st.info(f"Valor FIPE: R$ {fipe_price:,.2f}")
         except Exception as e:
             st.error(f"Erro ao obter valor FIPE: {str(e)}")
             fipe_price = 0.0
@@ -722,34 +793,31 @@ def add_vehicle_form(vehicle_data=None):
         button_text = "💾 Salvar Alterações" if is_editing else "💾 Adicionar Veículo"
         if st.button(button_text, use_container_width=True, type="primary"):
             try:
-                # Mantém a imagem existente se não houver upload de nova imagem
-                if is_editing:
-                    image_data = vehicle_data['image_data']
-                    if uploaded_file:
-                        image_bytes = uploaded_file.getvalue()
-                        image_data = base64.b64encode(image_bytes).decode()
-                else:
-                    image_data = None
-                    if uploaded_file:
-                        image_bytes = uploaded_file.getvalue()
-                        image_data = base64.b64encode(image_bytes).decode()
-
                 total_cost = purchase_price + additional_costs
                 fipe_difference = fipe_price - total_cost
 
-                vehicle_info = {
-                    'brand': brands[brands['codigo'] == selected_brand]['nome'].iloc[0],
-                    'model': models[models['codigo'] == selected_model]['nome'].iloc[0],
-                    'year': years[years['codigo'] == selected_year]['nome'].iloc[0],
-                    'color': color,
-                    'purchase_price': purchase_price,
-                    'additional_costs': additional_costs,
-                    'fipe_price': fipe_price,
-                    'image_data': image_data
-                }
+                fields = dict(
+                    brand=brands[brands['codigo'] == selected_brand]['nome'].iloc[0],
+                    model=models[models['codigo'] == selected_model]['nome'].iloc[0],
+                    year=years[years['codigo'] == selected_year]['nome'].iloc[0],
+                    color=color,
+                    purchase_price=purchase_price,
+                    additional_costs=additional_costs,
+                    fipe_price=fipe_price,
+                    fipe_code=fipe_code,
+                    fipe_brand_code=str(selected_brand),
+                    fipe_model_code=str(selected_model),
+                    fipe_year_code=str(selected_year),
+                    planned_sale_date=planned_sale_date.strftime('%Y-%m-%d') if planned_sale_date else None
+                )
+                # Na edição, a foto existente segue como referência e não é
+                # lida nem regravada se não houver upload de nova imagem
+                vehicle_info = replace(vehicle_data, **fields) if is_editing else Vehicle(**fields)
+                if uploaded_file:
+                    vehicle_info.image_data = save_image(uploaded_file)
 
                 if is_editing:
-                    update_vehicle(vehicle_data['id'], vehicle_info)
+                    update_vehicle(vehicle_data.id, vehicle_info)
                     st.success("✅ Veículo atualizado com sucesso!")
                     st.session_state.editing_vehicle = None
                 else:
@@ -761,13 +829,9 @@ def add_vehicle_form(vehicle_data=None):
                 st.error(f"❌ Erro ao {'atualizar' if is_editing else 'adicionar'} veículo: {str(e)}")
 
 def export_maintenance_report():
-    records = get_all_maintenance_records()
-    if records:
-        df = pd.DataFrame(records)
-        df = df[[
-            'date', 'brand', 'model', 'year', 'description',
-            'cost', 'mileage'
-        ]]
+    from analytics import maintenance_report
+    df = maintenance_report()
+    if not df.empty:
         df.columns = [
             'Data', 'Marca', 'Modelo', 'Ano', 'Descrição',
             'Custo', 'Quilometragem'
@@ -786,19 +850,10 @@ def export_maintenance_report():
 
 def export_vehicles_data():
     """Função para exportar dados de todos os veículos e suas manutenções"""
-    vehicles = get_vehicles()
-    if not vehicles:
+    export_data = export_vehicles()
+    if not export_data['vehicles']:
         st.info("Não há veículos para exportar.")
         return
-    
-    # Adiciona manutenções para cada veículo
-    for vehicle in vehicles:
-        vehicle['maintenance'] = get_vehicle_maintenance(vehicle['id'])
-        
-    export_data = {
-        'vehicles': vehicles,
-        'export_date': datetime.now().isoformat()
-    }
     json_str = json.dumps(export_data, indent=2, ensure_ascii=False)
     return json_str
 
@@ -811,6 +866,7 @@ def import_vehicles_data():
     )
     if uploaded_file:
         try:
+            import pandas as pd
             data = pd.read_json(uploaded_file)
             for _, row in data.iterrows():
                 vehicle_data = row.to_dict()
@@ -820,8 +876,106 @@ def import_vehicles_data():
         except Exception as e:
             st.error(f"Erro ao importar veículos: {str(e)}")
 
+def show_due_maintenance():
+    """Manutenções vencidas ou a vencer, da lista recalculada diariamente"""
+    due = get_scheduled_due_maintenance()
+    if not due:
+        return
+    today = datetime.now().date()
+    with st.expander(f"🔧 Manutenções Próximas ({len(due)})", expanded=True):
+        for item in due:
+            days_left = (datetime.strptime(item['due_date'], '%Y-%m-%d').date() - today).days
+            status = f"vencida há {-days_left} dia(s)" if days_left < 0 else f"em {days_left} dia(s)"
+            st.markdown(
+                f"**{item['brand']} {item['model']} ({item['year']})** — "
+                f"{item['description'][:40]} · {item['due_date']} ({status})"
+            )
+        st.caption(f"Lista atualizada em {due[0]['computed_on']}")
+
+@st.fragment
+def vehicle_card(vehicle_id):
+    """Conteúdo do expander de um veículo, reexecutado isoladamente
+
+    Carrega o próprio veículo (sem a lista da frota), então cliques no
+    histórico, no formulário de manutenção ou em editar/excluir custam só
+    o tempo deste veículo.
+    """
+    use_session_tenant()  # O rerun do fragmento roda em outra thread, sem a garagem definida
+    vehicle = get_vehicle(vehicle_id)
+    if vehicle is None:
+        st.info("Veículo removido.")
+        return
+
+    if st.session_state.editing_vehicle == vehicle.id:
+        add_vehicle_form(vehicle)
+        if st.button("❌ Cancelar Edição", key=f"cancel_{vehicle.id}", type="primary"):
+            st.session_state.editing_vehicle = None
+            st.rerun(scope="fragment")
+    else:
+        if vehicle.has_image:
+            try:
+                image_bytes = base64.b64decode(vehicle.image_data)
+                with st.container():
+                    st.markdown('<div class="img-container">', unsafe_allow_html=True)
+                    st.image(
+                        image_bytes,
+                        width=400,
+                        output_format="PNG",
+                        caption=f"{vehicle.brand} {vehicle.model}",
+                        clamp=True
+                    )
+                    st.markdown('</div>', unsafe_allow_html=True)
+            except Exception as e:
+                st.error(f"Erro ao carregar imagem: {str(e)}")
+
+        total_cost = vehicle.purchase_price + vehicle.additional_costs
+        difference = vehicle.fipe_price - total_cost
+
+        st.markdown(f"""
+            <div class="vehicle-info">
+            <p>🎨 <strong>Cor:</strong> {vehicle.color or 'Não informada'}</p>
+            <p>📊 <strong>Valor de Aquisição:</strong> R$ {vehicle.purchase_price:.2f}</p>
+            <p>💰 <strong>Custos Adicionais:</strong> R$ {vehicle.additional_costs:.2f}</p>
+            <p>💵 <strong>Valor Total:</strong> R$ {total_cost:.2f}</p>
+            <p>🚗 <strong>Valor FIPE:</strong> R$ {vehicle.fipe_price:.2f}</p>
+            <p>📈 <strong>Diferença FIPE:</strong> R$ {difference:.2f}</p>
+            </div>
+        """, unsafe_allow_html=True)
+
+        if difference > 0:
+            st.success("✅ Valor positivo em relação à FIPE")
+        else:
+            st.error("❌ Valor negativo em relação à FIPE")
+
+        st.subheader("📝 Histórico de Manutenções")
+        view_maintenance_history(vehicle.id)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("✏️ Editar", key=f"edit_{vehicle.id}", type="primary"):
+                st.session_state.editing_vehicle = vehicle.id
+                st.rerun(scope="fragment")
+        with col2:
+            if st.button(f"🗑️ Excluir", key=f"delete_{vehicle.id}", type="primary"):
+                st.session_state.delete_vehicle_confirmation = vehicle.id
+
+    if st.session_state.delete_vehicle_confirmation == vehicle.id:
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button(f"⚠️ Confirmar", key=f"confirm_{vehicle.id}", type="primary"):
+                delete_vehicle(vehicle.id)
+                st.success("Veículo excluído com sucesso!")
+                st.session_state.delete_vehicle_confirmation = None
+                # A lista de veículos mudou: reexecuta a página inteira
+                st.rerun()
+        with col2:
+            if st.button("❌ Cancelar", key=f"cancel_delete_{vehicle.id}", type="primary"):
+                st.session_state.delete_vehicle_confirmation = None
+                st.rerun(scope="fragment")
+
 def view_vehicles():
     st.header("Veículos Cadastrados")
+    show_due_maintenance()
     
     # Adiciona botão de exportar relatório
     col1, col2 = st.columns([8, 2])
@@ -837,75 +991,11 @@ def view_vehicles():
         
         st.subheader(f"Total de veículos: {len(vehicles)}")
         
-        # Exibe cada veículo em um expander
+        # Exibe cada veículo em um expander; o conteúdo é um fragmento, então
+        # interações em um veículo só reexecutam o cartão dele
         for vehicle in vehicles:
-            with st.expander(f"🚗 {vehicle['brand']} {vehicle['model']} ({vehicle['year']})"):
-                # Resto do código permanece o mesmo
-                if st.session_state.editing_vehicle == vehicle['id']:
-                    add_vehicle_form(vehicle)
-                    if st.button("❌ Cancelar Edição", key=f"cancel_{vehicle['id']}", type="primary"):
-                        st.session_state.editing_vehicle = None
-                        st.rerun()
-                else:
-                    if vehicle['image_data']:
-                        try:
-                            image_bytes = base64.b64decode(vehicle['image_data'])
-                            with st.container():
-                                st.markdown('<div class="img-container">', unsafe_allow_html=True)
-                                st.image(
-                                    image_bytes,
-                                    width=400,
-                                    output_format="PNG",
-                                    caption=f"{vehicle['brand']} {vehicle['model']}",
-                                    clamp=True
-                                )
-                                st.markdown('</div>', unsafe_allow_html=True)
-                        except Exception as e:
-                            st.error(f"Erro ao carregar imagem: {str(e)}")
-
-                    total_cost = vehicle['purchase_price'] + vehicle['additional_costs']
-                    difference = vehicle['fipe_price'] - total_cost
-
-                    st.markdown(f"""
-                        <div class="vehicle-info">
-                        <p>🎨 <strong>Cor:</strong> {vehicle.get('color', 'Não informada')}</p>
-                        <p>📊 <strong>Valor de Aquisição:</strong> R$ {vehicle['purchase_price']:.2f}</p>
-                        <p>💰 <strong>Custos Adicionais:</strong> R$ {vehicle['additional_costs']:.2f}</p>
-                        <p>💵 <strong>Valor Total:</strong> R$ {total_cost:.2f}</p>
-                        <p>🚗 <strong>Valor FIPE:</strong> R$ {vehicle['fipe_price']:.2f}</p>
-                        <p>📈 <strong>Diferença FIPE:</strong> R$ {difference:.2f}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-
-                    if difference > 0:
-                        st.success("✅ Valor positivo em relação à FIPE")
-                    else:
-                        st.error("❌ Valor negativo em relação à FIPE")
-
-                    st.subheader("📝 Histórico de Manutenções")
-                    view_maintenance_history(vehicle['id'])
-
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("✏️ Editar", key=f"edit_{vehicle['id']}", type="primary"):
-                            st.session_state.editing_vehicle = vehicle['id']
-                            st.rerun()
-                    with col2:
-                        if st.button(f"🗑️ Excluir", key=f"delete_{vehicle['id']}", type="primary"):
-                            st.session_state.delete_vehicle_confirmation = vehicle['id']
-
-                if st.session_state.delete_vehicle_confirmation == vehicle['id']:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button(f"⚠️ Confirmar", key=f"confirm_{vehicle['id']}", type="primary"):
-                            delete_vehicle(vehicle['id'])
-                            st.success("Veículo excluído com sucesso!")
-                            st.session_state.delete_vehicle_confirmation = None
-                            st.rerun()
-                    with col2:
-                        if st.button("❌ Cancelar", key=f"cancel_delete_{vehicle['id']}", type="primary"):
-                            st.session_state.delete_vehicle_confirmation = None
-                            st.rerun()
+            with st.expander(f"🚗 {vehicle.brand} {vehicle.model} ({vehicle.year})"):
+                vehicle_card(vehicle.id)
 
     except Exception as e:
         st.error(f"Erro ao carregar veículos: {e}") # Corrigido formato do error()
@@ -0,0 +1,92 @@
+"""Relatórios de custos no SQLite e na cópia colunar em DuckDB (analytics.py)"""
+import os
+import shutil
+
+import pytest
+
+import analytics
+import database
+from fleet import populate_db
+from models import Maintenance
+
+MAINTENANCE_ROWS = int(os.environ.get("BENCH_MAINTENANCE_ROWS", "1000000"))
+ENGINES = ["sqlite", pytest.param("duckdb", marks=pytest.mark.skipif(analytics.duckdb is None, reason="duckdb ausente"))]
+
+@pytest.fixture(scope="session")
+def maintenance_template(tmp_path_factory):
+    """Banco com 5 mil veículos (sem fotos) e MAINTENANCE_ROWS manutenções"""
+    workdir = tmp_path_factory.mktemp("maintenance")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        populate_db(5000, image_ratio=0)
+        conn = database.get_db()
+        existing = conn.execute('SELECT COUNT(*) FROM maintenance').fetchone()[0]
+        # Replica as manutenções geradas, variando veículo, data e custo, até o total pedido
+        conn.execute('''
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO maintenance (vehicle_id, date, description, cost, mileage, author)
+            SELECT 1 + (m.vehicle_id + n.i) % 5000,
+                   date(m.date, '-' || (n.i % 36) || ' months'),
+                   m.description, round(m.cost * (0.5 + (n.i % 10) / 10.0), 2), m.mileage, m.author
+            FROM n JOIN maintenance m ON m.id <= ?
+            LIMIT ?
+        ''', (MAINTENANCE_ROWS // max(existing, 1) + 1, existing, max(0, MAINTENANCE_ROWS - existing)))
+        if existing > MAINTENANCE_ROWS:
+            # Total pedido menor que o gerado: fica só com as primeiras (ids de 1 em diante)
+            conn.execute('DELETE FROM maintenance WHERE id > ?', (MAINTENANCE_ROWS,))
+        conn.commit()
+        conn.close()
+    finally:
+        os.chdir(cwd)
+    return os.path.join(workdir, "vehicles.db")
+
+@pytest.fixture
+def maintenance_db(maintenance_template, tmp_path, monkeypatch):
+    shutil.copy2(maintenance_template, tmp_path / "vehicles.db")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(analytics, "_copies", {})
+    return tmp_path
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_totals_by_author(benchmark, maintenance_db, engine):
+    analytics.maintenance_totals_by_author(engine)  # Carga da cópia fora da medição
+    totals = benchmark(analytics.maintenance_totals_by_author, engine)
+    assert sum(totals.values()) == pytest.approx(sum(database.get_maintenance_totals_by_author().values()))
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_monthly_costs(benchmark, maintenance_db, engine):
+    analytics.monthly_costs(engine)
+    costs = benchmark(analytics.monthly_costs, engine)
+    assert len(costs) > 0
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_maintenance_report(benchmark, maintenance_db, engine):
+    analytics.maintenance_report(engine)
+    report = benchmark.pedantic(analytics.maintenance_report, args=(engine,), rounds=3)
+    assert len(report) == MAINTENANCE_ROWS
+
+@pytest.mark.skipif(analytics.duckdb is None, reason="duckdb ausente")
+def test_columnar_load(benchmark, maintenance_db):
+    """Carga completa da cópia: o custo da primeira consulta em cada processo"""
+    def load():
+        copy = analytics.ColumnarCopy(database.get_db_path())
+        copy.refresh()
+        return copy
+
+    copy = benchmark.pedantic(load, rounds=2)
+    assert copy.conn.execute('SELECT COUNT(*) FROM maintenance').fetchone()[0] == MAINTENANCE_ROWS
+
+@pytest.mark.skipif(analytics.duckdb is None, reason="duckdb ausente")
+def test_incremental_refresh(benchmark, maintenance_db):
+    """Uma escrita no SQLite seguida do relatório: só a alteração é copiada"""
+    analytics.maintenance_totals_by_author('duckdb')
+    record = Maintenance(vehicle_id=1, date="2026-01-15", description="Troca de óleo", cost=250.0,
+                         mileage=1000, author="Antonio")
+
+    def write_and_report():
+        database.add_maintenance(record)
+        return analytics.maintenance_totals_by_author('duckdb')
+
+    totals = benchmark(write_and_report)
+    assert totals == pytest.approx(database.get_maintenance_totals_by_author())
@@ -0,0 +1,38 @@
+"""Listagem de veículos pela API HTTP: resposta completa contra 304"""
+import threading
+import urllib.request
+
+import pytest
+
+import api
+
+@pytest.fixture
+def api_url(fleet):
+    server = api.create_server(host="127.0.0.1", port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def _get(url, etag=None):
+    request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+    if etag:
+        request.add_header('If-None-Match', etag)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers['ETag'], len(response.read())
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        return e.code, e.headers['ETag'], 0
+
+def test_list_vehicles(benchmark, api_url):
+    status, _, size = benchmark(_get, f"{api_url}/vehicles?per_page=100")
+    benchmark.extra_info['gzip_bytes'] = size
+    assert status == 200
+
+def test_list_vehicles_not_modified(benchmark, api_url):
+    """Lista inalterada: só a leitura da versão dos dados"""
+    _, etag, _ = _get(f"{api_url}/vehicles?per_page=100")
+    status, _, size = benchmark(_get, f"{api_url}/vehicles?per_page=100", etag)
+    assert status == 304 and size == 0
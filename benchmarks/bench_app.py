@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+pytest.importorskip("streamlit")
+import app  # noqa: E402
+import database  # noqa: E402
+import jobs  # noqa: E402
+from cache_manager import clear_cache  # noqa: E402
+
+def _clear_all_caches():
+    clear_cache(keep_persistent=False)
+
+def test_export_vehicles_data(benchmark, fleet):
+    json_str = benchmark.pedantic(app.export_vehicles_data, setup=_clear_all_caches, rounds=3)
+    assert len(json.loads(json_str)['vehicles']) == fleet
+
+def test_import_vehicles(benchmark, fleet, tmp_path, monkeypatch):
+    """Importa um backup exportado (até 20 veículos) sobre um banco vazio"""
+    exported = json.loads(app.export_vehicles_data())['vehicles'][:20]
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    monkeypatch.chdir(empty)
+    database.init_db()
+
+    def setup():
+        return (json.loads(json.dumps(exported)),), {'replace': False}
+
+    imported, errors = benchmark.pedantic(jobs.import_vehicles, setup=setup, rounds=2)
+    assert imported == len(exported) and not errors
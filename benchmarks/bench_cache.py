@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import cache_manager
+import database
+from models import VEHICLE_COLUMNS, Vehicle
+
+@pytest.fixture
+def vehicles(fleet):
+    """Lista de veículos como `get_vehicles` devolve, lida direto do banco"""
+    conn = database.get_db()
+    conn.row_factory = Vehicle.row_factory(database.get_vehicle_image)
+    vehicles = conn.execute(f'SELECT {VEHICLE_COLUMNS} FROM vehicles').fetchall()
+    conn.close()
+    return vehicles
+
+@pytest.fixture
+def vehicles_payload(vehicles):
+    """Os mesmos veículos como dicts, no formato gravado no cache"""
+    return [vehicle.to_dict() for vehicle in vehicles]
+
+def test_save_to_cache(benchmark, vehicles_payload):
+    benchmark(cache_manager.save_to_cache, 'vehicles', vehicles_payload)
+
+def test_load_from_cache(benchmark, vehicles_payload):
+    cache_manager.save_to_cache('vehicles', vehicles_payload)
+    data = benchmark(cache_manager.load_from_cache, 'vehicles')
+    assert len(data) == len(vehicles_payload)
+
+def test_save_vehicles_to_cache(benchmark, vehicles):
+    """Cache + backup persistente, como acontece em toda escrita de veículo"""
+    benchmark(cache_manager.save_vehicles_to_cache, vehicles)
+
+def test_load_persistent_data(benchmark, vehicles_payload):
+    cache_manager.save_persistent_data({'vehicles': vehicles_payload})
+    data = benchmark(cache_manager.load_persistent_data)
+    assert len(data['vehicles']) == len(vehicles_payload)
+
+@pytest.fixture
+def fipe_budget(workdir, monkeypatch):
+    """Orçamento pequeno para o namespace FIPE, forçando a limpeza"""
+    budget = 2 * 1024 * 1024
+    monkeypatch.setitem(cache_manager.NAMESPACES, 'fipe', dict(cache_manager.NAMESPACES['fipe'], max_bytes=budget))
+    return budget
+
+def _fill_fipe_cache(count):
+    price = {'Valor': 'R$ 45.964,00', 'Marca': 'Fiat', 'Modelo': 'Uno Mille 1.0' * 20}
+    for i in range(count):
+        cache_manager.save_to_cache(f'fipe_price_1_{i}_2024-1', price)
+
+def test_fipe_cache_eviction(benchmark, fipe_budget):
+    """Gravações FIPE acima do orçamento: cada uma limpa só o próprio shard"""
+    cache_manager.save_persistent_data({'vehicles': []})
+    benchmark.pedantic(_fill_fipe_cache, args=(10000,), rounds=1)
+    stats = cache_manager.cache_stats()
+    benchmark.extra_info['fipe_entries'] = stats['fipe']['entries']
+    benchmark.extra_info['fipe_bytes'] = stats['fipe']['bytes']
+    assert stats['fipe']['bytes'] <= fipe_budget
+    assert stats['persistent']['entries'] == 1
+
+def test_cache_stats(benchmark, workdir):
+    _fill_fipe_cache(10000)
+    stats = benchmark(cache_manager.cache_stats)
+    assert stats['fipe']['entries'] == 10000
+
+def _locked_increments(key, counter, count):
+    """Lê, espera e grava um contador dentro do lock da chave"""
+    for _ in range(count):
+        with cache_manager.cache_lock(key):
+            with open(counter) as f:
+                value = int(f.read() or 0)
+            time.sleep(0.001)
+            with open(counter, 'w') as f:
+                f.write(str(value + 1))
+
+def _evict_lock_file(key, stop):
+    lock_path = os.path.join(cache_manager._shard_dir(key), f".{key}.lock")
+    while not stop.is_set():
+        cache_manager._remove_lock_file(lock_path)
+
+@pytest.mark.skipif(cache_manager.fcntl is None, reason="flock indisponível")
+def test_cache_lock_survives_eviction(workdir):
+    """Processos disputando uma chave enquanto a limpeza apaga o lock: nenhuma atualização se perde"""
+    key, counter, workers, count = 'fipe_brands', str(workdir / "counter"), 4, 50
+    open(counter, 'w').close()
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    evictor = context.Process(target=_evict_lock_file, args=(key, stop))
+    evictor.start()
+    processes = [context.Process(target=_locked_increments, args=(key, counter, count)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    stop.set()
+    evictor.join()
+    with open(counter) as f:
+        assert int(f.read()) == workers * count
+
+def _payload(writer, iteration):
+    # Uns 300 KB: a gravação leva várias chamadas de write, um leitor pegaria o meio
+    return {'writer': writer, 'iteration': iteration, 'items': [f"{writer}-{iteration}"] * 20000}
+
+def _write_entries(key, writer, count):
+    for iteration in range(count):
+        cache_manager.save_to_cache(key, _payload(writer, iteration))
+
+def _read_entries(key, stop, results):
+    reads, torn = 0, []
+    while not stop.is_set():
+        try:
+            data = cache_manager.read_cache_file(key)['data']
+            if data != _payload(data['writer'], data['iteration']):
+                torn.append(f"{data['writer']}-{data['iteration']} misturado")
+        except Exception as e:  # Arquivo pela metade não desserializa
+            torn.append(f"{type(e).__name__}: {e}")
+        reads += 1
+    results.put((reads, torn[:5]))
+
+def test_atomic_write_readers_never_see_torn_files(workdir):
+    """Processos gravando a mesma chave enquanto outros a leem: só versões inteiras aparecem"""
+    key, writers, readers, count = 'vehicles_all', 3, 3, 40
+    cache_manager.save_to_cache(key, _payload(-1, 0))
+    context = multiprocessing.get_context('spawn')
+    stop, results = context.Event(), context.Queue()
+    reading = [context.Process(target=_read_entries, args=(key, stop, results)) for _ in range(readers)]
+    writing = [context.Process(target=_write_entries, args=(key, writer, count)) for writer in range(writers)]
+    for process in reading + writing:
+        process.start()
+    for process in writing:
+        process.join()
+    stop.set()
+    reports = [results.get(timeout=60) for _ in reading]
+    for process in reading:
+        process.join()
+    assert all(reads > 0 for reads, _ in reports)
+    assert [error for _, torn in reports for error in torn] == []
+    assert cache_manager.read_cache_file(key)['data']['iteration'] == count - 1
+    # Nenhum temporário ficou para trás
+    directory = os.path.dirname(cache_manager.get_cache_path(key))
+    assert [name for name in os.listdir(directory) if name.endswith('.tmp')] == []
@@ -0,0 +1,255 @@
+import multiprocessing
+import random
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from cache_manager import clear_cache, load_vehicles_from_cache
+from fleet import generate_maintenance, generate_vehicle, make_image_pool
+
+@pytest.fixture
+def rng():
+    return random.Random(1234)
+
+@pytest.fixture
+def image_pool(rng):
+    return make_image_pool(rng, count=4)
+
+def _clear_all_caches():
+    """Apaga também o backup persistente, para que a leitura vá ao SQLite"""
+    clear_cache(keep_persistent=False)
+
+def _vehicle_ids():
+    conn = database.get_db()
+    ids = [row[0] for row in conn.execute('SELECT id FROM vehicles ORDER BY id')]
+    conn.close()
+    return ids
+
+def _maintenance_rows(limit):
+    conn = database.get_db()
+    rows = conn.execute(
+        'SELECT id, vehicle_id FROM maintenance ORDER BY id LIMIT ?', (limit,)
+    ).fetchall()
+    conn.close()
+    return rows
+
+def test_get_vehicles_cold(benchmark, fleet):
+    """Cache vazio: leitura completa do SQLite e gravação do cache"""
+    vehicles = benchmark.pedantic(database.get_vehicles, setup=_clear_all_caches, rounds=5)
+    assert len(vehicles) == fleet
+
+def test_get_vehicles_warm(benchmark, fleet):
+    """Cache preenchido: só a leitura do arquivo de veículos no cache"""
+    database.get_vehicles()
+    vehicles = benchmark(database.get_vehicles)
+    assert len(vehicles) == fleet
+
+def test_add_vehicle(benchmark, fleet, rng, image_pool):
+    database.get_vehicles()
+
+    def setup():
+        return (generate_vehicle(rng, image_pool),), {}
+
+    benchmark.pedantic(database.add_vehicle, setup=setup, rounds=5)
+
+def test_add_maintenance(benchmark, fleet, rng):
+    database.get_vehicles()
+    vehicle_ids = _vehicle_ids()
+
+    def setup():
+        record = generate_maintenance(rng, max_records=1)[:1] or [{
+            'date': '2024-01-01', 'description': 'Revisão', 'cost': 100.0,
+            'mileage': 1000, 'author': 'Antonio'}]
+        return (dict(record[0], vehicle_id=rng.choice(vehicle_ids)),), {}
+
+    benchmark.pedantic(database.add_maintenance, setup=setup, rounds=5)
+
+def test_update_maintenance(benchmark, fleet, rng):
+    database.get_vehicles()
+    rows = iter(_maintenance_rows(100))
+
+    def setup():
+        maintenance_id, vehicle_id = next(rows)
+        return (maintenance_id, {
+            'vehicle_id': vehicle_id,
+            'date': '2024-06-01',
+            'description': 'Revisão atualizada',
+            'cost': round(rng.uniform(80, 4500), 2),
+            'mileage': rng.randint(1000, 200000),
+            'author': 'Fernando',
+        }), {}
+
+    benchmark.pedantic(database.update_maintenance, setup=setup, rounds=5)
+
+def test_delete_vehicle(benchmark, fleet):
+    database.get_vehicles()
+    vehicle_ids = iter(_vehicle_ids())
+
+    def setup():
+        return (next(vehicle_ids),), {}
+
+    benchmark.pedantic(database.delete_vehicle, setup=setup, rounds=5)
+
+def test_reclaim_free_pages(benchmark, fleet):
+    """Metade da frota excluída: o arquivo encolhe sem um VACUUM completo"""
+    ids = _vehicle_ids()
+
+    for vehicle_id in ids[::2]:
+        database.delete_vehicle(vehicle_id)
+    before = database.get_storage_report(include_objects=False)
+    assert before['auto_vacuum'] == 'incremental' and before['free_pages'] > 0
+    reclaimed = benchmark.pedantic(database.reclaim_free_pages, rounds=1)
+    after = database.get_storage_report()
+    assert reclaimed['pages'] == before['free_pages']
+    assert after['free_pages'] == 0 and after['file_bytes'] < before['file_bytes']
+    assert {'vehicles', 'maintenance'} <= {item['name'] for item in after['objects']}
+
+def test_due_maintenance_superseded_only_by_scheduled(workdir):
+    """Uma lavagem sem próxima data não esconde a troca de óleo agendada; uma nova revisão agendada sim"""
+    from datetime import date
+
+    database.init_db()
+    vehicle_id = database.add_vehicle(generate_vehicle(random.Random(1)))
+    base = {'vehicle_id': vehicle_id, 'cost': 100.0, 'mileage': 1000, 'author': 'Antonio'}
+    database.add_maintenance(dict(base, date='2026-09-01', description='Troca de óleo',
+                                  next_maintenance_date='2026-10-20'))
+    database.add_maintenance(dict(base, date='2026-09-15', description='Lavagem'))
+    today = date(2026, 10, 19)
+    assert [row['description'] for row in database.get_due_maintenance(today=today)] == ['Troca de óleo']
+    assert database.refresh_due_maintenance(today=today) == 1
+
+    database.add_maintenance(dict(base, date='2026-10-01', description='Revisão',
+                                  next_maintenance_date='2027-04-01'))
+    assert database.get_due_maintenance(today=today) == []
+
+def test_update_deleted_vehicle_is_noop(workdir):
+    """Editar um veículo já excluído por outra sessão não gera erro nem recria a linha"""
+    database.init_db()
+    vehicle = generate_vehicle(random.Random(1))
+    vehicle_id = database.add_vehicle(vehicle)
+    database.delete_vehicle(vehicle_id)
+
+    database.update_vehicle(vehicle_id, vehicle)
+    assert database.get_vehicle(vehicle_id) is None and database.get_vehicles() == []
+
+def test_update_maintenance_of_deleted_vehicle_is_noop(workdir):
+    """Editar uma manutenção cujo veículo outra sessão excluiu não gera erro"""
+    database.init_db()
+    vehicle_id = database.add_vehicle(generate_vehicle(random.Random(1)))
+    database.add_maintenance({'vehicle_id': vehicle_id, 'date': '2026-09-01', 'description': 'Revisão',
+                              'cost': 100.0, 'mileage': 1000, 'author': 'Antonio'})
+    maintenance_id = _maintenance_rows(1)[0][0]
+    database.delete_vehicle(vehicle_id)
+
+    database.update_maintenance(maintenance_id, {'vehicle_id': vehicle_id, 'date': '2026-09-02',
+                                                 'description': 'Revisão', 'cost': 120.0})
+    assert _maintenance_rows(1) == [] and database.get_vehicles() == []
+
+def test_writer_group_commit_isolates_failures(tmp_path):
+    """Escritas simultâneas saem num só commit; a que falha não desfaz as outras"""
+    from db_writer import DatabaseWriter
+
+    path = str(tmp_path / "writer.db")
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (value INTEGER NOT NULL UNIQUE)')
+    conn.close()
+    writer = DatabaseWriter(path)
+    running, release = threading.Event(), threading.Event()
+
+    def block(c):
+        running.set()
+        return release.wait(10)
+
+    # Segura a thread de escrita para que as demais se acumulem na fila
+    blocker = writer.submit(block)
+    assert running.wait(10)
+
+    def insert(c, value):
+        c.execute('INSERT INTO items (value) VALUES (?)', (value,))
+        c.execute('INSERT INTO items (value) VALUES (?)', (value if value == 3 else -value,))  # 3 repete o valor
+
+    futures = {}
+    threads = [threading.Thread(target=lambda value=value: futures.__setitem__(value, writer.submit(insert, value)))
+               for value in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    assert blocker.result(10)
+    for value, future in futures.items():
+        if value == 3:
+            with pytest.raises(sqlite3.IntegrityError):
+                future.result(10)
+        else:
+            future.result(10)
+
+    stats = writer.stats()
+    assert stats['commits'] == 2 and stats['max_batch_size'] == 8  # O bloqueio e depois um grupo só
+    assert stats['failed_operations'] == 1
+    conn = sqlite3.connect(path)
+    values = {row[0] for row in conn.execute('SELECT value FROM items')}
+    conn.close()
+    # A primeira linha da operação que falhou foi desfeita junto com ela
+    assert values == {sign * value for value in range(1, 9) if value != 3 for sign in (1, -1)}
+
+def _external_update(path, vehicle_id, color):
+    """Escrita direta no arquivo, sem passar por database.py (outro processo ou ferramenta)"""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute('UPDATE vehicles SET color = ? WHERE id = ?', (color, vehicle_id))
+    conn.close()
+
+def _colors():
+    return {vehicle.id: vehicle.color for vehicle in database.get_vehicles()}
+
+def test_external_write_invalidates_vehicles_cache(workdir):
+    """O cache dos veículos vale só para a versão dos dados: escritas de fora também o invalidam"""
+    database.init_db()
+    rng = random.Random(1)
+    first, second = (database.add_vehicle(generate_vehicle(rng)) for _ in range(2))
+    _colors()
+    assert load_vehicles_from_cache(database.get_data_version()) is not None
+
+    _external_update(database.get_db_path(), first, 'Roxo')
+    assert load_vehicles_from_cache(database.get_data_version()) is None
+    assert _colors()[first] == 'Roxo'
+
+    process = multiprocessing.get_context('spawn').Process(
+        target=_external_update, args=(database.get_db_path(), second, 'Laranja'))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert _colors() == {first: 'Roxo', second: 'Laranja'}
+
+def test_add_maintenance_to_deleted_vehicle_fails(workdir):
+    """Registrar manutenção num veículo que outra sessão excluiu falha sem deixar linha órfã"""
+    database.init_db()
+    vehicle_id = database.add_vehicle(generate_vehicle(random.Random(1)))
+    database.delete_vehicle(vehicle_id)
+    sequence = database.get_change_sequence()
+
+    with pytest.raises(Exception, match="não encontrado"):
+        database.add_maintenance({'vehicle_id': vehicle_id, 'date': '2026-09-01', 'description': 'Revisão',
+                                  'cost': 100.0, 'mileage': 1000, 'author': 'Antonio'})
+    assert _maintenance_rows(1) == [] and database.get_change_sequence() == sequence
+
+def test_failed_daily_task_runs_again(workdir):
+    """Uma tarefa diária que falhou não fica marcada como executada no dia"""
+    from datetime import date
+    from scheduler import run_if_due
+
+    database.init_db()
+    today = date(2026, 10, 19)
+
+    def fail():
+        raise RuntimeError("banco indisponível")
+
+    with pytest.raises(RuntimeError):
+        run_if_due('due_maintenance', fail, today=today)
+    ran = []
+    assert run_if_due('due_maintenance', lambda: ran.append(True), today=today)
+    assert not run_if_due('due_maintenance', lambda: ran.append(True), today=today)
+    assert ran == [True]
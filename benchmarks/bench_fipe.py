@@ -0,0 +1,137 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from cache_manager import cached_fetch, clear_cache, clear_failures, read_cache_file, write_cache_file
+from fipe_stub import FipeStubServer
+
+STUB_LATENCY = 0.2  # Segundos por resposta: as buscas simultâneas se sobrepõem
+
+@pytest.fixture
+def slow_fipe(workdir, monkeypatch):
+    """fipe_api contra um stub próprio e lento, com o circuito fechado e sem falhas guardadas
+
+    Retorna (fipe_api, stub).
+    """
+    fipe_api = pytest.importorskip("fipe_api")
+    stub = FipeStubServer(latency=STUB_LATENCY).start()
+    monkeypatch.setattr(fipe_api, "BASE_URL", stub.base_url)
+    fipe_api.breaker.reset()
+    clear_failures()
+    yield fipe_api, stub
+    fipe_api.breaker.reset()
+    stub.stop()
+
+def _lookup(fipe):
+    brands = fipe.get_fipe_brands()
+    brand_code = brands['codigo'].iloc[0]
+    models = fipe.get_fipe_models(brand_code)
+    model_code = models['codigo'].iloc[0]
+    years = fipe.get_fipe_years(brand_code, model_code)
+    return fipe.get_fipe_price(brand_code, model_code, years['codigo'].iloc[0])
+
+def test_fipe_lookup_cold(benchmark, fipe, workdir):
+    """Formulário de novo veículo com cache expirado: 4 requisições ao stub"""
+    price = benchmark.pedantic(_lookup, args=(fipe,), setup=clear_cache, rounds=10)
+    assert price['Valor'].startswith('R$')
+
+def test_fipe_lookup_warm(benchmark, fipe, workdir):
+    _lookup(fipe)
+    price = benchmark(_lookup, fipe)
+    assert price['Valor'].startswith('R$')
+
+def _concurrently(count, func):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        results[i] = func()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_cold_lookups_share_one_request(slow_fipe):
+    fipe, stub = slow_fipe
+    frames = _concurrently(8, fipe.get_fipe_brands)
+    assert stub.request_count == 1
+    assert all(frame.equals(frames[0]) for frame in frames)
+
+def test_stale_entry_served_while_revalidating(slow_fipe):
+    fipe, stub = slow_fipe
+    fresh = fipe.get_fipe_brands()
+    # Entrada expirada (dentro de FIPE_STALE_DURATION) com uma marca que a API não tem mais
+    entry = read_cache_file('fipe_brands')
+    entry['data'] = entry['data'] + [{'codigo': '999', 'nome': 'Antiga'}]
+    entry['expires'] = (datetime.now() - timedelta(hours=1)).isoformat()
+    write_cache_file('fipe_brands', entry)
+
+    stale = fipe.get_fipe_brands()
+    assert stale.attrs['stale'] and 'Antiga' in set(stale['nome'])
+    assert stub.request_count == 1  # Devolvida sem esperar a API
+    revalidations = [thread for thread in threading.enumerate() if thread.name == 'revalidate-fipe_brands']
+    for thread in revalidations:
+        thread.join(10)
+    assert stub.request_count == 2
+    current = fipe.get_fipe_brands()
+    assert not current.attrs['stale'] and current.equals(fresh)
+
+BREAKER_RESET = 0.3
+
+@pytest.fixture
+def breaker(slow_fipe, monkeypatch):
+    """Circuito com espera curta no lugar do global; retorna (fipe_api, stub, circuito)"""
+    fipe, stub = slow_fipe
+    circuit = fipe.CircuitBreaker(failure_threshold=3, reset_timeout=BREAKER_RESET)
+    monkeypatch.setattr(fipe, "breaker", circuit)
+    return fipe, stub, circuit
+
+def _fail_times(fipe, count, error=Exception):
+    for _ in range(count):
+        with pytest.raises(error):
+            fipe._get_json("/marcas")
+
+def test_circuit_breaker_opens_probes_and_closes(breaker):
+    fipe, stub, circuit = breaker
+    stub.fail = True
+    _fail_times(fipe, 3)
+    assert circuit.state() == circuit.OPEN and stub.request_count == 3
+    _fail_times(fipe, 1, fipe.CircuitOpenError)  # Aberto: nem chega à API
+    assert stub.request_count == 3
+
+    time.sleep(BREAKER_RESET)
+    assert circuit.state() == circuit.HALF_OPEN
+    _fail_times(fipe, 1)  # O teste falha e o circuito volta a abrir
+    assert circuit.state() == circuit.OPEN and stub.request_count == 4
+
+    time.sleep(BREAKER_RESET)
+    stub.fail = False
+    assert fipe._get_json("/marcas")
+    assert circuit.state() == circuit.CLOSED and stub.request_count == 5
+
+def test_circuit_breaker_counts_timeouts(breaker, monkeypatch):
+    fipe, stub, circuit = breaker
+    monkeypatch.setattr(fipe, "REQUEST_TIMEOUT", STUB_LATENCY / 4)
+    _fail_times(fipe, 3)
+    assert circuit.state() == circuit.OPEN
+    _fail_times(fipe, 1, fipe.CircuitOpenError)
+
+def test_negative_cache_expires(breaker):
+    fipe, stub, circuit = breaker
+    fetch = lambda: fipe._get_json("/marcas")  # noqa: E731
+    stub.fail = True
+    for _ in range(2):  # A segunda falha vem do cache negativo, sem requisição
+        with pytest.raises(Exception):
+            cached_fetch('fipe_brands', fetch, negative_ttl=BREAKER_RESET)
+    assert stub.request_count == 1 and circuit.state() == circuit.CLOSED
+
+    time.sleep(BREAKER_RESET)
+    stub.fail = False
+    assert cached_fetch('fipe_brands', fetch, negative_ttl=BREAKER_RESET)
+    assert stub.request_count == 2
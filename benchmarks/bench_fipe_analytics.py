@@ -0,0 +1,19 @@
+"""Depreciação e projeção de revenda a partir do histórico FIPE (fipe_analytics.py)"""
+import random
+
+import database
+from fipe_analytics import fleet_projection
+from fleet import generate_vehicle
+
+def test_fleet_projection_without_price_history(workdir):
+    """Banco atualizado sem códigos FIPE nem histórico: projeta do fipe_price atual, sem depreciação"""
+    database.init_db()
+    rng = random.Random(5)
+    for _ in range(3):
+        database.add_vehicle(dict(generate_vehicle(rng), fipe_code=None))
+    vehicles = database.get_vehicles()
+
+    projection = fleet_projection(vehicles, today='2026-10-19')
+    assert list(projection['id']) == [vehicle.id for vehicle in vehicles]
+    assert list(projection['projected_value']) == [vehicle.fipe_price for vehicle in vehicles]
+    assert projection['last_value'].isna().all()
@@ -0,0 +1,68 @@
+"""Índice de trigramas nome → código FIPE (fipe_index.py)"""
+import random
+
+import pytest
+
+import database
+from fleet import BRANDS
+from fipe_index import TrigramIndex, FipeCatalog, backfill_fipe_codes
+
+VERSIONS = ["", "Flex", "Mi Total Flex 8V", "16V Aut.", "Turbo 4p", "CD 4x4 Diesel", "Sport", "Attractive"]
+
+def make_catalog(size, seed=3):
+    """Lista de (código, nome) no formato dos modelos FIPE"""
+    rng = random.Random(seed)
+    models = [model for brand in BRANDS.values() for model in brand]
+    return [
+        (str(code), f"{rng.choice(models)} {rng.choice(VERSIONS)} {rng.randint(2, 5)}p {code}".replace("  ", " "))
+        for code in range(size)
+    ]
+
+def misspell(rng, name):
+    """Variações vistas nos nomes gravados: caixa, sufixo " (1)" e um caractere a menos"""
+    variant = rng.randrange(3)
+    if variant == 0:
+        return name.upper()
+    if variant == 1:
+        return f"{name} (1)"
+    position = rng.randrange(len(name))
+    return name[:position] + name[position + 1:]
+
+@pytest.mark.parametrize("size", [500, 5000])
+def test_fuzzy_lookup(benchmark, size):
+    catalog = make_catalog(size)
+    index = TrigramIndex(catalog)
+    rng = random.Random(5)
+    queries = [(code, misspell(rng, name)) for code, name in rng.sample(catalog, 200)]
+
+    def lookups():
+        return [index.lookup(database.split_model_suffix(query)[0]) for _, query in queries]
+
+    found = benchmark(lookups)
+    accuracy = sum(code == match for (code, _), match in zip(queries, found)) / len(queries)
+    benchmark.extra_info['accuracy'] = accuracy
+    if benchmark.stats:  # Sem estatísticas com --benchmark-disable
+        benchmark.extra_info['lookups_per_second'] = len(queries) / benchmark.stats['mean']
+    assert accuracy > 0.95
+
+def test_build_index(benchmark):
+    catalog = make_catalog(5000)
+    index = benchmark(TrigramIndex, catalog)
+    assert len(index) == 5000
+
+def test_backfill_fipe_codes(benchmark, fleet, fipe, monkeypatch):
+    monkeypatch.setattr("fipe_index.catalog", FipeCatalog())
+
+    def clear_codes():
+        conn = database.get_db()
+        conn.execute('UPDATE vehicles SET fipe_brand_code = NULL, fipe_model_code = NULL, fipe_year_code = NULL')
+        conn.commit()
+        conn.close()
+
+    counts = benchmark.pedantic(backfill_fipe_codes, setup=clear_codes, rounds=2)
+    vehicles = database.get_vehicles()
+    # O stub só tem anos de 2010 em diante; os demais não são encontrados
+    expected = sum(int(v.year[:4]) >= 2010 for v in vehicles)
+    assert counts == {'updated': expected, 'not_found': len(vehicles) - expected}
+    assert all(v.fipe_year_code == v.year[:4] + '-' + str(1 + ["Gasolina", "Flex", "Diesel"].index(v.year[5:]))
+               for v in vehicles if v.fipe_year_code)
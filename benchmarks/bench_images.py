@@ -0,0 +1,95 @@
+"""Recompressão das fotos gravadas sem `save_image` (reencode_images.py)"""
+import base64
+import os
+import random
+from io import BytesIO
+
+import pytest
+
+import database
+import reencode_images
+from fleet import generate_vehicle
+from vehicle_manager import save_image
+
+PHOTOS = int(os.environ.get("BENCH_PHOTOS", "96"))
+REENCODED = sum(i % 4 < 2 for i in range(PHOTOS))  # O PNG e a foto de câmera de cada grupo de 4 tipos
+
+def make_photo(rng, size, format, orientation=None):
+    """Foto com ruído (não comprime como uma imagem lisa), no formato enviado pelo usuário"""
+    from PIL import Image
+
+    width, height = size
+    image = Image.frombytes('RGB', (width // 8, height // 8), rng.randbytes(width // 8 * height // 8 * 3))
+    image = image.resize(size, Image.BILINEAR)
+    buffer = BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[reencode_images.EXIF_ORIENTATION] = orientation
+        image.save(buffer, format=format, exif=exif, quality=95)
+    else:
+        image.save(buffer, format=format)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+@pytest.fixture(scope="session")
+def photo_pool():
+    rng = random.Random(7)
+    return {
+        'png': make_photo(rng, (1600, 1200), "PNG"),
+        'camera': make_photo(rng, (3000, 2000), "JPEG", orientation=6),
+        'saved': save_image(BytesIO(base64.b64decode(make_photo(rng, (1600, 1200), "PNG")))),
+        'broken': base64.b64encode(rng.randbytes(20 * 1024)).decode(),
+    }
+
+@pytest.fixture
+def photo_db(workdir, photo_pool):
+    """Banco com PHOTOS veículos, alternando os tipos de foto"""
+    database.init_db()
+    rng = random.Random(11)
+    kinds = list(photo_pool)
+    for i in range(PHOTOS):
+        vehicle = generate_vehicle(rng)
+        vehicle['image_data'] = photo_pool[kinds[i % len(kinds)]]
+        database.add_vehicle(vehicle)
+    return workdir
+
+def _images():
+    conn = database.get_db()
+    rows = dict(conn.execute('SELECT id, image_data FROM vehicles'))
+    conn.close()
+    return rows
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_reencode_images(benchmark, photo_db, photo_pool, workers):
+    from PIL import Image
+
+    before = os.path.getsize("vehicles.db")
+    totals = benchmark.pedantic(reencode_images.reencode_images, args=(workers,), rounds=1)
+    quarter = PHOTOS // 4
+    assert totals['reencoded'] == 2 * quarter
+    assert totals['skipped'] == quarter and totals['failed'] == quarter
+    assert totals['bytes_saved'] > 0 and os.path.getsize("vehicles.db") < before
+    benchmark.extra_info['mb_saved'] = totals['bytes_saved'] / 1024 / 1024
+    sizes = set()
+    for image_data in _images().values():
+        if image_data in (photo_pool['saved'], photo_pool['broken']):
+            continue
+        image = Image.open(BytesIO(base64.b64decode(image_data)))
+        assert image.format == 'JPEG'
+        sizes.add(image.size)
+    # O PNG 1600x1200 reduzido; a foto de câmera 3000x2000 com orientação 6 gravada já em pé
+    assert sizes == {(800, 600), (533, 800)}
+
+def test_reencode_resumes(photo_db, monkeypatch):
+    """Interrompida após o primeiro lote, a execução seguinte continua dali"""
+    batch_size = max(1, PHOTOS // 4)
+    monkeypatch.setattr(reencode_images, "REENCODE_BATCH_SIZE", batch_size)
+
+    def interrupt(done, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        reencode_images.reencode_images(workers=1, progress=interrupt)
+    assert reencode_images.load_progress()['totals']['processed'] == batch_size
+    totals = reencode_images.reencode_images(workers=1)
+    assert totals['processed'] == PHOTOS and totals['reencoded'] == REENCODED
+    assert reencode_images.load_progress() is None
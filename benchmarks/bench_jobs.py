@@ -0,0 +1,108 @@
+"""Fila de tarefas (jobs.py): ciclo de vida, tarefas interrompidas e reserva entre garagens"""
+import multiprocessing
+import os
+import random
+
+import pytest
+
+import database
+import jobs
+from fleet import generate_vehicle
+from tenants import DEFAULT_TENANT, create_tenant, get_current_tenant, tenant_context
+
+@pytest.fixture
+def job_db(workdir):
+    database.init_db()
+    rng = random.Random(3)
+    for _ in range(5):
+        database.add_vehicle(generate_vehicle(rng))
+    return workdir
+
+def test_job_lifecycle(job_db):
+    """Enfileirada, reservada, executada e concluída no próprio processo"""
+    job_id = database.enqueue_job('export_vehicles')
+    assert database.get_job(job_id)['status'] == 'queued'
+
+    job = database.claim_job(os.getpid())
+    assert job['id'] == job_id and job['status'] == 'running' and job['worker_pid'] == os.getpid()
+    assert database.claim_job(os.getpid()) is None  # Nada mais na fila
+
+    jobs.run_job(job)
+    job = database.get_job(job_id)
+    assert job['status'] == 'done' and job['progress'] == 1 and job['error'] is None
+    assert job['result']['vehicles'] == 5 and os.path.exists(job['result']['path'])
+
+def test_unknown_job_kind_fails(job_db):
+    job_id = database.enqueue_job('nao_existe')
+    jobs.run_job(database.claim_job(os.getpid()))
+    job = database.get_job(job_id)
+    assert job['status'] == 'failed' and 'desconhecido' in job['error']
+
+def test_dead_worker_job_marked_failed(job_db):
+    """A tarefa do processo que morreu vira falha; a de um processo vivo continua"""
+    process = multiprocessing.get_context('spawn').Process(target=os.getpid)
+    process.start()
+    process.join()
+    dead_id = database.enqueue_job('backup')
+    alive_id = database.enqueue_job('backup')
+    database.claim_job(process.pid)
+    database.claim_job(os.getpid())
+
+    assert jobs.fail_interrupted_jobs() == 1
+    dead, alive = database.get_job(dead_id), database.get_job(alive_id)
+    assert dead['status'] == 'failed' and 'Interrompida' in dead['error']
+    assert alive['status'] == 'running'
+
+class _Stop(Exception):
+    pass
+
+def test_worker_claims_one_job_per_tenant(workdir, monkeypatch):
+    """Uma fila longa numa garagem não atrasa a outra: as reservas se alternam"""
+    create_tenant("filial-a")
+    database.init_tenants()
+    for tenant, count in ((DEFAULT_TENANT, 4), ("filial-a", 2)):
+        with tenant_context(tenant):
+            for _ in range(count):
+                database.enqueue_job('backup')
+    ran = []
+
+    def record(job):
+        ran.append(get_current_tenant())
+        database.finish_job(job['id'])
+        if len(ran) == 6:
+            raise _Stop
+
+    monkeypatch.setattr(jobs, "run_job", record)
+    monkeypatch.setattr(jobs, "POLL_INTERVAL", 0)
+    with pytest.raises(_Stop):
+        jobs.worker_loop()
+    assert ran == [DEFAULT_TENANT, "filial-a"] * 2 + [DEFAULT_TENANT] * 2
+
+def test_job_progress_throttled(monkeypatch):
+    """Progresso chamado a cada item grava só o primeiro e o final dentro do intervalo"""
+    written = []
+    monkeypatch.setattr(jobs, "update_job_progress", lambda *args: written.append(args))
+    monkeypatch.setattr(jobs, "PROGRESS_INTERVAL", 60)
+    progress = jobs.JobProgress(7)
+    for done in range(1, 101):
+        progress(done, 100)
+    assert written == [(7, 0.01, '1/100'), (7, 1.0, '100/100')]
+
+def test_refresh_fipe_prices_survives_lookup_errors(job_db, monkeypatch):
+    """Um veículo com a API fora (circuito aberto) não impede a atualização dos demais"""
+    fipe_api = pytest.importorskip("fipe_api")
+    vehicles = database.get_vehicles()
+    broken = vehicles[1].id
+
+    def fake_price(brand_code, model_code, year_code):
+        if model_code == broken:
+            raise fipe_api.CircuitOpenError("API FIPE indisponível")
+        return {'Valor': 'R$ 12.345,00', 'CodigoFipe': f'{model_code:06d}-1'}
+
+    monkeypatch.setattr("fipe_index.vehicle_fipe_codes", lambda vehicle: ('1', vehicle.id, '2020-1'))
+    monkeypatch.setattr(fipe_api, "get_fipe_price", fake_price)
+    counts = jobs.refresh_fipe_prices()
+    assert counts['failed'] == 1 and counts['updated'] == len(vehicles) - 1
+    prices = {vehicle.id: vehicle.fipe_price for vehicle in database.get_vehicles()}
+    assert prices.pop(broken) == vehicles[1].fipe_price
+    assert set(prices.values()) == {12345.0}
@@ -0,0 +1,21 @@
+"""Sessões simultâneas do app pelo AppTest (ver load_harness.py)"""
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+from load_harness import run_load  # noqa: E402
+
+SESSIONS = int(os.environ.get("BENCH_SESSIONS", "4"))
+
+def test_concurrent_sessions(benchmark, workdir):
+    report = benchmark.pedantic(run_load, kwargs={'sessions': SESSIONS, 'iterations': 1}, rounds=1)
+    benchmark.extra_info.update({
+        'p50_ms': report['latency']['p50_ms'],
+        'p90_ms': report['latency']['p90_ms'],
+        'p99_ms': report['latency']['p99_ms'],
+        'session_mb': max(memory['growth'] for memory in report['memory_mb']),
+        'lock_errors': report['lock_errors'],
+    })
+    assert report['errors'] == 0, report['error_samples']
+    assert report['added'] == report['expected']
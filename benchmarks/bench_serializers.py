@@ -0,0 +1,47 @@
+import pytest
+
+import cache_manager
+import database
+from models import VEHICLE_COLUMNS, Vehicle
+
+CODECS = [
+    ('json', '', False),
+    ('json', '', True),
+    ('msgpack', '', True),
+    ('msgpack', 'zstd', True),
+    ('msgpack', 'lz4', True),
+    ('json', 'zstd', True),
+]
+
+@pytest.fixture(params=CODECS, ids=lambda c: f"{'orjson' if c[2] and c[0] == 'json' else c[0]}{'+' + c[1] if c[1] else ''}")
+def codec(request, monkeypatch):
+    fmt, compression, fast_json = request.param
+    if not fast_json:
+        monkeypatch.setattr(cache_manager, 'orjson', None)
+    elif fmt == 'json' and cache_manager.orjson is None:
+        pytest.skip("orjson não instalado")
+    if fmt == 'msgpack' and cache_manager.msgpack is None:
+        pytest.skip("msgpack não instalado")
+    if compression == 'zstd' and cache_manager.zstandard is None:
+        pytest.skip("zstandard não instalado")
+    if compression == 'lz4' and cache_manager.lz4_frame is None:
+        pytest.skip("lz4 não instalado")
+    return fmt, compression
+
+@pytest.fixture
+def vehicles_entry(fleet):
+    """Entrada do cache 'vehicles' como save_to_cache grava"""
+    conn = database.get_db()
+    conn.row_factory = Vehicle.row_factory()
+    vehicles = [vehicle.to_dict() for vehicle in conn.execute(f'SELECT {VEHICLE_COLUMNS} FROM vehicles')]
+    conn.close()
+    return {'timestamp': '2025-01-01T00:00:00', 'data': vehicles}
+
+def test_serialize(benchmark, codec, vehicles_entry):
+    payload = benchmark(cache_manager.serialize, vehicles_entry, *codec)
+    benchmark.extra_info['bytes'] = len(payload)
+
+def test_deserialize(benchmark, codec, vehicles_entry):
+    payload = cache_manager.serialize(vehicles_entry, *codec)
+    data = benchmark(cache_manager.deserialize, payload)
+    assert len(data['data']) == len(vehicles_entry['data'])
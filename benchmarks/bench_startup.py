@@ -0,0 +1,50 @@
+"""Tempo de importação do app medido com `python -X importtime`
+
+Cada rodada é um interpretador novo, então o número inclui o carregamento
+real dos módulos (cold start), não o cache de `sys.modules`.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Orçamento do `import app`; pandas, PIL e requests ficam fora dele
+IMPORT_BUDGET_MS = float(os.environ.get("BENCH_IMPORT_BUDGET_MS", "1500"))
+LAZY_MODULES = ('pandas', 'numpy', 'PIL', 'requests')
+
+def _python(code, *flags):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code],
+        capture_output=True, text=True, env=env, check=True
+    )
+
+def parse_importtime(stderr):
+    """Retorna {módulo: tempo cumulativo em ms} a partir da saída do -X importtime"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+def import_app():
+    return parse_importtime(_python("import app", "-X", "importtime").stderr)
+
+def test_import_app(benchmark, workdir):
+    times = benchmark.pedantic(import_app, rounds=5)
+    slowest = sorted(
+        ((name, ms) for name, ms in times.items() if '.' not in name),
+        key=lambda item: item[1], reverse=True
+    )[:10]
+    benchmark.extra_info['import_app_ms'] = times['app']
+    benchmark.extra_info['slowest_modules'] = dict(slowest)
+    assert times['app'] < IMPORT_BUDGET_MS
+
+def test_import_app_skips_heavy_modules(workdir):
+    loaded = _python(
+        "import sys, app; print(' '.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+    ).stdout.split()
+    assert loaded == []
@@ -0,0 +1,66 @@
+"""Sincronização de clientes offline (ver sync_harness.py)"""
+import pytest
+
+import database
+from offline_client import OfflineClient, LocalTransport
+from sync_harness import simulate
+
+@pytest.mark.parametrize("http", [False, True], ids=["local", "http"])
+def test_simulated_clients_converge(benchmark, workdir, http):
+    stats = benchmark.pedantic(simulate, kwargs={'clients': 3, 'rounds': 20, 'http': http}, rounds=1)
+    benchmark.extra_info.update(stats)
+    assert stats['converged'] and stats['pending'] == 0
+
+def test_initial_sync(benchmark, fleet, tmp_path):
+    """Primeira sincronização de uma réplica vazia: frota e manutenções completas"""
+    def setup():
+        path = tmp_path / "replica.db"
+        if path.exists():
+            path.unlink()
+        return (OfflineClient(str(path), LocalTransport()),), {}
+
+    def sync(client):
+        result = client.sync()
+        client.close()
+        return result
+
+    result = benchmark.pedantic(sync, setup=setup, rounds=2)
+    assert result['sequence'] == database.get_change_sequence()
+
+def _age_change_log(days):
+    """Recua o horário de todo o log, como se as alterações tivessem `days` dias"""
+    conn = database.get_db()
+    with conn:
+        conn.execute("UPDATE change_log SET changed_at = datetime(changed_at, ?)", (f'-{days} days',))
+    conn.close()
+
+def test_pruned_change_log_resets_stale_replicas(fleet, tmp_path):
+    """Quem sincronizou antes da poda recebe a exportação completa e descarta o que foi excluído"""
+    from analytics import ColumnarCopy
+
+    client = OfflineClient(str(tmp_path / "replica.db"), LocalTransport())
+    client.sync()
+    copy = ColumnarCopy(database.get_db_path())
+    copy.refresh()
+    vehicle_id, kept_id = [vehicle.id for vehicle in database.get_vehicles()][:2]
+    database.delete_vehicle(vehicle_id)
+    _age_change_log(database.CHANGE_LOG_RETENTION_DAYS + 1)
+    database.add_maintenance({'vehicle_id': kept_id, 'date': '2026-10-19', 'description': 'Troca de óleo',
+                              'cost': 250.0, 'mileage': 50000})
+    before = database.get_change_sequence()
+
+    assert database.prune_change_log() > 0
+    assert database.get_change_sequence() == before  # A última linha fica
+    assert database.prune_change_log() == 0
+    changes = database.export_changes(client.last_seq, include_images=False)
+    assert changes['reset'] and vehicle_id not in changes['vehicles']['deletes']
+
+    client.sync()
+    assert vehicle_id not in [vehicle.id for vehicle in client.get_vehicles()]
+    assert len(client.get_vehicles()) == len(database.get_vehicles())
+    assert len(client.get_vehicle_maintenance(kept_id)) == len(database.get_vehicle_maintenance(kept_id))
+    copy.refresh()
+    assert copy.cursor().execute('SELECT COUNT(*) FROM vehicles').fetchone()[0] == len(database.get_vehicles())
+    # Em dia com o log: volta ao incremental
+    assert not database.export_changes(client.last_seq)['reset']
+    client.close()
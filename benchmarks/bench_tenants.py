@@ -0,0 +1,103 @@
+"""Várias garagens: relatório consolidado e isolamento de banco e cache"""
+import os
+import shutil
+
+import pytest
+
+import database
+from tenants import DEFAULT_TENANT, TENANTS_DIR, create_tenant, tenant_context
+
+TENANT_COUNT = int(os.environ.get("BENCH_TENANTS", "12"))
+
+@pytest.fixture(params=[100, 10000], ids=lambda size: f"fleet{size}")
+def garages(request, fleet_template, workdir):
+    """Garagem principal e mais TENANT_COUNT - 1 garagens, cada uma com uma cópia da frota"""
+    shutil.copy2(fleet_template(request.param), "vehicles.db")
+    tenants = [DEFAULT_TENANT]
+    for i in range(1, TENANT_COUNT):
+        tenant = create_tenant(f"filial-{i:02d}", f"Filial {i}")
+        shutil.copy2(fleet_template(request.param), os.path.join(TENANTS_DIR, tenant, "vehicles.db"))
+        tenants.append(tenant)
+    return tenants
+
+@pytest.mark.parametrize("workers", [1, 4], ids=["sequential", "parallel"])
+def test_tenants_report(benchmark, garages, monkeypatch, workers):
+    monkeypatch.setattr(database, "REPORT_WORKERS", workers)
+    report = benchmark(database.get_tenants_report)
+    assert [row['tenant'] for row in report['tenants']] == garages
+
+    conn = database.get_db()
+    vehicles, invested = conn.execute('SELECT COUNT(*), SUM(purchase_price + additional_costs) FROM vehicles').fetchone()
+    conn.close()
+    assert report['totals']['vehicles'] == vehicles * len(garages)
+    assert report['totals']['invested'] == pytest.approx(invested * len(garages))
+    assert sum(row['vehicles'] for row in report['by_brand']) == report['totals']['vehicles']
+
+def test_tenant_isolation(workdir):
+    """Escritas em uma garagem não aparecem no banco nem no cache de outra"""
+    create_tenant("filial-a")
+    database.init_tenants()
+    with tenant_context("filial-a"):
+        database.add_vehicle({'brand': "Fiat", 'model': "Uno", 'year': "2010", 'color': "Branco",
+                              'purchase_price': 15000, 'additional_costs': 0, 'fipe_price': 18000})
+        assert len(database.get_vehicles()) == 1
+        assert database.create_backup().startswith(os.path.join(TENANTS_DIR, "filial-a"))
+    assert database.get_vehicles() == []
+    assert os.path.isdir(os.path.join("cache", "tenants", "filial-a", "vehicles"))
+
+def _card_script():
+    """Cartão do veículo 1 rodando como num rerun de fragmento: sem a garagem ativa definida"""
+    import streamlit as st
+    import app
+    from tenants import DEFAULT_TENANT, tenant_context
+
+    st.session_state.setdefault('tenant', "filial-a")
+    for key in ('editing_vehicle', 'current_vehicle'):
+        st.session_state.setdefault(key, None)
+    st.session_state.setdefault('show_maintenance_form', False)
+    st.session_state.setdefault('delete_vehicle_confirmation', 1)
+    with tenant_context(DEFAULT_TENANT):
+        app.vehicle_card(1)
+
+def test_vehicle_card_uses_session_tenant(workdir):
+    """Excluir pelo cartão na filial não toca no veículo de mesmo id da garagem principal"""
+    AppTest = pytest.importorskip("streamlit.testing.v1").AppTest
+    vehicle = {'brand': "Fiat", 'model': "Uno", 'year': "2010", 'color': "Branco",
+               'purchase_price': 15000, 'additional_costs': 0, 'fipe_price': 18000}
+    create_tenant("filial-a")
+    database.init_tenants()
+    database.add_vehicle(vehicle)
+    with tenant_context("filial-a"):
+        database.add_vehicle(vehicle)
+
+    at = AppTest.from_function(_card_script).run()
+    assert not at.exception
+    at.button(key="confirm_1").click().run()
+
+    assert database.get_vehicle(1) is not None
+    with tenant_context("filial-a"):
+        assert database.get_vehicle(1) is None
+
+def test_fipe_price_history_is_shared(workdir):
+    """Um preço consultado em qualquer garagem vale para todas (como o cache FIPE)"""
+    create_tenant("filial-a")
+    database.init_tenants()
+    with tenant_context("filial-a"):
+        database.record_fipe_price("001004-9", 2015, "2026-09", 31000.0)
+        assert database.get_fipe_price_history(["001004-9"]) == [("001004-9", 2015, "2026-09", 31000.0)]
+    assert database.get_fipe_price_history() == [("001004-9", 2015, "2026-09", 31000.0)]
+
+def test_tenant_price_history_moves_to_shared(workdir):
+    """Preços que versões antigas gravaram no banco da filial passam para a série compartilhada"""
+    create_tenant("filial-a")
+    database.init_tenants()
+    with tenant_context("filial-a"):
+        conn = database.get_db()
+        conn.execute("INSERT INTO fipe_price_history VALUES ('001004-9', 2015, '2026-08', 31500.0)")
+        conn.commit()
+        conn.close()
+        database.init_db()
+        conn = database.get_db()
+        assert conn.execute('SELECT COUNT(*) FROM fipe_price_history').fetchone()[0] == 0
+        conn.close()
+    assert database.get_fipe_price_history() == [("001004-9", 2015, "2026-08", 31500.0)]
@@ -0,0 +1,66 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from fleet import populate_db  # noqa: E402
+from fipe_stub import FipeStubServer  # noqa: E402
+
+# Tamanhos de frota medidos; 100k gera um banco de vários GB com as fotos,
+# então fica fora do padrão: BENCH_FLEET_SIZES=100,10000,100000
+FLEET_SIZES = [int(s) for s in os.environ.get("BENCH_FLEET_SIZES", "100,10000").split(",")]
+IMAGE_KB = int(os.environ.get("BENCH_IMAGE_KB", "80"))
+
+@pytest.fixture(scope="session")
+def fleet_template(tmp_path_factory):
+    """Monta (uma vez por sessão) o banco modelo de cada tamanho de frota"""
+    templates = {}
+
+    def build(size):
+        if size not in templates:
+            workdir = tmp_path_factory.mktemp(f"fleet_{size}")
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                populate_db(size, mean_image_kb=IMAGE_KB)
+            finally:
+                os.chdir(cwd)
+            templates[size] = os.path.join(workdir, "vehicles.db")
+        return templates[size]
+
+    return build
+
+@pytest.fixture(params=FLEET_SIZES, ids=lambda size: f"fleet{size}")
+def fleet(request, fleet_template, tmp_path, monkeypatch):
+    """Diretório de trabalho isolado com uma cópia da frota sintética
+
+    Os módulos usam caminhos relativos (vehicles.db, cache/, data/backups),
+    então basta mudar o diretório atual.
+    """
+    shutil.copy2(fleet_template(request.param), tmp_path / "vehicles.db")
+    monkeypatch.chdir(tmp_path)
+    return request.param
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Diretório de trabalho vazio, para benchmarks que não precisam de frota"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture(scope="session")
+def fipe_stub():
+    stub = FipeStubServer().start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def fipe(fipe_stub, monkeypatch):
+    """Módulo fipe_api apontando para o stub local"""
+    fipe_api = pytest.importorskip("fipe_api")
+    monkeypatch.setattr(fipe_api, "BASE_URL", fipe_stub.base_url)
+    return fipe_api
@@ -0,0 +1,122 @@
+"""Servidor local que imita a API FIPE (parallelum) para rodar sem rede
+
+Uso isolado:
+    python benchmarks/fipe_stub.py 8765
+    FIPE_BASE_URL=http://127.0.0.1:8765/fipe/api/v1/carros streamlit run app.py
+"""
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fleet import BRANDS, FUELS
+
+API_PREFIX = "/fipe/api/v1/carros"
+MONTHS = ["janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+          "agosto", "setembro", "outubro", "novembro", "dezembro"]
+
+def _brands():
+    return [{"codigo": str(i + 1), "nome": name} for i, name in enumerate(BRANDS)]
+
+def _models(brand_code):
+    brand = list(BRANDS)[int(brand_code) - 1]
+    return [{"codigo": int(brand_code) * 100 + i, "nome": name}
+            for i, name in enumerate(BRANDS[brand])]
+
+def _years(brand_code, model_code):
+    return [{"codigo": f"{year}-{f + 1}", "nome": f"{year} {fuel}"}
+            for year in range(2024, 2009, -1)
+            for f, fuel in enumerate(FUELS)]
+
+def _price(brand_code, model_code, year_code):
+    brand = list(BRANDS)[int(brand_code) - 1]
+    model = BRANDS[brand][int(model_code) % 100]
+    year, fuel = year_code.split('-')
+    value = 20000 + (int(model_code) * 37 + int(year) * 11) % 150000
+    reference = time.localtime()
+    return {
+        "TipoVeiculo": 1,
+        "Valor": f"R$ {value:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.'),
+        "Marca": brand,
+        "Modelo": model,
+        "AnoModelo": int(year),
+        "Combustivel": FUELS[int(fuel) - 1],
+        "CodigoFipe": f"{int(model_code):06d}-{int(fuel)}",
+        "MesReferencia": f"{MONTHS[reference.tm_mon - 1]} de {reference.tm_year}",
+        "SiglaCombustivel": FUELS[int(fuel) - 1][0],
+    }
+
+ROUTES = [
+    (re.compile(r"^/marcas$"), lambda: _brands()),
+    (re.compile(r"^/marcas/(\d+)/modelos$"),
+     lambda b: {"modelos": _models(b), "anos": _years(b, None)}),
+    (re.compile(r"^/marcas/(\d+)/modelos/(\d+)/anos$"), _years),
+    (re.compile(r"^/marcas/(\d+)/modelos/(\d+)/anos/([\d-]+)$"), _price),
+]
+
+class FipeStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail:
+            self.send_error(503)
+            return
+
+        path = self.path.split('?', 1)[0]
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
+        for pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if match:
+                try:
+                    body = json.dumps(handler(*match.groups())).encode()
+                except (IndexError, ValueError):
+                    break
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+class FipeStubServer(ThreadingHTTPServer):
+    """Stub da API FIPE com latência configurável e contador de requisições
+
+    `fail=True` faz todas as rotas responderem 503, para simular a API fora do ar.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(("127.0.0.1", port), FipeStubHandler)
+        self.latency = latency
+        self.fail = False
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{API_PREFIX}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    stub = FipeStubServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"Stub FIPE em {stub.base_url}")
+    stub.serve_forever()
@@ -0,0 +1,135 @@
+"""Gerador de frotas sintéticas usado pelos benchmarks"""
+import base64
+import random
+from datetime import date, timedelta
+
+from database import get_db, init_db, natural_key
+
+BRANDS = {
+    "Fiat": ["Uno Mille 1.0", "Palio Fire 1.0", "Strada Working 1.4", "Argo Drive 1.3"],
+    "GM - Chevrolet": ["Onix LT 1.0", "Celta Life 1.0", "Vectra GLS 2.2", "S10 LTZ 2.8"],
+    "VW - VolksWagen": ["Gol 1.6 MSI", "Fox 1.0", "Saveiro Robust 1.6", "Polo TSI 1.0"],
+    "Ford": ["Ka SE 1.0", "Fiesta 1.6", "Ranger XLS 2.2", "EcoSport FreeStyle 1.5"],
+    "Toyota": ["Corolla XEi 2.0", "Etios X 1.3", "Hilux SRV 2.8", "Yaris XL 1.5"],
+    "Honda": ["Civic LXR 2.0", "Fit EX 1.5", "City EXL 1.5", "HR-V EX 1.8"],
+    "Renault": ["Sandero Expression 1.0", "Logan Zen 1.6", "Duster Dynamique 1.6"],
+    "Hyundai": ["HB20 Comfort 1.0", "Creta Action 1.6", "Tucson GLS 1.6"],
+}
+FUELS = ["Gasolina", "Flex", "Diesel"]
+COLORS = ["branco", "preto", "prata", "cinza", "vermelho", "azul", "verde", None]
+DESCRIPTIONS = [
+    "Troca de óleo e filtro",
+    "Alinhamento e balanceamento",
+    "Troca de pastilhas de freio",
+    "Revisão completa dos 10.000 km",
+    "Substituição da correia dentada",
+    "Troca de pneus dianteiros",
+    "Higienização do ar-condicionado",
+    "Funilaria e pintura do para-choque",
+    "Troca da bateria",
+    "Polimento e cristalização",
+]
+AUTHORS = ["Antonio", "Fernando"]
+
+def make_image_pool(rng, count=16, mean_kb=80):
+    """Gera um conjunto de imagens base64 com tamanhos próximos aos de fotos reais
+
+    As fotos reduzidas por `save_image` ficam entre ~40 e ~200 KB; usamos uma
+    distribuição log-normal em torno de `mean_kb` e reaproveitamos o conjunto
+    entre os veículos para não gastar memória gerando bytes aleatórios.
+    """
+    pool = []
+    for _ in range(count):
+        size = max(4 * 1024, int(rng.lognormvariate(0, 0.45) * mean_kb * 1024))
+        pool.append(base64.b64encode(rng.randbytes(size)).decode())
+    return pool
+
+def generate_vehicle(rng, image_pool=None, image_ratio=0.7):
+    """Gera um veículo com os campos da tabela `vehicles`"""
+    brand = rng.choice(list(BRANDS))
+    model_year = rng.randint(1994, 2024)
+    image_data = None
+    if image_pool and rng.random() < image_ratio:
+        image_data = rng.choice(image_pool)
+    return {
+        'brand': brand,
+        'model': rng.choice(BRANDS[brand]),
+        'year': f"{model_year} {rng.choice(FUELS)}",
+        'color': rng.choice(COLORS),
+        'purchase_price': round(rng.uniform(8000, 180000), 2),
+        'additional_costs': 0.0,
+        'fipe_price': round(rng.uniform(9000, 200000), 2),
+        'image_data': image_data,
+    }
+
+def generate_maintenance(rng, max_records=12):
+    """Gera um histórico de manutenções com datas e quilometragem crescentes"""
+    records = []
+    day = date(2020, 1, 1) + timedelta(days=rng.randint(0, 365))
+    mileage = rng.randint(10000, 150000)
+    for _ in range(rng.randint(0, max_records)):
+        day += timedelta(days=rng.randint(15, 180))
+        mileage += rng.randint(500, 12000)
+        records.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'description': rng.choice(DESCRIPTIONS),
+            'cost': round(rng.uniform(80, 4500), 2),
+            'mileage': mileage,
+            'author': rng.choice(AUTHORS),
+            'next_maintenance_date': (day + timedelta(days=rng.choice([90, 180, 365]))).strftime('%Y-%m-%d'),
+        })
+    return records
+
+def generate_fleet(size, seed=42, image_ratio=0.7, mean_image_kb=80, max_maintenance=12):
+    """Gera `size` veículos, cada um com sua lista de manutenções em 'maintenance'"""
+    rng = random.Random(seed)
+    image_pool = make_image_pool(rng, mean_kb=mean_image_kb) if image_ratio else None
+    for _ in range(size):
+        vehicle = generate_vehicle(rng, image_pool, image_ratio)
+        vehicle['maintenance'] = generate_maintenance(rng, max_maintenance)
+        vehicle['additional_costs'] = round(sum(m['cost'] for m in vehicle['maintenance']), 2)
+        yield vehicle
+
+def populate_db(size, batch_size=1000, **kwargs):
+    """Cria o banco no diretório atual e insere uma frota sintética
+
+    A inserção é feita direto com `executemany` para que montar a frota de
+    100k veículos não domine o tempo do benchmark.
+    """
+    init_db()
+    conn = get_db()
+    c = conn.cursor()
+    batch = []
+    suffixes = {}
+
+    def flush():
+        for vehicle in batch:
+            # Veículos repetidos recebem sufixo, como em add_vehicle
+            key = natural_key(vehicle['brand'], vehicle['model'], vehicle['year'], vehicle['color'])
+            vehicle['natural_key'] = key
+            vehicle['suffix'] = suffixes[key] = suffixes.get(key, -1) + 1
+            if vehicle['suffix']:
+                vehicle['model'] = f"{vehicle['model']} ({vehicle['suffix']})"
+            c.execute('''
+                INSERT INTO vehicles (brand, model, year, color, purchase_price,
+                                    additional_costs, fipe_price, image_data, natural_key, suffix)
+                VALUES (:brand, :model, :year, :color, :purchase_price,
+                        :additional_costs, :fipe_price, :image_data, :natural_key, :suffix)
+            ''', vehicle)
+            for record in vehicle['maintenance']:
+                record['vehicle_id'] = c.lastrowid
+            c.executemany('''
+                INSERT INTO maintenance (vehicle_id, date, description, cost, mileage, author,
+                                         next_maintenance_date)
+                VALUES (:vehicle_id, :date, :description, :cost, :mileage, :author,
+                        :next_maintenance_date)
+            ''', vehicle['maintenance'])
+        conn.commit()
+        batch.clear()
+
+    for vehicle in generate_fleet(size, **kwargs):
+        batch.append(vehicle)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    conn.close()
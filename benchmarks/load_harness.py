@@ -0,0 +1,240 @@
+"""Teste de carga: várias sessões do app ao mesmo tempo, pelo AppTest do Streamlit
+
+Cada sessão roda num processo próprio (o AppTest troca o Runtime global a
+cada execução, então duas sessões no mesmo processo se atrapalhariam) e
+percorre os fluxos de uso: abrir a lista, abrir um veículo, registrar uma
+manutenção e cadastrar um veículo pelo formulário FIPE, contra o stub
+local da API. As sessões começam juntas e, no fim, o relatório traz os
+percentis de latência de cada rerun, os erros de banco travado e a
+memória de cada sessão.
+
+O AppTest reexecuta o script inteiro a cada interação, mesmo dentro de um
+fragmento: as latências de abrir um veículo e registrar manutenção são um
+limite superior do que o navegador vê, e o `st.rerun(scope="fragment")`
+do cartão do veículo falha só aqui (contado à parte, não como erro).
+
+    python benchmarks/load_harness.py [sessões] [repetições]
+
+Roda no diretório atual (cria vehicles.db, cache/ e data/).
+"""
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import database  # noqa: E402
+from fipe_stub import FipeStubServer  # noqa: E402
+from fleet import DESCRIPTIONS, COLORS, populate_db  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+RUN_TIMEOUT = 120       # Segundos por rerun; sob carga o padrão do AppTest (3 s) é curto
+LOCK_MESSAGES = ("database is locked", "database is busy")
+APPTEST_ARTIFACTS = ('scope="fragment"',)  # Erros que só existem sem reruns de fragmento
+PERCENTILES = (50, 90, 99)
+
+def _rss_mb():
+    """Memória residente do processo atual"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Pico, em sistemas sem /proc
+
+def _widget(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+class Session:
+    """Uma sessão do navegador: o AppTest e o registro de cada rerun"""
+
+    def __init__(self, rng):
+        from streamlit.testing.v1 import AppTest
+
+        self.rng = rng
+        self.app = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+        self.timings = []
+        self.errors = []
+
+    def run(self, step, action=None):
+        """Executa a interação (ou só o script) e registra a latência do rerun"""
+        start = time.perf_counter()
+        try:
+            if action is None:
+                self.app.run()
+            else:
+                action(self.app).run()
+        except Exception as e:  # Rerun que estourou o tempo ou quebrou o AppTest
+            self.errors.append((step, f"{type(e).__name__}: {e}"))
+        self.timings.append((step, time.perf_counter() - start))
+        # st.error também mostra avisos do negócio ("Valor negativo em relação à FIPE")
+        messages = [str(element.value) for element in self.app.exception]
+        messages += [str(element.value) for element in self.app.error if 'erro' in str(element.value).lower()]
+        self.errors.extend((step, message) for message in messages)
+
+    def open_list(self):
+        if not self.timings:
+            self.run('open_list')
+        else:
+            self.run('open_list', lambda app: app.button(key="menu_view").click())
+
+    def expand_vehicle(self):
+        """Abre o formulário de manutenção de um veículo da lista"""
+        buttons = [button.key for button in self.app.button if (button.key or '').startswith("add_maint_btn_")]
+        key = self.rng.choice(buttons)
+        self.run('expand_vehicle', lambda app: app.button(key=key).click())
+        return int(key.rsplit('_', 1)[1])
+
+    def add_maintenance(self):
+        app = self.app
+        _widget(app.text_area, "Descrição do Serviço").input(self.rng.choice(DESCRIPTIONS))
+        _widget(app.number_input, "Custo (R$)").set_value(round(self.rng.uniform(80, 4500), 2))
+        _widget(app.number_input, "Quilometragem").set_value(self.rng.randint(10000, 200000))
+        self.run('add_maintenance', lambda app: _widget(app.button, "💾 Salvar").click())
+
+    def add_vehicle(self):
+        """Formulário FIPE: cada escolha de marca, modelo e ano é um rerun"""
+        self.run('open_add_form', lambda app: app.button(key="menu_add").click())
+        for label in ("Marca do Veículo", "Modelo do Veículo", "Ano do Veículo"):
+            select = _widget(self.app.selectbox, label)
+            index = self.rng.randrange(len(select.options))
+            self.run('fipe_select', lambda app, label=label, index=index: _widget(app.selectbox, label).select_index(index))
+        _widget(self.app.text_input, "Cor do Veículo").input(self.rng.choice([color for color in COLORS if color]))
+        _widget(self.app.number_input, "Valor de Aquisição (R$)").set_value(round(self.rng.uniform(8000, 180000), 2))
+        self.run('add_vehicle', lambda app: _widget(app.button, "💾 Adicionar Veículo").click())
+
+def run_session(index, workdir, fipe_url, iterations, seed, start_barrier, results):
+    """Processo de uma sessão: carrega o app, espera as demais e percorre os fluxos"""
+    os.chdir(workdir)
+    os.environ["FIPE_BASE_URL"] = fipe_url
+    os.environ["JOB_WORKERS"] = "0"  # Processos de tarefas não fazem parte da carga medida
+    # Processo aquecido, como um servidor que já atendeu alguém: bibliotecas
+    # carregadas sob demanda e caches do processo não entram na conta da sessão
+    Session(random.Random(seed)).run('warmup')
+    rng = random.Random(seed + index)
+    session = Session(rng)
+    baseline = _rss_mb()
+    start_barrier.wait()
+    counts = {'maintenance': 0, 'vehicles': 0}
+    try:
+        for _ in range(iterations):
+            session.open_list()
+            session.expand_vehicle()
+            session.add_maintenance()
+            counts['maintenance'] += 1
+            session.add_vehicle()
+            counts['vehicles'] += 1
+    except Exception as e:  # Widget esperado não apareceu: a sessão para aqui
+        session.errors.append(('flow', f"{type(e).__name__}: {e}"))
+    results.put({
+        'session': index,
+        'timings': session.timings,
+        'errors': session.errors,
+        'counts': counts,
+        'rss_baseline_mb': baseline,
+        'rss_mb': _rss_mb(),
+    })
+
+def _percentile(values, percent):
+    """Percentil pelo posto mais próximo"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))]
+
+def _latency_summary(values):
+    summary = {f'p{percent}_ms': _percentile(values, percent) * 1000 for percent in PERCENTILES}
+    summary['max_ms'] = max(values) * 1000
+    summary['count'] = len(values)
+    return summary
+
+def _table_count(table):
+    conn = database.get_db()
+    count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    conn.close()
+    return count
+
+def run_load(sessions=4, iterations=2, fleet_size=30, seed=7, fipe_latency=0.0):
+    """Roda as sessões em paralelo e retorna o relatório de latência, erros e memória"""
+    populate_db(fleet_size, image_ratio=0)
+    before = {table: _table_count(table) for table in ('vehicles', 'maintenance')}
+    stub = FipeStubServer(latency=fipe_latency).start()
+    context = multiprocessing.get_context('spawn')
+    start_barrier = context.Barrier(sessions + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_session, name=f"load-session-{i}",
+                        args=(i, os.getcwd(), stub.base_url, iterations, seed, start_barrier, results))
+        for i in range(sessions)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        start_barrier.wait()  # Todas as sessões carregadas: a carga começa aqui
+        started = time.perf_counter()
+        reports = sorted((results.get() for _ in processes), key=lambda report: report['session'])
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        stub.stop()
+
+    steps = {}
+    for report in reports:
+        for step, seconds in report['timings']:
+            steps.setdefault(step, []).append(seconds)
+    errors = [error for report in reports for _, error in report['errors']]
+    artifacts = [error for error in errors if any(text in error for text in APPTEST_ARTIFACTS)]
+    errors = [error for error in errors if error not in artifacts]
+    added = {table: _table_count(table) - count for table, count in before.items()}
+    return {
+        'sessions': sessions,
+        'elapsed_s': elapsed,
+        'reruns': sum(len(report['timings']) for report in reports),
+        'latency': _latency_summary([seconds for values in steps.values() for seconds in values]),
+        'steps': {step: _latency_summary(values) for step, values in steps.items()},
+        'errors': len(errors),
+        'lock_errors': sum(any(message in error.lower() for message in LOCK_MESSAGES) for error in errors),
+        'error_samples': errors[:5],
+        'apptest_artifacts': len(artifacts),
+        'memory_mb': [
+            {'session': report['session'], 'rss': report['rss_mb'],
+             'growth': report['rss_mb'] - report['rss_baseline_mb']}
+            for report in reports
+        ],
+        'expected': {
+            'vehicles': sum(report['counts']['vehicles'] for report in reports),
+            'maintenance': sum(report['counts']['maintenance'] for report in reports),
+        },
+        'added': added,
+        'fipe_requests': stub.request_count,
+    }
+
+def _print_report(report):
+    print(f"{report['sessions']} sessão(ões), {report['reruns']} reruns em {report['elapsed_s']:.1f} s")
+    print(f"{'etapa':<16}{'n':>5}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    for step, summary in [('(todas)', report['latency'])] + list(report['steps'].items()):
+        print(f"{step:<16}{summary['count']:>5}{summary['p50_ms']:>10.0f}{summary['p90_ms']:>10.0f}"
+              f"{summary['p99_ms']:>10.0f}{summary['max_ms']:>10.0f}")
+    print(f"Erros: {report['errors']} (banco travado: {report['lock_errors']}); "
+          f"{report['apptest_artifacts']} do AppTest sem reruns de fragmento")
+    for error in report['error_samples']:
+        print(f"  - {error}")
+    for memory in report['memory_mb']:
+        print(f"Sessão {memory['session']}: {memory['rss']:.0f} MB residentes, +{memory['growth']:.0f} MB na carga")
+    print(f"Gravados: {report['added']} (esperado {report['expected']})")
+
+if __name__ == "__main__":
+    result = run_load(
+        sessions=int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+        iterations=int(sys.argv[2]) if len(sys.argv) > 2 else 2,
+    )
+    _print_report(result)
+    sys.exit(0 if not result['errors'] and result['added'] == result['expected'] else 1)
@@ -0,0 +1,171 @@
+"""Simulador de clientes offline sincronizando com o servidor
+
+Cada cliente tem sua réplica (offline_client.py) e, a cada rodada, registra,
+edita ou exclui manutenções sem conexão; com probabilidade `online_ratio`
+ele sincroniza. O servidor também edita manutenções, como o app faria,
+para provocar conflitos. No fim todos sincronizam e as réplicas são
+comparadas com o banco do servidor.
+
+    python benchmarks/sync_harness.py [clientes] [rodadas]
+
+Roda no diretório atual (cria vehicles.db e as réplicas em replicas/).
+Com `http=True` os clientes falam com a API HTTP em vez de chamar database.py.
+"""
+import os
+import random
+import sqlite3
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+from fleet import DESCRIPTIONS, AUTHORS, populate_db  # noqa: E402
+from models import Maintenance  # noqa: E402
+from offline_client import OfflineClient, LocalTransport, HttpTransport  # noqa: E402
+
+class FlakyTransport:
+    """Transporte que falha quando o cliente está sem sinal"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.online = True
+        self.requests = 0
+
+    def pull(self, since_seq):
+        return self._call(self.transport.pull, since_seq)
+
+    def push(self, client_id, ops):
+        return self._call(self.transport.push, client_id, ops)
+
+    def _call(self, method, *args):
+        if not self.online:
+            raise ConnectionError("Sem conexão")
+        self.requests += 1
+        return method(*args)
+
+def _random_edit(rng, maintenance):
+    return Maintenance(
+        vehicle_id=maintenance.vehicle_id,
+        date=maintenance.date,
+        description=rng.choice(DESCRIPTIONS) if rng.random() < 0.5 else maintenance.description,
+        cost=round(rng.uniform(80, 4500), 2) if rng.random() < 0.5 else maintenance.cost,
+        mileage=maintenance.mileage,
+        author=maintenance.author,
+        next_maintenance_date=maintenance.next_maintenance_date,
+    )
+
+def client_step(rng, client, vehicle_ids):
+    """Uma ação offline aleatória: registrar, editar ou excluir uma manutenção"""
+    vehicle_id = rng.choice(vehicle_ids)
+    records = client.get_vehicle_maintenance(vehicle_id)
+    action = rng.random()
+    if action < 0.5 or not records:
+        client.add_maintenance(Maintenance(
+            vehicle_id=vehicle_id,
+            date=f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            description=rng.choice(DESCRIPTIONS),
+            cost=round(rng.uniform(80, 4500), 2),
+            mileage=rng.randint(10000, 200000),
+            author=rng.choice(AUTHORS),
+        ))
+    elif action < 0.85:
+        record = rng.choice(records)
+        client.update_maintenance(record.id, _random_edit(rng, record))
+    else:
+        client.delete_maintenance(rng.choice(records).id)
+
+def server_step(rng, vehicle_ids):
+    """Edição feita no servidor (pelo app) numa manutenção qualquer"""
+    records = database.get_vehicle_maintenance(rng.choice(vehicle_ids))
+    if records:
+        record = rng.choice(records)
+        database.update_maintenance(record.id, _random_edit(rng, record))
+
+def _server_rows():
+    conn = database.get_db()
+    maintenance = conn.execute(
+        'SELECT id, vehicle_id, date, description, cost, mileage, author, next_maintenance_date '
+        'FROM maintenance ORDER BY id'
+    ).fetchall()
+    costs = conn.execute('SELECT id, ROUND(additional_costs, 2) FROM vehicles ORDER BY id').fetchall()
+    conn.close()
+    return maintenance, costs
+
+def _replica_rows(client):
+    maintenance = [tuple(row) for row in client.conn.execute(
+        'SELECT id, vehicle_id, date, description, cost, mileage, author, next_maintenance_date '
+        'FROM maintenance ORDER BY id'
+    )]
+    costs = [tuple(row) for row in client.conn.execute(
+        'SELECT id, ROUND(additional_costs, 2) FROM vehicles ORDER BY id'
+    )]
+    return maintenance, costs
+
+def simulate(clients=3, rounds=30, fleet_size=50, online_ratio=0.5, server_edit_ratio=0.3,
+             seed=7, http=False):
+    """Roda a simulação e retorna as contagens; `converged` indica réplicas iguais ao servidor"""
+    rng = random.Random(seed)
+    populate_db(fleet_size, image_ratio=0)
+    vehicle_ids = [row[0] for row in sqlite3.connect(database.get_db_path()).execute('SELECT id FROM vehicles')]
+
+    server = None
+    if http:
+        import api
+        server = api.create_server(host="127.0.0.1", port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_transport = HttpTransport(f"http://127.0.0.1:{server.server_address[1]}")
+    else:
+        base_transport = LocalTransport()
+
+    os.makedirs("replicas", exist_ok=True)
+    replicas = []
+    for i in range(clients):
+        transport = FlakyTransport(base_transport)
+        client = OfflineClient(os.path.join("replicas", f"client_{i}.db"), transport)
+        client.sync()
+        replicas.append((client, transport))
+
+    stats = {'ops': 0, 'syncs': 0, 'failed_syncs': 0, 'conflicts': 0, 'server_edits': 0}
+    for _ in range(rounds):
+        for client, transport in replicas:
+            for _ in range(rng.randint(1, 4)):
+                client_step(rng, client, vehicle_ids)
+                stats['ops'] += 1
+            transport.online = rng.random() < online_ratio
+            try:
+                result = client.sync()
+                stats['syncs'] += 1
+                stats['conflicts'] += len(result['conflicts'])
+            except ConnectionError:
+                stats['failed_syncs'] += 1
+        if rng.random() < server_edit_ratio:
+            server_step(rng, vehicle_ids)
+            stats['server_edits'] += 1
+
+    # Todos voltam a ter sinal; duas rodadas para cada um ver o envio dos outros
+    for _ in range(2):
+        for client, transport in replicas:
+            transport.online = True
+            client.sync()
+
+    expected = _server_rows()
+    stats['converged'] = all(_replica_rows(client) == expected for client, _ in replicas)
+    stats['pending'] = sum(client.pending_count() for client, _ in replicas)
+    stats['requests'] = sum(transport.requests for _, transport in replicas)
+    for client, _ in replicas:
+        client.close()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    return stats
+
+if __name__ == "__main__":
+    result = simulate(
+        clients=int(sys.argv[1]) if len(sys.argv) > 1 else 3,
+        rounds=int(sys.argv[2]) if len(sys.argv) > 2 else 30,
+    )
+    print(result)
+    sys.exit(0 if result['converged'] else 1)
@@ -1,7 +1,39 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import hashlib
 import json
 import os
+import random
+import tempfile
+import threading
+import time
 from logger import setup_logger
+from models import Vehicle
+from tenants import DEFAULT_TENANT, get_current_tenant
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Codecs opcionais: sem eles o cache continua em JSON da biblioteca padrão
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
 
 # Configuração dos loggers
 logger = setup_logger('cache_manager')
@@ -9,52 +41,611 @@ logger = setup_logger('cache_manager')
 CACHE_DIR = "cache"
 VEHICLE_CACHE_DURATION = timedelta(days=60)  # Cache de veículos: 2 meses
 FIPE_CACHE_DURATION = timedelta(hours=24)    # Cache FIPE: 24 horas
+FIPE_STALE_DURATION = timedelta(days=7)      # Tempo máximo servindo FIPE expirado enquanto revalida
+CACHE_EXPIRY_JITTER = 0.1                    # Antecipa a expiração em até 10% para não alinhar
+NEGATIVE_CACHE_SECONDS = 60                  # Tempo que uma busca que falhou não é repetida
+
+# Formato dos arquivos do cache: json (orjson se instalado) ou msgpack,
+# opcionalmente comprimidos com zstd ou lz4. A leitura detecta o formato pelo
+# conteúdo, então trocar a configuração não invalida o cache existente.
+CACHE_FORMAT = os.environ.get('CACHE_FORMAT', 'json')
+CACHE_COMPRESSION = os.environ.get('CACHE_COMPRESSION', '')
+
+FORMAT_EXTENSIONS = {'json': '.json', 'msgpack': '.msgpack'}
+COMPRESSION_EXTENSIONS = {'': '', 'zstd': '.zst', 'lz4': '.lz4'}
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+LZ4_MAGIC = b'\x04\x22\x4d\x18'
+
+# Chave do backup persistente dos veículos
+BACKUP_KEY = 'persistent_data'
+
+# Cada namespace é um subdiretório de CACHE_DIR, dividido em 256 shards pelo
+# hash da chave (cache/fipe/3f/fipe_price_....json). `max_bytes` é o
+# orçamento em disco e `max_idle` o tempo sem uso após o qual a entrada é
+# descartada; None desliga a limpeza. O backup persistente nunca é removido.
+# Os namespaces de TENANT_NAMESPACES guardam dados da garagem e ficam em
+# cache/tenants/<garagem>/ (exceto os da garagem principal); o FIPE é
+# compartilhado por todas.
+NAMESPACES = {
+    'fipe': {
+        'max_bytes': int(os.environ.get('CACHE_FIPE_MAX_BYTES', 200 * 1024 * 1024)),
+        'max_idle': FIPE_CACHE_DURATION + FIPE_STALE_DURATION,
+    },
+    'vehicles': {'max_bytes': None, 'max_idle': None},
+    'persistent': {'max_bytes': None, 'max_idle': None},
+}
+TENANT_NAMESPACES = ('vehicles', 'persistent')
+SHARD_COUNT = 256
 
-# Adicionar constante para arquivo de backup
-BACKUP_FILE = os.path.join(CACHE_DIR, 'persistent_data.json')
+def key_namespace(key):
+    if key == BACKUP_KEY:
+        return 'persistent'
+    if key.startswith('fipe_'):
+        return 'fipe'
+    return 'vehicles'
 
 def ensure_cache_dir():
     if not os.path.exists(CACHE_DIR):
         os.makedirs(CACHE_DIR)
 
+def _namespace_dir(namespace):
+    tenant = get_current_tenant()
+    if namespace in TENANT_NAMESPACES and tenant != DEFAULT_TENANT:
+        return os.path.join(CACHE_DIR, 'tenants', tenant, namespace)
+    return os.path.join(CACHE_DIR, namespace)
+
+def _flat_dirs():
+    """Diretório plano das versões antigas, que só pode conter dados da garagem principal"""
+    return [CACHE_DIR] if get_current_tenant() == DEFAULT_TENANT else []
+
+_created_dirs = set()
+
+def _shard_dir(key):
+    """Diretório da chave, criado na primeira vez que é pedido no processo"""
+    shard = hashlib.blake2b(key.encode(), digest_size=1).hexdigest()
+    directory = os.path.join(_namespace_dir(key_namespace(key)), shard)
+    absolute = os.path.abspath(directory)
+    if absolute not in _created_dirs:
+        os.makedirs(directory, exist_ok=True)
+        _created_dirs.add(absolute)
+    return directory
+
+def _shard_dirs(namespace):
+    root = _namespace_dir(namespace)
+    if not os.path.isdir(root):
+        return []
+    return [entry.path for entry in os.scandir(root) if entry.is_dir()]
+
+def _active_format():
+    """Formato e compressão configurados, caindo para JSON se faltar o pacote"""
+    fmt, compression = CACHE_FORMAT, CACHE_COMPRESSION
+    if fmt not in FORMAT_EXTENSIONS or (fmt == 'msgpack' and msgpack is None):
+        fmt = 'json'
+    if ((compression == 'zstd' and zstandard is None)
+            or (compression == 'lz4' and lz4_frame is None)
+            or compression not in COMPRESSION_EXTENSIONS):
+        compression = ''
+    return fmt, compression
+
+def serialize(data, fmt='json', compression=''):
+    if fmt == 'msgpack':
+        payload = msgpack.packb(data, use_bin_type=True)
+    elif orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        payload = json.dumps(data).encode()
+
+    if compression == 'zstd':
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    elif compression == 'lz4':
+        payload = lz4_frame.compress(payload)
+    return payload
+
+def deserialize(payload):
+    """Decodifica um arquivo do cache detectando compressão e formato pelo conteúdo"""
+    try:
+        if payload.startswith(ZSTD_MAGIC):
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        elif payload.startswith(LZ4_MAGIC):
+            payload = lz4_frame.decompress(payload)
+
+        if payload.lstrip()[:1] in (b'{', b'['):
+            return orjson.loads(payload) if orjson is not None else json.loads(payload)
+        return msgpack.unpackb(payload, raw=False)
+    except Exception as e:
+        raise ValueError(f"Arquivo de cache inválido: {e}") from e
+
 def get_cache_path(key):
-    ensure_cache_dir()
-    return os.path.join(CACHE_DIR, f"{key}.json")
+    fmt, compression = _active_format()
+    return os.path.join(_shard_dir(key), f"{key}{FORMAT_EXTENSIONS[fmt]}{COMPRESSION_EXTENSIONS[compression]}")
+
+def _legacy_cache_paths(key):
+    """Caminhos da chave em outros formatos ou no diretório plano das versões antigas"""
+    current = get_cache_path(key)
+    return [
+        os.path.join(directory, f"{key}{fmt_ext}{comp_ext}")
+        for directory in [_shard_dir(key)] + _flat_dirs()
+        for fmt_ext in FORMAT_EXTENSIONS.values()
+        for comp_ext in COMPRESSION_EXTENSIONS.values()
+        if os.path.join(directory, f"{key}{fmt_ext}{comp_ext}") != current
+    ]
+
+def _is_cache_file(filename):
+    return any(
+        filename.endswith(f"{fmt_ext}{comp_ext}")
+        for fmt_ext in FORMAT_EXTENSIONS.values()
+        for comp_ext in COMPRESSION_EXTENSIONS.values()
+    )
+
+def read_cache_file(key):
+    """Lê a chave no formato atual ou, se existir só em outro formato, migra o arquivo"""
+    path = get_cache_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = deserialize(f.read())
+        if NAMESPACES[key_namespace(key)]['max_bytes'] is not None:
+            _touch(path)
+        return data
+    except FileNotFoundError:
+        pass
+
+    for path in _legacy_cache_paths(key):
+        try:
+            with open(path, 'rb') as f:
+                data = deserialize(f.read())
+        except FileNotFoundError:
+            continue
+        with cache_lock(key):
+            write_cache_file(key, data)
+        logger.info(f"Cache {key} migrado de {os.path.basename(path)} para {os.path.basename(get_cache_path(key))}")
+        return data
+    raise FileNotFoundError(key)
+
+def write_cache_file(key, data):
+    """Grava a chave no formato configurado e remove cópias em outros formatos"""
+    path = get_cache_path(key)
+    atomic_write(path, serialize(data, *_active_format()))
+    for legacy_path in _legacy_cache_paths(key):
+        try:
+            os.remove(legacy_path)
+        except FileNotFoundError:
+            pass
+    evict_shard(os.path.dirname(path), key_namespace(key))
+
+def _cache_files(directory):
+    """Arquivos de dados do diretório (sem locks e temporários)"""
+    try:
+        with os.scandir(directory) as entries:
+            return [entry for entry in entries
+                    if not entry.name.startswith('.') and _is_cache_file(entry.name)]
+    except FileNotFoundError:
+        return []
+
+def migrate_cache():
+    """Converte todos os arquivos do cache para o formato e o layout configurados"""
+    if not os.path.exists(CACHE_DIR):
+        return 0
+    directories = _flat_dirs() + [d for namespace in NAMESPACES for d in _shard_dirs(namespace)]
+    migrated = 0
+    for directory in directories:
+        for entry in _cache_files(directory):
+            key = entry.name.split('.', 1)[0]
+            if entry.path != get_cache_path(key):
+                read_cache_file(key)
+                migrated += 1
+    return migrated
+
+# Leituras por namespace desde o início do processo, para a taxa de acerto
+_lookups = {namespace: {'hits': 0, 'misses': 0} for namespace in NAMESPACES}
+_lookups_lock = threading.Lock()
+
+def _count_lookup(key, hit):
+    with _lookups_lock:
+        _lookups[key_namespace(key)]['hits' if hit else 'misses'] += 1
+
+def _touch(path):
+    """Marca o uso da entrada: a mtime é o relógio do LRU"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _remove_entry(path):
+    """Remove o arquivo e, se ninguém o estiver usando, o lock da chave; retorna os bytes liberados"""
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    directory, name = os.path.split(path)
+    _remove_lock_file(os.path.join(directory, f".{name.split('.', 1)[0]}.lock"))
+    return size
+
+def _remove_lock_file(lock_path):
+    """Apaga o arquivo de lock só com o lock obtido, sem esperar por ele
+
+    Quem já abriu o arquivo e espera o lock percebe, em cache_lock, que o
+    caminho agora é outro arquivo e abre de novo; assim dois processos
+    nunca ficam com locks em arquivos diferentes da mesma chave. A limpeza
+    roda dentro do lock de outra chave, por isso não espera: se o lock
+    estiver ocupado, o arquivo fica para a próxima.
+    """
+    if fcntl is None:
+        return  # Sem flock não há como saber se alguém usa o arquivo
+    try:
+        lock_file = open(lock_path, 'a')
+    except OSError:
+        return
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        try:
+            if _same_file(lock_path, lock_file):
+                os.remove(lock_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _same_file(path, file):
+    """O caminho ainda aponta para o arquivo aberto (não foi apagado nem recriado)"""
+    try:
+        return os.stat(path).st_ino == os.fstat(file.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+def evict_shard(directory, namespace):
+    """Aplica a política do namespace a um único shard
+
+    Remove as entradas sem uso há mais de `max_idle` e, se o shard passar
+    da sua parte do orçamento (`max_bytes` / SHARD_COUNT), as menos usadas.
+    Como as chaves se espalham por hash, limitar cada shard limita o total
+    sem varrer o cache inteiro a cada gravação.
+    """
+    policy = NAMESPACES[namespace]
+    if policy['max_bytes'] is None and policy['max_idle'] is None:
+        return 0, 0
+    now = time.time()
+    max_idle = policy['max_idle'].total_seconds() if policy['max_idle'] else None
+    removed = freed = 0
+    kept = []
+    for entry in _cache_files(directory):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if max_idle is not None and now - stat.st_mtime > max_idle:
+            freed += _remove_entry(entry.path)
+            removed += 1
+        else:
+            kept.append((stat.st_mtime, stat.st_size, entry.path))
+
+    if policy['max_bytes'] is not None:
+        budget = policy['max_bytes'] / SHARD_COUNT
+        total = sum(size for _, size, _ in kept)
+        for _, size, path in sorted(kept):
+            if total <= budget:
+                break
+            freed += _remove_entry(path)
+            total -= size
+            removed += 1
+    if removed:
+        logger.debug(f"Cache {namespace}: {removed} entrada(s) removida(s) de {directory}, {freed} bytes")
+    return removed, freed
 
-def save_to_cache(key, data):
+def evict_cache(namespace=None):
+    """Passa a limpeza por todos os shards (de um namespace ou de todos)"""
+    removed = freed = 0
+    for name in ([namespace] if namespace else NAMESPACES):
+        for directory in _shard_dirs(name):
+            shard_removed, shard_freed = evict_shard(directory, name)
+            removed += shard_removed
+            freed += shard_freed
+    if removed:
+        logger.info(f"Limpeza do cache: {removed} entrada(s) removida(s), {freed / 1024:.0f} KB liberados")
+    return removed, freed
+
+def cache_stats():
+    """Entradas, bytes em disco e taxa de acerto de cada namespace"""
+    stats = {}
+    for namespace, policy in NAMESPACES.items():
+        entries = size = 0
+        for directory in _shard_dirs(namespace):
+            for entry in _cache_files(directory):
+                try:
+                    size += entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+                entries += 1
+        with _lookups_lock:
+            hits, misses = _lookups[namespace]['hits'], _lookups[namespace]['misses']
+        stats[namespace] = {
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': policy['max_bytes'],
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        }
+    return stats
+
+# Locks por chave dentro do processo e as chaves já obtidas pela thread atual,
+# para permitir reentrada (ex.: atualizar um veículo lê e grava a chave
+# 'vehicles' dentro do mesmo lock)
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+_held_locks = threading.local()
+
+@contextmanager
+def cache_lock(key):
+    """Lock exclusivo da chave entre threads e processos que usam o mesmo diretório"""
+    held = _held_locks.__dict__.setdefault('keys', set())
+    if key in held:
+        yield
+        return
+
+    with _key_locks_guard:
+        thread_lock = _key_locks.setdefault(key, threading.Lock())
+    lock_path = os.path.join(_shard_dir(key), f".{key}.lock")
+    with thread_lock:
+        lock_file = _open_locked(lock_path)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+def _open_locked(lock_path):
+    """Abre o arquivo de lock e obtém o flock
+
+    Se a limpeza apagou o arquivo enquanto esperávamos, o lock obtido é de
+    um arquivo que ninguém mais vai abrir: tenta de novo com o atual.
+    """
+    while True:
+        lock_file = open(lock_path, 'a')
+        if fcntl is None:
+            return lock_file
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if _same_file(lock_path, lock_file):
+            return lock_file
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+def atomic_write(path, payload):
+    """Grava em arquivo temporário e troca pelo destino com os.replace
+
+    Leitores concorrentes veem o arquivo antigo ou o novo, nunca um pela
+    metade, e uma queda no meio da escrita preserva o conteúdo anterior.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+
+def _fsync_dir(directory):
+    """Garante que a troca de nomes também chegou ao disco (só POSIX)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def get_cache_duration(key):
+    """Define a duração do cache baseado no prefixo da chave"""
+    if key.startswith('fipe_'):
+        return FIPE_CACHE_DURATION
+    return VEHICLE_CACHE_DURATION
+
+def _write_cache_entry(key, data, version=None):
+    now = datetime.now()
+    # Cada entrada expira num instante ligeiramente diferente, para que as
+    # chaves gravadas juntas não expirem todas no mesmo momento
+    duration = get_cache_duration(key) * (1 - random.uniform(0, CACHE_EXPIRY_JITTER))
     cache_data = {
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': now.isoformat(),
+        'expires': (now + duration).isoformat(),
         'data': data
     }
-    with open(get_cache_path(key), 'w') as f:
-        json.dump(cache_data, f)
+    if version is not None:
+        cache_data['version'] = version
+    write_cache_file(key, cache_data)
 
-def load_from_cache(key):
+def save_to_cache(key, data, version=None):
+    """Grava a chave; `version` carimba a entrada com a versão dos dados do banco"""
+    with cache_lock(key):
+        _write_cache_entry(key, data, version)
+
+def load_cache_entry(key):
+    """Retorna (dados, expirado, expira_em, versão) da entrada do cache ou None se não existir"""
     try:
-        with open(get_cache_path(key), 'r') as f:
-            cache_data = json.load(f)
-            cache_time = datetime.fromisoformat(cache_data['timestamp'])
-            
-            # Define a duração do cache baseado no prefixo da chave
-            if key.startswith('fipe_'):
-                duration = FIPE_CACHE_DURATION
-            else:
-                duration = VEHICLE_CACHE_DURATION
-                
-            if datetime.now() - cache_time <= duration:
-                return cache_data['data']
-    except (FileNotFoundError, json.JSONDecodeError, KeyError):
-        pass
+        cache_data = read_cache_file(key)
+        if 'expires' in cache_data:
+            expires = datetime.fromisoformat(cache_data['expires'])
+        else:
+            expires = datetime.fromisoformat(cache_data['timestamp']) + get_cache_duration(key)
+        expired = datetime.now() > expires
+        _count_lookup(key, not expired)
+        return cache_data['data'], expired, expires, cache_data.get('version')
+    except (FileNotFoundError, KeyError, TypeError, ValueError):
+        _count_lookup(key, False)
+        return None
+
+def load_from_cache(key, version=None):
+    """Retorna os dados da chave se válidos
+
+    Com `version`, a entrada vale enquanto tiver sido gravada com a mesma
+    versão dos dados, independente da idade; sem ela, vale o prazo de expiração.
+    """
+    entry = load_cache_entry(key)
+    if entry is None:
+        return None
+    if version is not None:
+        return entry[0] if entry[3] == version else None
+    if not entry[1]:
+        return entry[0]
     return None
 
-def clear_cache():
-    """Limpa todo o cache"""
+# Buscas em andamento por chave: sessões concorrentes que pedem a mesma chave
+# esperam a mesma requisição em vez de dispararem cópias dela
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def single_flight(key, fetch):
+    """Executa `fetch` uma única vez por chave entre as threads concorrentes"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        logger.debug(f"Aguardando busca em andamento para {key}")
+        return future.result()
+
+    try:
+        future.set_result(fetch())
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+    return future.result()
+
+def _fetch_and_save(key, fetch, force=False):
+    # Outro processo pode ter preenchido a chave enquanto esperávamos o lock
+    with cache_lock(key):
+        entry = load_cache_entry(key)
+        if entry is not None and not entry[1] and not force:
+            return entry[0]
+        data = fetch()
+        _write_cache_entry(key, data)
+    return data
+
+def _revalidate_in_background(key, fetch):
+    with _inflight_lock:
+        if key in _inflight:
+            return
+
+    def run():
+        try:
+            single_flight(key, lambda: _fetch_and_save(key, fetch))
+            logger.info(f"Cache {key} revalidado em segundo plano")
+        except Exception as e:
+            logger.warning(f"Falha ao revalidar cache {key}: {e}")
+
+    threading.Thread(target=run, name=f"revalidate-{key}", daemon=True).start()
+
+# Falhas recentes por chave: (instante até quando vale, exceção)
+_failures = {}
+_failures_lock = threading.Lock()
+
+def _recent_failure(key):
+    with _failures_lock:
+        failure = _failures.get(key)
+        if failure is not None and failure[0] <= time.monotonic():
+            del _failures[key]
+            failure = None
+    return failure[1] if failure else None
+
+def _remember_failure(key, error, ttl):
+    with _failures_lock:
+        _failures[key] = (time.monotonic() + ttl, error)
+
+def clear_failures():
+    """Esquece as falhas guardadas no cache negativo"""
+    with _failures_lock:
+        _failures.clear()
+
+def cached_fetch_status(key, fetch, stale_duration=FIPE_STALE_DURATION, refresh_within=None,
+                        negative_ttl=NEGATIVE_CACHE_SECONDS):
+    """Como `cached_fetch`, mas retorna (dados, stale)
+
+    `stale` é verdadeiro quando os dados vêm de uma entrada expirada. Se a
+    busca falhar, a falha fica guardada por `negative_ttl` segundos (sem
+    nova tentativa nesse período) e a última versão do cache, mesmo
+    expirada há mais de `stale_duration`, é devolvida no lugar do erro.
+    """
+    entry = load_cache_entry(key)
+    if entry is not None:
+        data, expired, expires, _ = entry
+        if not expired and (refresh_within is None or expires - datetime.now() > refresh_within):
+            logger.debug(f"Cache {key} encontrado")
+            return data, False
+        if refresh_within is not None:
+            try:
+                return single_flight(key, lambda: _fetch_and_save(key, fetch, force=True)), False
+            except Exception as e:
+                logger.warning(f"Falha ao renovar cache {key}, mantendo versão atual: {e}")
+                return data, expired
+        if datetime.now() - expires <= stale_duration:
+            logger.debug(f"Cache {key} expirado, servindo versão antiga enquanto revalida")
+            if _recent_failure(key) is None:
+                _revalidate_in_background(key, fetch)
+            return data, True
+
+    error = _recent_failure(key)
+    if error is None:
+        try:
+            return single_flight(key, lambda: _fetch_and_save(key, fetch)), False
+        except Exception as e:
+            if negative_ttl:
+                _remember_failure(key, e, negative_ttl)
+            error = e
+    else:
+        logger.debug(f"Falha recente em {key}, busca não repetida")
+
+    if entry is not None:
+        logger.warning(f"Servindo cache expirado de {key} após falha: {error}")
+        return entry[0], True
+    raise error
+
+def cached_fetch(key, fetch, stale_duration=FIPE_STALE_DURATION, refresh_within=None,
+                 negative_ttl=NEGATIVE_CACHE_SECONDS):
+    """Busca `key` no cache; em caso de falta, executa `fetch` e grava o resultado
+
+    Entradas expiradas há menos de `stale_duration` são devolvidas na hora
+    enquanto uma thread em segundo plano busca a versão nova. Com
+    `refresh_within`, entradas que vão expirar dentro desse prazo são
+    renovadas agora (usado pelo aquecimento do cache).
+    """
+    return cached_fetch_status(key, fetch, stale_duration, refresh_within, negative_ttl)[0]
+
+def clear_cache(keep_persistent=True):
+    """Limpa o cache; o backup persistente dos veículos só sai com keep_persistent=False"""
+    clear_failures()
+    namespaces = [n for n in NAMESPACES if n != 'persistent' or not keep_persistent]
     try:
         if os.path.exists(CACHE_DIR):
             count = 0
-            for file in os.listdir(CACHE_DIR):
-                if file.endswith('.json'):
-                    os.remove(os.path.join(CACHE_DIR, file))
+            directories = [d for namespace in namespaces for d in _shard_dirs(namespace)]
+            for directory in directories + _flat_dirs():
+                for file in os.listdir(directory):
+                    if not (_is_cache_file(file) or file.endswith('.tmp')):
+                        continue
+                    # Arquivos do layout plano antigo: respeita o namespace da chave
+                    if directory == CACHE_DIR and key_namespace(file.lstrip('.').split('.', 1)[0]) not in namespaces:
+                        continue
+                    os.remove(os.path.join(directory, file))
                     count += 1
             logger.info(f"Cache limpo: {count} arquivo(s) removido(s)")
     except Exception as e:
@@ -64,8 +655,8 @@ def save_persistent_data(data):
     """Salva dados de forma persistente"""
     ensure_cache_dir()
     try:
-        with open(BACKUP_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        with cache_lock(BACKUP_KEY):
+            write_cache_file(BACKUP_KEY, data)
         logger.info("Dados persistentes salvos com sucesso")
     except Exception as e:
         logger.error(f"Erro ao salvar dados persistentes: {e}")
@@ -73,38 +664,48 @@ def save_persistent_data(data):
 def load_persistent_data():
     """Carrega dados persistentes"""
     try:
-        if os.path.exists(BACKUP_FILE):
-            with open(BACKUP_FILE, 'r') as f:
-                data = json.load(f)
-            logger.info("Dados persistentes carregados com sucesso")
-            return data
+        data = read_cache_file(BACKUP_KEY)
+        logger.info("Dados persistentes carregados com sucesso")
+        return data
+    except FileNotFoundError:
+        pass
     except Exception as e:
         logger.error(f"Erro ao carregar dados persistentes: {e}")
     return None
 
-def save_vehicles_to_cache(vehicles_data):
-    """Salva veículos no cache e no backup persistente"""
+def save_vehicles_to_cache(vehicles, version=None):
+    """Salva veículos no cache e no backup persistente
+
+    As fotos não vão para o cache: cada veículo guarda só 'has_image' e a
+    foto é lida do banco quando acessada.
+    """
     try:
-        save_to_cache('vehicles', vehicles_data)
-        save_persistent_data({'vehicles': vehicles_data}) # Adiciona persistência
+        vehicles_data = [vehicle.to_dict() for vehicle in vehicles]
+        save_to_cache('vehicles', vehicles_data, version)
+        save_persistent_data({'vehicles': vehicles_data, 'version': version}) # Adiciona persistência
         logger.info(f"Cache e backup de veículos atualizados com {len(vehicles_data)} veículos")
     except Exception as e:
         logger.error(f"Erro ao salvar cache de veículos: {e}")
 
-def load_vehicles_from_cache():
-    """Carrega veículos do cache ou do backup persistente"""
+def load_vehicles_from_cache(version=None, image_loader=None):
+    """Carrega veículos do cache ou do backup persistente
+
+    Com `version`, só aceita dados gravados com essa versão do banco.
+    `image_loader(vehicle_id)` é usado para ler a foto sob demanda.
+    """
     try:
         # Tenta carregar do cache primeiro
-        data = load_from_cache('vehicles')
+        data = load_from_cache('vehicles', version)
         if data is not None:
             logger.info("Cache de veículos carregado com sucesso")
-            return data
+            return [Vehicle.from_dict(vehicle, image_loader) for vehicle in data]
             
         # Se não encontrar no cache, tenta carregar do backup
         persistent_data = load_persistent_data()
-        if persistent_data and 'vehicles' in persistent_data:
+        if (persistent_data and 'vehicles' in persistent_data
+                and (version is None or persistent_data.get('version') == version)):
             logger.info("Veículos carregados do backup persistente")
-            return persistent_data['vehicles']
+            return [Vehicle.from_dict(vehicle, image_loader) for vehicle in persistent_data['vehicles']]
             
         logger.debug("Nenhum dado encontrado (cache ou persistente)")
         return None
@@ -112,27 +713,33 @@ def load_vehicles_from_cache():
         logger.error(f"Erro ao carregar veículos: {e}")
         return None
 
-def update_vehicle_in_cache(vehicle_id, vehicle_data):
-    """Atualiza um veículo específico no cache"""
+def update_vehicle_in_cache(vehicle_id, vehicle, old_version=None, new_version=None):
+    """Atualiza um veículo específico no cache
+
+    Com versões, só aplica a alteração se o cache estiver na versão anterior
+    à escrita; caso contrário ele já está desatualizado e será recarregado.
+    """
     try:
-        vehicles = load_vehicles_from_cache()
-        if vehicles:
-            vehicles = [v for v in vehicles if v['id'] != vehicle_id]
-            vehicles.append(vehicle_data)
-            save_vehicles_to_cache(vehicles)
-            logger.info(f"Veículo {vehicle_id} atualizado no cache")
+        with cache_lock('vehicles'):
+            vehicles = load_vehicles_from_cache(old_version)
+            if vehicles is not None:
+                vehicles = [v for v in vehicles if v.id != vehicle_id]
+                vehicles.append(vehicle)
+                save_vehicles_to_cache(vehicles, new_version)
+                logger.info(f"Veículo {vehicle_id} atualizado no cache")
     except Exception as e:
         logger.error(f"Erro ao atualizar veículo {vehicle_id} no cache: {e}")
 
-def delete_vehicle_from_cache(vehicle_id):
+def delete_vehicle_from_cache(vehicle_id, old_version=None, new_version=None):
     """Remove um veículo do cache"""
     try:
-        vehicles = load_vehicles_from_cache()
-        if vehicles:
-            old_count = len(vehicles)
-            vehicles = [v for v in vehicles if v['id'] != vehicle_id]
-            save_vehicles_to_cache(vehicles)
-            logger.info(f"Veículo {vehicle_id} removido do cache")
-            logger.debug(f"Total de veículos no cache: {len(vehicles)} (antes: {old_count})")
+        with cache_lock('vehicles'):
+            vehicles = load_vehicles_from_cache(old_version)
+            if vehicles is not None:
+                old_count = len(vehicles)
+                vehicles = [v for v in vehicles if v.id != vehicle_id]
+                save_vehicles_to_cache(vehicles, new_version)
+                logger.info(f"Veículo {vehicle_id} removido do cache")
+                logger.debug(f"Total de veículos no cache: {len(vehicles)} (antes: {old_count})")
     except Exception as e:
         logger.error(f"Erro ao remover veículo {vehicle_id} do cache: {e}")
@@ -1,48 +1,183 @@
 import sqlite3
+import itertools
 import json
 import os
+import re
 import shutil
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from urllib.request import pathname2url
 from cache_manager import (
     save_vehicles_to_cache, load_vehicles_from_cache,
     update_vehicle_in_cache, delete_vehicle_from_cache
 )
+from db_writer import DatabaseWriter
+from tenants import DEFAULT_TENANT, tenant_dir, get_current_tenant, list_tenants, get_tenant_name, tenant_context
+from models import VEHICLE_COLUMNS, Vehicle, Maintenance, MaintenanceReport
+from logger import setup_logger
+
+logger = setup_logger('database')
 
 BACKUP_DIR = "data/backups"
 CURRENT_DB = "vehicles.db"
 
+def get_db_path(tenant=None):
+    """Arquivo do banco da garagem (por padrão, a garagem ativa)"""
+    directory = tenant_dir(tenant or get_current_tenant())
+    return CURRENT_DB if directory is None else os.path.join(directory, CURRENT_DB)
+
+def get_backup_dir(tenant=None):
+    directory = tenant_dir(tenant or get_current_tenant())
+    return BACKUP_DIR if directory is None else os.path.join(directory, "backups")
+
 def ensure_backup_dir():
     """Garante que o diretório de backup existe"""
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR, exist_ok=True)
+    backup_dir = get_backup_dir()
+    if not os.path.exists(backup_dir):
+        os.makedirs(backup_dir, exist_ok=True)
+    return backup_dir
 
 def create_backup():
-    """Cria backup do banco de dados atual"""
-    ensure_backup_dir()
+    """Cria backup do banco de dados da garagem ativa e retorna o caminho do arquivo
+
+    Usa a API de backup do SQLite, que copia um snapshot consistente mesmo
+    com outros processos (ex.: tarefas em segundo plano) escrevendo.
+    """
+    backup_dir = ensure_backup_dir()
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_file = os.path.join(BACKUP_DIR, f'vehicles_backup_{timestamp}.db')
+    backup_file = os.path.join(backup_dir, f'vehicles_backup_{timestamp}.db')
     
-    if os.path.exists(CURRENT_DB):
-        shutil.copy2(CURRENT_DB, backup_file)
+    if os.path.exists(get_db_path()):
+        # O backup copia todas as páginas, inclusive as livres
+        reclaim_free_pages()
+        source = get_db()
+        target = sqlite3.connect(backup_file)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
         
         # Mantém apenas os 5 backups mais recentes
-        backups = sorted([f for f in os.listdir(BACKUP_DIR) if f.endswith('.db')])
+        backups = sorted([f for f in os.listdir(backup_dir) if f.endswith('.db')])
         if len(backups) > 5:
             for old_backup in backups[:-5]:
-                os.remove(os.path.join(BACKUP_DIR, old_backup))
+                os.remove(os.path.join(backup_dir, old_backup))
+        return backup_file
 
 def restore_latest_backup():
     """Restaura o backup mais recente se o banco atual não existir"""
-    if not os.path.exists(CURRENT_DB) and os.path.exists(BACKUP_DIR):
-        backups = sorted([f for f in os.listdir(BACKUP_DIR) if f.endswith('.db')])
+    db_path, backup_dir = get_db_path(), get_backup_dir()
+    if not os.path.exists(db_path) and os.path.exists(backup_dir):
+        backups = sorted([f for f in os.listdir(backup_dir) if f.endswith('.db')])
         if backups:
-            latest_backup = os.path.join(BACKUP_DIR, backups[-1])
-            shutil.copy2(latest_backup, CURRENT_DB)
+            latest_backup = os.path.join(backup_dir, backups[-1])
+            shutil.copy2(latest_backup, db_path)
             return True
     return False
 
 def get_db():
-    return sqlite3.connect('vehicles.db')
+    """Conexão com o banco da garagem ativa"""
+    return sqlite3.connect(get_db_path())
+
+# Uma thread de escrita por arquivo de banco (uma por garagem); todas as
+# sessões do Streamlit enviam suas escritas para ela em vez de abrir
+# transações concorrentes
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer():
+    """Retorna a thread de escrita do banco da garagem ativa"""
+    path = os.path.abspath(get_db_path())
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = DatabaseWriter(path)
+        return _writers[path]
+
+def get_writer_stats():
+    """Profundidade da fila e latência de commit da thread de escrita"""
+    return get_writer().stats()
+
+# Espaço liberado por exclusões e troca de fotos: com auto_vacuum incremental
+# as páginas livres podem ser devolvidas ao sistema aos poucos, sem o VACUUM
+# completo que reescreve o arquivo e bloqueia o banco inteiro
+AUTO_VACUUM_INCREMENTAL = 2
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', AUTO_VACUUM_INCREMENTAL: 'incremental'}
+VACUUM_STEP_PAGES = 2048  # Páginas devolvidas por operação da thread de escrita (~20 ms)
+
+def _incremental_vacuum(c, pages):
+    # O PRAGMA não devolve colunas e o sqlite3 do Python (nem com fetchall)
+    # o executa além do primeiro passo, que devolve uma página; o executemany
+    # prepara a instrução uma vez e a executa até o fim para cada repetição,
+    # dentro da transação da thread de escrita (o executescript faria commit)
+    c.executemany('PRAGMA incremental_vacuum(1)', itertools.repeat((), pages))
+    return c.execute('PRAGMA freelist_count').fetchone()[0]
+
+def _free_pages():
+    conn = get_db()
+    try:
+        return conn.execute('PRAGMA freelist_count').fetchone()[0], conn.execute('PRAGMA page_size').fetchone()[0]
+    finally:
+        conn.close()
+
+def reclaim_free_pages(step_pages=VACUUM_STEP_PAGES, max_pages=None):
+    """Devolve as páginas livres do banco ao sistema em passos de `step_pages`
+
+    Cada passo é uma operação curta na fila da thread de escrita, então as
+    escritas das sessões entram entre um passo e outro. Retorna as páginas
+    e os bytes devolvidos.
+    """
+    remaining, page_size = _free_pages()
+    freed = 0
+    while remaining and (max_pages is None or freed < max_pages):
+        step = min(step_pages, remaining) if max_pages is None else min(step_pages, remaining, max_pages - freed)
+        left = get_writer().execute(_incremental_vacuum, step)
+        if left >= remaining:
+            break  # Banco ainda sem auto_vacuum incremental
+        freed += remaining - left
+        remaining = left
+    if freed:
+        logger.info(f"Espaço recuperado: {freed} página(s), {freed * page_size / 1024:.0f} KB")
+    return {'pages': freed, 'bytes': freed * page_size}
+
+def get_storage_report(include_objects=True):
+    """Tamanho do arquivo, proporção de páginas livres e espaço de cada tabela e índice (dbstat)
+
+    O dbstat percorre todas as páginas do banco; com `include_objects=False`
+    só os contadores do cabeçalho são lidos.
+    """
+    conn = get_db()
+    try:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        objects = None
+        if include_objects:
+            try:
+                objects = [
+                    {'name': name, 'type': kind or 'table', 'table': table or name, 'pages': pages, 'bytes': size}
+                    for name, kind, table, pages, size in conn.execute('''
+                        SELECT s.name, m.type, m.tbl_name, s.pageno, s.pgsize
+                        FROM dbstat AS s
+                        LEFT JOIN sqlite_master AS m ON m.name = s.name
+                        WHERE s.aggregate = 1
+                        ORDER BY s.pgsize DESC
+                    ''')
+                ]
+            except sqlite3.OperationalError:
+                objects = None  # SQLite compilado sem a tabela virtual dbstat
+    finally:
+        conn.close()
+    return {
+        'file_bytes': os.path.getsize(get_db_path()),
+        'page_size': page_size,
+        'page_count': page_count,
+        'free_pages': free_pages,
+        'free_ratio': free_pages / page_count if page_count else 0.0,
+        'auto_vacuum': AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+        'objects': objects,
+    }
 
 def init_db():
     """Inicializa o banco de dados com suporte a backup"""
@@ -51,6 +186,7 @@ def init_db():
     
     conn = get_db()
     c = conn.cursor()
+    _migrate_auto_vacuum(c)
     
     # Criar tabela de veículos se não existir
     c.execute('''
@@ -63,9 +199,21 @@ def init_db():
             purchase_price REAL NOT NULL,
             additional_costs REAL NOT NULL,
             fipe_price REAL NOT NULL,
-            image_data TEXT
+            image_data TEXT,
+            natural_key TEXT,
+            suffix INTEGER NOT NULL DEFAULT 0,
+            fipe_code TEXT,
+            planned_sale_date TEXT,
+            fipe_brand_code TEXT,
+            fipe_model_code TEXT,
+            fipe_year_code TEXT
         )
     ''')
+    _ensure_columns(c, 'vehicles', {
+        'fipe_code': 'TEXT', 'planned_sale_date': 'TEXT',
+        'fipe_brand_code': 'TEXT', 'fipe_model_code': 'TEXT', 'fipe_year_code': 'TEXT'
+    })
+    _migrate_natural_keys(c)
 
     # Criar tabela de manutenções se não existir
     c.execute('''
@@ -77,293 +225,684 @@ def init_db():
             cost REAL NOT NULL,
             mileage INTEGER,
             author TEXT NOT NULL,  
+            next_maintenance_date TEXT,
             FOREIGN KEY (vehicle_id) REFERENCES vehicles (id)
         )
     ''')
+    _ensure_columns(c, 'maintenance', {'next_maintenance_date': 'TEXT'})
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_next_date
+        ON maintenance (next_maintenance_date) WHERE next_maintenance_date IS NOT NULL
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_maintenance_vehicle_date ON maintenance (vehicle_id, date)')
+
+    # Lista materializada das manutenções a vencer, recalculada uma vez por dia
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS due_maintenance (
+            maintenance_id INTEGER PRIMARY KEY,
+            vehicle_id INTEGER NOT NULL,
+            brand TEXT NOT NULL,
+            model TEXT NOT NULL,
+            year TEXT NOT NULL,
+            description TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            computed_on TEXT NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_tasks (
+            name TEXT PRIMARY KEY,
+            last_run TEXT NOT NULL
+        )
+    ''')
+
+    # Série histórica de preços FIPE: um valor por código, ano-modelo e mês
+    # de referência, guardado a cada consulta à API. É usada só no banco da
+    # garagem principal (ver record_fipe_price)
+    c.execute(FIPE_PRICE_HISTORY_TABLE)
+
+    # Fila de tarefas longas (importação, exportação, backup, FIPE) executadas
+    # pelos processos de jobs.py; o progresso é lido pela página de administração
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            worker_pid INTEGER,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)')
+
+    # Operações enviadas por clientes offline (offline_client.py), guardadas
+    # com o resultado para que um envio repetido não seja aplicado duas vezes
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_ops (
+            client_id TEXT NOT NULL,
+            op_id TEXT NOT NULL,
+            result TEXT NOT NULL,
+            applied_at TEXT NOT NULL,
+            PRIMARY KEY (client_id, op_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Versão dos dados: incrementada por trigger a cada escrita, inclusive as
+    # feitas fora do app, para que o cache seja validado com uma única leitura
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+    for table in ('vehicles', 'maintenance'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+    # Log de alterações para exportação incremental: uma linha por escrita,
+    # marcando se a foto mudou para não reenviá-la a cada manutenção
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            image_changed INTEGER NOT NULL DEFAULT 0,
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS vehicles_insert_changelog AFTER INSERT ON vehicles
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation, image_changed)
+            VALUES ('vehicles', NEW.id, 'I', NEW.image_data IS NOT NULL);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS vehicles_update_changelog AFTER UPDATE ON vehicles
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation, image_changed)
+            VALUES ('vehicles', NEW.id, 'U', OLD.image_data IS NOT NEW.image_data);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS vehicles_delete_changelog AFTER DELETE ON vehicles
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, operation) VALUES ('vehicles', OLD.id, 'D');
+        END
+    ''')
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS maintenance_{event.lower()}_changelog AFTER {event} ON maintenance
+            BEGIN
+                INSERT INTO change_log (table_name, row_id, operation)
+                VALUES ('maintenance', {row}.id, '{event[0]}');
+            END
+        ''')
 
     conn.commit()
+    if get_current_tenant() != DEFAULT_TENANT:
+        _move_price_history_to_shared(conn)
     conn.close()
     
     # Cria novo backup após inicialização
     create_backup()
 
+FIPE_PRICE_HISTORY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS fipe_price_history (
+        fipe_code TEXT NOT NULL,
+        model_year INTEGER NOT NULL,
+        reference_month TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (fipe_code, model_year, reference_month)
+    ) WITHOUT ROWID
+'''
+
+def _move_price_history_to_shared(conn):
+    """Leva para o banco da garagem principal os preços que versões antigas gravaram na garagem"""
+    rows = conn.execute('SELECT fipe_code, model_year, reference_month, value FROM fipe_price_history').fetchall()
+    if not rows:
+        return
+    with tenant_context(DEFAULT_TENANT):
+        get_writer().execute(_insert_fipe_prices, rows, 'OR IGNORE')
+    conn.execute('DELETE FROM fipe_price_history')
+    conn.commit()
+    logger.info(f"{len(rows)} preço(s) FIPE da garagem movido(s) para a série compartilhada")
+
+def _migrate_auto_vacuum(c):
+    """Liga o auto_vacuum incremental; bancos antigos precisam de um VACUUM, feito uma única vez"""
+    if c.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return
+    c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    if not c.execute('PRAGMA page_count').fetchone()[0]:
+        return  # Banco novo: vale a partir da primeira tabela
+    start = datetime.now()
+    try:
+        c.execute('VACUUM')
+    except sqlite3.OperationalError as e:
+        # Outro processo usando o banco: tenta de novo na próxima inicialização
+        logger.warning(f"Migração para auto_vacuum incremental adiada: {e}")
+        return
+    logger.info(f"Banco migrado para auto_vacuum incremental em {(datetime.now() - start).total_seconds():.1f} s")
+
+def init_tenants():
+    """Inicializa o banco de cada garagem cadastrada (cada uma com seu backup)"""
+    for tenant in list_tenants():
+        with tenant_context(tenant):
+            init_db()
+
+# Sufixo " (n)" que diferencia veículos com as mesmas características
+MODEL_SUFFIX_PATTERN = re.compile(r"^(.*) \((\d+)\)$")
+
+def split_model_suffix(model):
+    """Separa "Modelo (2)" em ("Modelo", 2); sem sufixo retorna (modelo, 0)"""
+    match = MODEL_SUFFIX_PATTERN.match(model or '')
+    if match:
+        return match.group(1), int(match.group(2))
+    return model, 0
+
+def natural_key(brand, model, year, color):
+    """Chave normalizada (marca, modelo sem sufixo, ano, cor) de um veículo"""
+    base_model, _ = split_model_suffix(model)
+    return '|'.join(' '.join(str(part or '').lower().split()) for part in (brand, base_model, year, color))
+
+def _ensure_columns(c, table, columns):
+    """Adiciona em bancos antigos as colunas que ainda não existem na tabela"""
+    existing = {col[1] for col in c.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+def _migrate_natural_keys(c):
+    """Adiciona natural_key/suffix em bancos antigos e cria o índice único"""
+    _ensure_columns(c, 'vehicles', {'natural_key': 'TEXT', 'suffix': 'INTEGER NOT NULL DEFAULT 0'})
+
+    pending = c.execute('''
+        SELECT id, brand, model, year, color FROM vehicles
+        WHERE natural_key IS NULL ORDER BY id
+    ''').fetchall()
+    if pending:
+        taken = set(c.execute('SELECT natural_key, suffix FROM vehicles WHERE natural_key IS NOT NULL'))
+        for vehicle_id, brand, model, year, color in pending:
+            base_model, suffix = split_model_suffix(model)
+            key = natural_key(brand, base_model, year, color)
+            # Duplicatas antigas sem sufixo recebem o próximo livre
+            while (key, suffix) in taken:
+                suffix += 1
+            taken.add((key, suffix))
+            c.execute(
+                'UPDATE vehicles SET natural_key = ?, suffix = ?, model = ? WHERE id = ?',
+                (key, suffix, f"{base_model} ({suffix})" if suffix else base_model, vehicle_id)
+            )
+
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vehicles_natural_key
+        ON vehicles (natural_key, suffix)
+    ''')
+
+def get_data_version(c=None):
+    """Retorna a versão atual dos dados de vehicles/maintenance"""
+    if c is not None:
+        return c.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+    conn = get_db()
+    try:
+        return get_data_version(conn.cursor())
+    finally:
+        conn.close()
+
 def check_vehicle_exists(brand, model, year, color):
     """Verifica se um veículo com as mesmas características já existe"""
+    _, suffix = split_model_suffix(model)
     conn = get_db()
     c = conn.cursor()
     c.execute('''
         SELECT COUNT(*) FROM vehicles 
-        WHERE brand = ? AND model = ? AND year = ? AND color = ?
-    ''', (brand, model, year, color))
+        WHERE natural_key = ? AND suffix = ?
+    ''', (natural_key(brand, model, year, color), suffix))
     count = c.fetchone()[0]
     conn.close()
     return count > 0
 
-def add_vehicle(vehicle_data):
-    """Adiciona veículo e atualiza cache"""
+def get_vehicle_image(vehicle_id):
+    """Lê só a foto de um veículo (carga sob demanda de Vehicle.image_data)"""
+    conn = get_db()
+    try:
+        row = conn.execute('SELECT image_data FROM vehicles WHERE id = ?', (vehicle_id,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def find_existing_vehicles(vehicles):
+    """Retorna os índices dos veículos da lista que já existem no banco
+
+    Resolve o arquivo de importação inteiro numa única consulta pelo índice
+    de chave natural, em vez de uma consulta por veículo.
+    """
+    keys = [
+        [natural_key(v['brand'], v['model'], v['year'], v.get('color')), split_model_suffix(v['model'])[1]]
+        for v in vehicles
+    ]
     conn = get_db()
     c = conn.cursor()
-    
-    # Remove id e maintenance se existirem (para importação)
-    vehicle_data.pop('id', None)
-    vehicle_data.pop('maintenance', None)
-    
-    # Garante que todos os campos necessários existam
-    required_fields = ['brand', 'model', 'year', 'color', 'purchase_price', 
-                      'additional_costs', 'fipe_price', 'image_data']
-    
-    for field in required_fields:
-        if field not in vehicle_data:
-            vehicle_data[field] = None
-
-    # Verifica se já existe veículo idêntico
-    if check_vehicle_exists(
-        vehicle_data['brand'],
-        vehicle_data['model'],
-        vehicle_data['year'],
-        vehicle_data['color']
-    ):
-        # Modifica o nome adicionando um sufixo
-        suffix = 1
-        original_model = vehicle_data['model']
-        while check_vehicle_exists(
-            vehicle_data['brand'],
-            f"{original_model} ({suffix})",
-            vehicle_data['year'],
-            vehicle_data['color']
-        ):
-            suffix += 1
-        vehicle_data['model'] = f"{original_model} ({suffix})"
-            
     c.execute('''
-        INSERT INTO vehicles (brand, model, year, color, purchase_price, 
-                            additional_costs, fipe_price, image_data)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        vehicle_data['brand'],
-        vehicle_data['model'],
-        vehicle_data['year'],
-        vehicle_data['color'],
-        vehicle_data['purchase_price'],
-        vehicle_data['additional_costs'],
-        vehicle_data['fipe_price'],
-        vehicle_data['image_data']
-    ))
-    
-    # Retorna o ID do veículo inserido
-    new_vehicle_id = c.lastrowid
-    conn.commit()
+        SELECT DISTINCT CAST(k.key AS INTEGER)
+        FROM json_each(?) AS k
+        JOIN vehicles v
+          ON v.natural_key = json_extract(k.value, '$[0]')
+         AND v.suffix = json_extract(k.value, '$[1]')
+    ''', (json.dumps(keys),))
+    existing = {row[0] for row in c.fetchall()}
     conn.close()
+    return existing
+
+def _upsert_vehicle(c, vehicle, mode='keep_both'):
+    """Grava o veículo numa única instrução e retorna o id
+
+    mode='keep_both' cria um novo registro com o próximo sufixo livre da
+    chave natural; mode='replace' sobrescreve o registro com a mesma chave e
+    sufixo, se existir.
+    """
+    base_model, suffix = split_model_suffix(vehicle.model)
+    params = dict(
+        vehicle.to_dict(include_image=True),
+        base_model=base_model,
+        suffix=suffix,
+        natural_key=natural_key(vehicle.brand, base_model, vehicle.year, vehicle.color)
+    )
+    if mode == 'replace':
+        c.execute('''
+            INSERT INTO vehicles (brand, model, year, color, purchase_price, additional_costs,
+                                fipe_price, image_data, natural_key, suffix, fipe_code, planned_sale_date,
+                                fipe_brand_code, fipe_model_code, fipe_year_code)
+            VALUES (:brand, :model, :year, :color, :purchase_price, :additional_costs,
+                    :fipe_price, :image_data, :natural_key, :suffix, :fipe_code, :planned_sale_date,
+                    :fipe_brand_code, :fipe_model_code, :fipe_year_code)
+            ON CONFLICT (natural_key, suffix) DO UPDATE SET
+                brand = excluded.brand, model = excluded.model, year = excluded.year,
+                color = excluded.color, purchase_price = excluded.purchase_price,
+                additional_costs = excluded.additional_costs, fipe_price = excluded.fipe_price,
+                image_data = excluded.image_data, fipe_code = excluded.fipe_code,
+                planned_sale_date = excluded.planned_sale_date,
+                fipe_brand_code = excluded.fipe_brand_code, fipe_model_code = excluded.fipe_model_code,
+                fipe_year_code = excluded.fipe_year_code
+        ''', params)
+        c.execute('SELECT id FROM vehicles WHERE natural_key = ? AND suffix = ?',
+                  (params['natural_key'], suffix))
+        return c.fetchone()[0]
+
+    c.execute('''
+        INSERT INTO vehicles (brand, model, year, color, purchase_price, additional_costs,
+                            fipe_price, image_data, natural_key, suffix, fipe_code, planned_sale_date,
+                            fipe_brand_code, fipe_model_code, fipe_year_code)
+        SELECT :brand,
+               CASE WHEN n.next = 0 THEN :base_model ELSE :base_model || ' (' || n.next || ')' END,
+               :year, :color, :purchase_price, :additional_costs, :fipe_price, :image_data,
+               :natural_key, n.next, :fipe_code, :planned_sale_date,
+               :fipe_brand_code, :fipe_model_code, :fipe_year_code
+        FROM (SELECT COALESCE(MAX(suffix) + 1, 0) AS next
+              FROM vehicles WHERE natural_key = :natural_key) AS n
+    ''', params)
+    return c.lastrowid
+
+def _insert_vehicle(c, vehicle, mode):
+    old_version = get_data_version(c)
+    vehicle_id = _upsert_vehicle(c, vehicle, mode)
+    return _fetch_vehicle(c, vehicle_id), old_version, get_data_version(c)
+
+def _as_vehicle(vehicle):
+    # Aceita também dicts (arquivos importados); id e maintenance são ignorados
+    if isinstance(vehicle, dict):
+        vehicle = Vehicle.from_dict({k: v for k, v in vehicle.items() if k != 'id'})
+    return vehicle
+
+def add_vehicle(vehicle, mode='keep_both'):
+    """Adiciona veículo e atualiza cache
+
+    Um veículo idêntico a outro já cadastrado recebe o sufixo " (n)" no
+    modelo (mode='keep_both') ou substitui o existente (mode='replace').
+    """
+    vehicle, old_version, new_version = get_writer().execute(_insert_vehicle, _as_vehicle(vehicle), mode)
     
     # Após inserir, atualiza o cache
-    vehicles = get_vehicles()
-    vehicle_data['id'] = new_vehicle_id
-    vehicles.append(vehicle_data)
-    save_vehicles_to_cache(vehicles)
+    update_vehicle_in_cache(vehicle.id, vehicle, old_version, new_version)
     
-    return new_vehicle_id
+    return vehicle.id
+
+def _import_vehicle(c, vehicle, maintenance_records, mode):
+    vehicle_id = _upsert_vehicle(c, vehicle, mode)
+    if mode == 'replace':
+        c.execute('DELETE FROM maintenance WHERE vehicle_id = ?', (vehicle_id,))
+    # additional_costs já vem com o total exportado, então as manutenções
+    # são gravadas sem somar o custo de novo
+    c.executemany('''
+        INSERT INTO maintenance (vehicle_id, date, description, cost, mileage, author, next_maintenance_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (vehicle_id, m['date'], m['description'], float(m['cost']), m.get('mileage'), m['author'],
+         m.get('next_maintenance_date'))
+        for m in maintenance_records
+    ])
+    return vehicle_id
+
+def import_vehicle(vehicle_data, mode='keep_both'):
+    """Importa um veículo exportado, com suas manutenções, numa única operação"""
+    maintenance_records = vehicle_data.get('maintenance') or []
+    return get_writer().execute(_import_vehicle, _as_vehicle(vehicle_data), maintenance_records, mode)
 
 def get_vehicles():
-    """Busca veículos primeiro no cache, depois no banco"""
-    cached_vehicles = load_vehicles_from_cache()
+    """Busca veículos no cache se ele estiver na versão atual do banco, senão no banco"""
+    cached_vehicles = load_vehicles_from_cache(get_data_version(), image_loader=get_vehicle_image)
     if (cached_vehicles is not None):
         return cached_vehicles
 
     conn = get_db()
-    conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute('SELECT * FROM vehicles')
-    vehicles = [dict(row) for row in c.fetchall()]
+    # Versão e linhas lidas no mesmo snapshot; as fotos ficam no banco
+    # e só são lidas quando exibidas
+    c.execute('BEGIN')
+    version = get_data_version(c)
+    rows = conn.cursor()
+    rows.row_factory = Vehicle.row_factory(get_vehicle_image)
+    vehicles = rows.execute(f'SELECT {VEHICLE_COLUMNS} FROM vehicles').fetchall()
+    conn.commit()
     conn.close()
     
     # Salva no cache
-    save_vehicles_to_cache(vehicles)
+    save_vehicles_to_cache(vehicles, version)
     return vehicles
 
-def update_vehicle(vehicle_id, vehicle_data):
-    """Atualiza veículo e cache"""
+def get_vehicle(vehicle_id):
+    """Busca um único veículo pela chave primária (a foto é lida sob demanda)"""
+    conn = get_db()
+    try:
+        return _fetch_vehicle(conn.cursor(), vehicle_id)
+    finally:
+        conn.close()
+
+def get_fleet_models():
+    """Retorna os pares (marca, modelo) distintos da frota, sem carregar as fotos"""
     conn = get_db()
     c = conn.cursor()
+    c.execute('SELECT DISTINCT brand, model FROM vehicles')
+    models = c.fetchall()
+    conn.close()
+    return models
+
+def _update_vehicle(c, vehicle_id, vehicle):
+    old_version = get_data_version(c)
+    base_model, suffix = split_model_suffix(vehicle.model)
+    key = natural_key(vehicle.brand, base_model, vehicle.year, vehicle.color)
+    # O formulário de edição devolve o nome FIPE sem sufixo: se a chave não
+    # mudou, o veículo mantém o sufixo atual; se mudou, usa o primeiro livre
+    current = c.execute('SELECT natural_key, suffix FROM vehicles WHERE id = ?', (vehicle_id,)).fetchone()
+    if current is None:
+        return None, old_version, old_version  # Excluído por outra sessão
+    current_key, current_suffix = current
+    if key == current_key and not suffix:
+        suffix = current_suffix
+    taken = {row[0] for row in c.execute(
+        'SELECT suffix FROM vehicles WHERE natural_key = ? AND id != ?', (key, vehicle_id))}
+    if suffix in taken:
+        suffix = 0 if 0 not in taken else max(taken) + 1
+    model = f"{base_model} ({suffix})" if suffix else base_model
+
     c.execute('''
         UPDATE vehicles
-        SET brand=?, model=?, year=?, color=?, purchase_price=?, additional_costs=?, fipe_price=?, image_data=?
+        SET brand=?, model=?, year=?, color=?, purchase_price=?, additional_costs=?, fipe_price=?,
+            natural_key=?, suffix=?, fipe_code=?, planned_sale_date=?,
+            fipe_brand_code=?, fipe_model_code=?, fipe_year_code=?
         WHERE id=?
     ''', (
-        vehicle_data['brand'],
-        vehicle_data['model'],
-        vehicle_data['year'],
-        vehicle_data['color'],
-        vehicle_data['purchase_price'],
-        vehicle_data['additional_costs'],
-        vehicle_data['fipe_price'],
-        vehicle_data['image_data'],
+        vehicle.brand,
+        model,
+        vehicle.year,
+        vehicle.color,
+        vehicle.purchase_price,
+        vehicle.additional_costs,
+        vehicle.fipe_price,
+        key,
+        suffix,
+        vehicle.fipe_code,
+        vehicle.planned_sale_date,
+        vehicle.fipe_brand_code,
+        vehicle.fipe_model_code,
+        vehicle.fipe_year_code,
         vehicle_id
     ))
-    conn.commit()
-    conn.close()
-    
+    # A foto só é regravada se foi trocada ou removida
+    if vehicle.image_changed:
+        c.execute('UPDATE vehicles SET image_data = ? WHERE id = ?', (vehicle.image_data, vehicle_id))
+    return _fetch_vehicle(c, vehicle_id), old_version, get_data_version(c)
+
+def update_vehicle(vehicle_id, vehicle):
+    """Atualiza veículo e cache"""
+    vehicle, old_version, new_version = get_writer().execute(_update_vehicle, vehicle_id, _as_vehicle(vehicle))
+    if vehicle is None:
+        logger.warning(f"Veículo {vehicle_id} não encontrado para atualização")
+        return
+
     # Atualiza o cache
-    vehicle_data['id'] = vehicle_id
-    update_vehicle_in_cache(vehicle_id, vehicle_data)
+    update_vehicle_in_cache(vehicle_id, vehicle, old_version, new_version)
 
-def delete_vehicle(vehicle_id):
-    """Remove veículo e atualiza cache"""
-    conn = get_db()
-    c = conn.cursor()
+def _set_fipe_codes(c, updates):
+    c.executemany('''
+        UPDATE vehicles SET fipe_brand_code = ?, fipe_model_code = ?, fipe_year_code = ?
+        WHERE id = ?
+    ''', [(brand_code, model_code, year_code, vehicle_id)
+          for vehicle_id, brand_code, model_code, year_code in updates])
+    return c.rowcount
+
+def set_fipe_codes(updates):
+    """Grava em lote os códigos FIPE: `updates` é uma lista de (id, marca, modelo, ano)
+
+    O cache de veículos fica numa versão antiga e é recarregado na próxima leitura.
+    """
+    return get_writer().execute(_set_fipe_codes, updates)
+
+def iter_vehicle_images(after_id=0, batch_size=64):
+    """Percorre as fotos gravadas em lotes de (id, image_data), em ordem de id
+
+    Cada lote é lido numa conexão própria, que é fechada antes de o lote
+    ser entregue; assim só um lote de fotos fica em memória por vez.
+    """
+    while True:
+        conn = get_db()
+        try:
+            batch = conn.execute('''
+                SELECT id, image_data FROM vehicles
+                WHERE id > ? AND image_data IS NOT NULL
+                ORDER BY id LIMIT ?
+            ''', (after_id, batch_size)).fetchall()
+        finally:
+            conn.close()
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1][0]
+
+def _replace_vehicle_images(c, updates):
+    replaced = []
+    for vehicle_id, old_image, new_image in updates:
+        c.execute('UPDATE vehicles SET image_data = ? WHERE id = ? AND image_data = ?',
+                  (new_image, vehicle_id, old_image))
+        if c.rowcount:
+            replaced.append(vehicle_id)
+    return replaced
+
+def replace_vehicle_images(updates):
+    """Troca em lote as fotos: `updates` é uma lista de (id, foto atual, foto nova)
+
+    A troca só acontece se a foto gravada ainda for a lida, para não
+    desfazer uma foto enviada pelo usuário nesse meio tempo. Retorna os
+    ids trocados.
+    """
+    return get_writer().execute(_replace_vehicle_images, updates)
+
+def _delete_vehicle(c, vehicle_id):
+    old_version = get_data_version(c)
     
     # Primeiro, exclui todas as manutenções associadas ao veículo
     c.execute('DELETE FROM maintenance WHERE vehicle_id = ?', (vehicle_id,))
     
     # Em seguida, exclui o veículo
     c.execute('DELETE FROM vehicles WHERE id = ?', (vehicle_id,))
-    
-    conn.commit()
-    conn.close()
+    return old_version, get_data_version(c)
+
+def delete_vehicle(vehicle_id):
+    """Remove veículo e atualiza cache"""
+    old_version, new_version = get_writer().execute(_delete_vehicle, vehicle_id)
     
     # Remove do cache
-    delete_vehicle_from_cache(vehicle_id)
+    delete_vehicle_from_cache(vehicle_id, old_version, new_version)
+
+def _fetch_vehicle(c, vehicle_id):
+    c.execute(f'SELECT {VEHICLE_COLUMNS} FROM vehicles WHERE id = ?', (vehicle_id,))
+    row = c.fetchone()
+    return Vehicle.row_factory(get_vehicle_image)(c, row) if row else None
+
+def _recalculate_additional_costs(c, vehicle_id):
+    c.execute('''
+        UPDATE vehicles 
+        SET additional_costs = (
+            SELECT COALESCE(SUM(cost), 0)
+            FROM maintenance
+            WHERE vehicle_id = ?
+        )
+        WHERE id = ?
+    ''', (vehicle_id, vehicle_id))
 
 # Funções para gerenciar manutenções
-def add_maintenance(maintenance_data):
-    conn = get_db()
-    c = conn.cursor()
+def _as_maintenance(maintenance):
+    return Maintenance.from_dict(maintenance) if isinstance(maintenance, dict) else maintenance
+
+def _insert_maintenance(c, maintenance):
+    if c.execute('SELECT 1 FROM vehicles WHERE id = ?', (maintenance.vehicle_id,)).fetchone() is None:
+        # Excluído por outra sessão: a exceção desfaz o SAVEPOINT da operação
+        raise Exception(f"Veículo {maintenance.vehicle_id} não encontrado")
+    old_version = get_data_version(c)
+
+    # Adiciona a manutenção
+    c.execute('''
+        INSERT INTO maintenance (vehicle_id, date, description, cost, mileage, author, next_maintenance_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        maintenance.vehicle_id,
+        maintenance.date,
+        maintenance.description,
+        float(maintenance.cost), # Garante que cost é float
+        maintenance.mileage,
+        maintenance.author,
+        maintenance.next_maintenance_date
+    ))
     
-    try:
-        # Inicia uma transação
-        c.execute('BEGIN TRANSACTION')
-        
-        # Adiciona a manutenção
-        c.execute('''
-            INSERT INTO maintenance (vehicle_id, date, description, cost, mileage, author)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            maintenance_data['vehicle_id'],
-            maintenance_data['date'],
-            maintenance_data['description'],
-            float(maintenance_data['cost']), # Garante que cost é float
-            maintenance_data['mileage'],
-            maintenance_data['author']
-        ))
-        
-        vehicle_id = maintenance_data['vehicle_id']
-        cost = float(maintenance_data['cost']) # Garante que cost é float
-        
-        # Atualiza os custos adicionais do veículo somando o novo custo
-        c.execute('''
-            UPDATE vehicles
-            SET additional_costs = additional_costs + ?
-            WHERE id = ?
-        ''', (cost, vehicle_id))
-        
-        # Busca os dados atualizados do veículo
-        c.execute('SELECT * FROM vehicles WHERE id = ?', (vehicle_id,))
-        vehicle = dict(zip([col[0] for col in c.description], c.fetchone()))
-        
-        # Confirma a transação
-        conn.commit()
-        
-        # Atualiza o cache com os novos dados
-        update_vehicle_in_cache(vehicle_id, vehicle)
-        
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    vehicle_id = maintenance.vehicle_id
+    cost = float(maintenance.cost) # Garante que cost é float
+    
+    # Atualiza os custos adicionais do veículo somando o novo custo
+    c.execute('''
+        UPDATE vehicles
+        SET additional_costs = additional_costs + ?
+        WHERE id = ?
+    ''', (cost, vehicle_id))
+    
+    # Busca os dados atualizados do veículo
+    return _fetch_vehicle(c, vehicle_id), old_version, get_data_version(c)
+
+def add_maintenance(maintenance):
+    maintenance = _as_maintenance(maintenance)
+    vehicle, old_version, new_version = get_writer().execute(_insert_maintenance, maintenance)
+    if vehicle is None:
+        logger.warning(f"Veículo {maintenance.vehicle_id} da nova manutenção não encontrado")
+        return
+
+    # Atualiza o cache com os novos dados
+    update_vehicle_in_cache(vehicle.id, vehicle, old_version, new_version)
 
 def get_vehicle_maintenance(vehicle_id):
     conn = get_db()
-    conn.row_factory = sqlite3.Row
+    conn.row_factory = Maintenance.row_factory()
     c = conn.cursor()
     c.execute('SELECT * FROM maintenance WHERE vehicle_id = ? ORDER BY date DESC', (vehicle_id,))
-    maintenance_records = [dict(row) for row in c.fetchall()]
+    maintenance_records = c.fetchall()
     conn.close()
     return maintenance_records
 
-def update_maintenance(maintenance_id, maintenance_data):
-    conn = get_db()
-    c = conn.cursor()
-    try:
-        c.execute('BEGIN TRANSACTION')
+def _update_maintenance(c, maintenance_id, maintenance):
+    old_version = get_data_version(c)
 
-        # Atualiza a manutenção
-        c.execute('''
-            UPDATE maintenance
-            SET date=?, description=?, cost=?, mileage=?, author=?
-            WHERE id=?
-        ''', (
-            maintenance_data['date'],
-            maintenance_data['description'],
-            maintenance_data['cost'],
-            maintenance_data['mileage'],
-            maintenance_data['author'],
-            maintenance_id
-        ))
+    # Atualiza a manutenção
+    c.execute('''
+        UPDATE maintenance
+        SET date=?, description=?, cost=?, mileage=?, author=?, next_maintenance_date=?
+        WHERE id=?
+    ''', (
+        maintenance.date,
+        maintenance.description,
+        maintenance.cost,
+        maintenance.mileage,
+        maintenance.author,
+        maintenance.next_maintenance_date,
+        maintenance_id
+    ))
 
-        # Recalcula custos adicionais do veículo
-        c.execute('''
-            UPDATE vehicles 
-            SET additional_costs = (
-                SELECT COALESCE(SUM(cost), 0)
-                FROM maintenance
-                WHERE vehicle_id = ?
-            )
-            WHERE id = ?
-        ''', (maintenance_data['vehicle_id'], maintenance_data['vehicle_id']))
+    # Recalcula custos adicionais do veículo
+    _recalculate_additional_costs(c, maintenance.vehicle_id)
+    return _fetch_vehicle(c, maintenance.vehicle_id), old_version, get_data_version(c)
 
-        # Atualiza o cache
-        c.execute('SELECT * FROM vehicles WHERE id = ?', (maintenance_data['vehicle_id'],))
-        vehicle = dict(c.fetchone())
-        update_vehicle_in_cache(maintenance_data['vehicle_id'], vehicle)
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+def update_maintenance(maintenance_id, maintenance):
+    vehicle, old_version, new_version = get_writer().execute(
+        _update_maintenance, maintenance_id, _as_maintenance(maintenance)
+    )
+    if vehicle is None:
+        # Veículo excluído por outra sessão (as manutenções vão junto)
+        logger.warning(f"Veículo da manutenção {maintenance_id} não encontrado para atualização")
+        return
 
-def delete_maintenance(maintenance_id):
-    conn = get_db()
-    c = conn.cursor()
+    # Atualiza o cache
+    update_vehicle_in_cache(vehicle.id, vehicle, old_version, new_version)
+
+def _delete_maintenance(c, maintenance_id):
+    old_version = get_data_version(c)
+    vehicle = None
     
-    try:
-        # Inicia uma transação
-        c.execute('BEGIN TRANSACTION')
+    # Obtém o vehicle_id antes de deletar
+    c.execute('SELECT vehicle_id FROM maintenance WHERE id = ?', (maintenance_id,))
+    result = c.fetchone()
+    
+    if result:
+        vehicle_id = result[0]
         
-        # Obtém o vehicle_id antes de deletar
-        c.execute('SELECT vehicle_id FROM maintenance WHERE id = ?', (maintenance_id,))
-        result = c.fetchone()
+        # Remove a manutenção
+        c.execute('DELETE FROM maintenance WHERE id = ?', (maintenance_id,))
         
-        if result:
-            vehicle_id = result[0]
-            
-            # Remove a manutenção
-            c.execute('DELETE FROM maintenance WHERE id = ?', (maintenance_id,))
-            
-            # Recalcula o total de custos adicionais
-            c.execute('''
-                UPDATE vehicles 
-                SET additional_costs = (
-                    SELECT COALESCE(SUM(cost), 0)
-                    FROM maintenance
-                    WHERE vehicle_id = ?
-                )
-                WHERE id = ?
-            ''', (vehicle_id, vehicle_id))
-            
-        # Confirma a transação
-        c.execute('COMMIT')
-        conn.commit()
-    except Exception as e:
-        c.execute('ROLLBACK')
-        raise e
-    finally:
-        conn.close()
+        # Recalcula o total de custos adicionais
+        _recalculate_additional_costs(c, vehicle_id)
+        vehicle = _fetch_vehicle(c, vehicle_id)
+    return vehicle, old_version, get_data_version(c)
+
+def delete_maintenance(maintenance_id):
+    vehicle, old_version, new_version = get_writer().execute(_delete_maintenance, maintenance_id)
+
+    # Atualiza o cache com o novo total de custos
+    if vehicle is not None:
+        update_vehicle_in_cache(vehicle.id, vehicle, old_version, new_version)
 
 def get_all_maintenance_records():
     conn = get_db()
-    conn.row_factory = sqlite3.Row
+    conn.row_factory = MaintenanceReport.row_factory()
     c = conn.cursor()
     c.execute('''
         SELECT m.*, v.brand, v.model, v.year
@@ -371,22 +910,104 @@ def get_all_maintenance_records():
         JOIN vehicles v ON m.vehicle_id = v.id
         ORDER BY m.date DESC
     ''')
-    maintenance_records = [dict(row) for row in c.fetchall()]
+    maintenance_records = c.fetchall()
     conn.close()
     return maintenance_records
 
-def get_vehicle_by_details(brand, model, year, color):
-    """Retorna um veículo específico baseado nos detalhes"""
+DUE_WINDOW_DAYS = 30
+
+# Manutenções com próxima data até `end` (vencidas incluídas), lidas pelo
+# índice parcial de next_maintenance_date. Só vale a previsão mais recente
+# de cada veículo: uma manutenção posterior que também agenda a próxima
+# substitui a anterior; uma sem agendamento (ex.: lavagem) não a cancela.
+DUE_MAINTENANCE_QUERY = '''
+    SELECT m.id, m.vehicle_id, v.brand, v.model, v.year, m.description, m.next_maintenance_date
+    FROM maintenance m
+    JOIN vehicles v ON v.id = m.vehicle_id
+    WHERE m.next_maintenance_date IS NOT NULL AND m.next_maintenance_date <= :end
+      AND NOT EXISTS (
+          SELECT 1 FROM maintenance later
+          WHERE later.vehicle_id = m.vehicle_id
+            AND later.next_maintenance_date IS NOT NULL
+            AND (later.date > m.date OR (later.date = m.date AND later.id > m.id))
+      )
+    ORDER BY m.next_maintenance_date
+'''
+
+def get_due_maintenance(within_days=DUE_WINDOW_DAYS, today=None):
+    """Manutenções da frota vencidas ou que vencem nos próximos `within_days` dias"""
+    today = today or datetime.now().date()
+    end = (today + timedelta(days=within_days)).strftime('%Y-%m-%d')
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(DUE_MAINTENANCE_QUERY, {'end': end})
+    columns = [col[0] for col in c.description]
+    due = [dict(zip(columns, row)) for row in c.fetchall()]
+    conn.close()
+    return due
+
+def _refresh_due_maintenance(c, end, computed_on):
+    c.execute('DELETE FROM due_maintenance')
+    c.execute(f'''
+        INSERT INTO due_maintenance (maintenance_id, vehicle_id, brand, model, year,
+                                     description, due_date, computed_on)
+        SELECT due.*, :computed_on FROM ({DUE_MAINTENANCE_QUERY}) AS due
+    ''', {'end': end, 'computed_on': computed_on})
+    return c.rowcount
+
+def refresh_due_maintenance(within_days=DUE_WINDOW_DAYS, today=None):
+    """Recalcula a tabela due_maintenance exibida na página principal"""
+    today = today or datetime.now().date()
+    end = (today + timedelta(days=within_days)).strftime('%Y-%m-%d')
+    return get_writer().execute(_refresh_due_maintenance, end, today.strftime('%Y-%m-%d'))
+
+def get_scheduled_due_maintenance():
+    """Lê a lista materializada de manutenções a vencer"""
     conn = get_db()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
+    c.execute('SELECT * FROM due_maintenance ORDER BY due_date')
+    due = [dict(row) for row in c.fetchall()]
+    conn.close()
+    return due
+
+def _claim_scheduled_task(c, name, run_on):
     c.execute('''
-        SELECT * FROM vehicles 
+        INSERT INTO scheduled_tasks (name, last_run) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET last_run = excluded.last_run
+        WHERE last_run < excluded.last_run
+    ''', (name, run_on))
+    return c.rowcount > 0
+
+def claim_scheduled_task(name, run_on):
+    """Marca a tarefa como executada em `run_on`; falso se já rodou nesse dia
+
+    Como a marcação passa pela thread de escrita, só um processo/sessão
+    consegue reservar cada execução.
+    """
+    return get_writer().execute(_claim_scheduled_task, name, run_on)
+
+def _release_scheduled_task(c, name, run_on):
+    c.execute('''
+        UPDATE scheduled_tasks SET last_run = date(?, '-1 day') WHERE name = ? AND last_run = ?
+    ''', (run_on, name, run_on))
+
+def release_scheduled_task(name, run_on):
+    """Desfaz a reserva de `run_on` (a tarefa falhou): a próxima verificação tenta de novo"""
+    get_writer().execute(_release_scheduled_task, name, run_on)
+
+def get_vehicle_by_details(brand, model, year, color):
+    """Retorna um veículo específico baseado nos detalhes"""
+    conn = get_db()
+    conn.row_factory = Vehicle.row_factory(get_vehicle_image)
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT {VEHICLE_COLUMNS} FROM vehicles 
         WHERE brand = ? AND model = ? AND year = ? AND color = ?
     ''', (brand, model, year, color))
     vehicle = c.fetchone()
     conn.close()
-    return dict(vehicle) if vehicle else None
+    return vehicle
 
 def get_maintenance_totals_by_author():
     """Retorna o total de manutenções por autor"""
@@ -406,3 +1027,474 @@ def get_maintenance_totals_by_author():
         totals[author] = total
     
     return totals
+
+# Relatório consolidado das garagens: os bancos são anexados (ATTACH, somente
+# leitura) em lotes a uma conexão em memória, sem copiar dados; cada lote roda
+# em uma thread, e o SQLite libera o GIL enquanto executa a consulta.
+ATTACH_BATCH_SIZE = 8  # O SQLite aceita no máximo 10 bancos anexados por conexão
+REPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+TENANT_SUMMARY_QUERY = '''
+    SELECT ?, COUNT(*), COALESCE(SUM(v.purchase_price + v.additional_costs), 0),
+           COALESCE(SUM(v.fipe_price), 0),
+           (SELECT COUNT(*) FROM {schema}.maintenance),
+           (SELECT COALESCE(SUM(cost), 0) FROM {schema}.maintenance)
+    FROM {schema}.vehicles v
+'''
+TENANT_BRAND_QUERY = '''
+    SELECT brand, purchase_price + additional_costs AS invested, fipe_price
+    FROM {schema}.vehicles
+'''
+
+def _attach_readonly(conn, path, schema):
+    uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (uri,))
+
+def _summarize_tenants(batch):
+    """Resumo por garagem e por marca de um lote de garagens anexadas à mesma conexão"""
+    conn = sqlite3.connect("file::memory:", uri=True)
+    try:
+        schemas = []
+        for i, (tenant, path) in enumerate(batch):
+            _attach_readonly(conn, path, f"t{i}")
+            schemas.append((tenant, f"t{i}"))
+        summary = conn.execute(
+            ' UNION ALL '.join(TENANT_SUMMARY_QUERY.format(schema=schema) for _, schema in schemas),
+            [tenant for tenant, _ in schemas]
+        ).fetchall()
+        by_brand = conn.execute(f'''
+            SELECT brand, COUNT(*), SUM(invested), SUM(fipe_price)
+            FROM ({' UNION ALL '.join(TENANT_BRAND_QUERY.format(schema=schema) for _, schema in schemas)})
+            GROUP BY brand
+        ''').fetchall()
+        return summary, by_brand
+    finally:
+        conn.close()
+
+def get_tenants_report(tenants=None):
+    """Totais de cada garagem, totais por marca somando todas e o total geral"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    tenants = [tenant for tenant in (tenants or list_tenants()) if os.path.exists(get_db_path(tenant))]
+    paths = [(tenant, get_db_path(tenant)) for tenant in tenants]
+    batches = [paths[i:i + ATTACH_BATCH_SIZE] for i in range(0, len(paths), ATTACH_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=max(1, min(REPORT_WORKERS, len(batches)))) as executor:
+        results = list(executor.map(_summarize_tenants, batches))
+
+    report = {'tenants': [], 'by_brand': {}, 'totals': dict.fromkeys(
+        ('vehicles', 'invested', 'fipe_value', 'maintenance_records', 'maintenance_cost'), 0)}
+    for summary, by_brand in results:
+        for tenant, vehicles, invested, fipe_value, records, maintenance_cost in summary:
+            row = {'vehicles': vehicles, 'invested': invested, 'fipe_value': fipe_value,
+                   'maintenance_records': records, 'maintenance_cost': maintenance_cost}
+            for field, value in row.items():
+                report['totals'][field] += value
+            report['tenants'].append(dict(row, tenant=tenant, name=get_tenant_name(tenant)))
+        for brand, vehicles, invested, fipe_value in by_brand:
+            totals = report['by_brand'].setdefault(brand, {'brand': brand, 'vehicles': 0, 'invested': 0, 'fipe_value': 0})
+            totals['vehicles'] += vehicles
+            totals['invested'] += invested
+            totals['fipe_value'] += fipe_value
+    report['by_brand'] = sorted(report['by_brand'].values(), key=lambda row: row['invested'], reverse=True)
+    return report
+
+def get_tenants_fleet_models():
+    """Pares (marca, modelo) da frota de todas as garagens, para o aquecimento do cache FIPE"""
+    models = set()
+    for tenant in list_tenants():
+        if os.path.exists(get_db_path(tenant)):
+            with tenant_context(tenant):
+                models.update(get_fleet_models())
+    return sorted(models)
+
+def _insert_fipe_prices(c, prices, conflict='OR REPLACE'):
+    c.execute(FIPE_PRICE_HISTORY_TABLE)  # O banco principal pode ainda não ter passado pelo init_db
+    c.executemany(f'''
+        INSERT {conflict} INTO fipe_price_history (fipe_code, model_year, reference_month, value)
+        VALUES (?, ?, ?, ?)
+    ''', prices)
+
+# A série histórica é da tabela FIPE, não de uma garagem: como o cache FIPE,
+# é compartilhada e fica no banco da garagem principal. Assim um preço vindo
+# do cache (consultado por outra garagem ou pelo aquecimento) já está na série.
+def record_fipe_price(fipe_code, model_year, reference_month, value):
+    """Guarda um preço FIPE consultado na série histórica (um por mês de referência)"""
+    with tenant_context(DEFAULT_TENANT):
+        get_writer().execute(_insert_fipe_prices, [(fipe_code, model_year, reference_month, value)])
+
+def get_fipe_price_history(fipe_codes=None):
+    """Retorna (fipe_code, model_year, reference_month, value) da série histórica compartilhada
+
+    Com `fipe_codes`, só as séries desses códigos, pela chave primária.
+    """
+    with tenant_context(DEFAULT_TENANT):
+        conn = get_db()
+    c = conn.cursor()
+    if fipe_codes is None:
+        c.execute('SELECT fipe_code, model_year, reference_month, value FROM fipe_price_history')
+    else:
+        c.execute('''
+            SELECT fipe_code, model_year, reference_month, value FROM fipe_price_history
+            WHERE fipe_code IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted(set(fipe_codes))),))
+    history = c.fetchall()
+    conn.close()
+    return history
+
+JOB_COLUMNS = '''id, kind, params, status, progress, message, result, error, worker_pid,
+    created_at, started_at, finished_at'''
+
+def _job_from_row(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+def _enqueue_job(c, kind, params):
+    c.execute(
+        'INSERT INTO jobs (kind, params, created_at) VALUES (?, ?, ?)',
+        (kind, json.dumps(params), datetime.now().isoformat(timespec='seconds'))
+    )
+    return c.lastrowid
+
+def enqueue_job(kind, params=None):
+    """Coloca uma tarefa na fila e retorna o id dela"""
+    return get_writer().execute(_enqueue_job, kind, params or {})
+
+def _claim_job(c, worker_pid):
+    c.execute(f'''
+        UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?
+        WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+        RETURNING {JOB_COLUMNS}
+    ''', (worker_pid, datetime.now().isoformat(timespec='seconds')))
+    rows = c.fetchall()  # Lê até o fim para a instrução terminar antes do SAVEPOINT
+    if not rows:
+        return None
+    return _job_from_row(zip((col[0] for col in c.description), rows[0]))
+
+def claim_job(worker_pid):
+    """Reserva a tarefa mais antiga da fila para o processo; None se a fila está vazia
+
+    A fila é consultada antes só com leitura, para que processos ociosos
+    não abram transações de escrita a cada verificação.
+    """
+    conn = get_db()
+    queued = conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone()
+    conn.close()
+    if queued is None:
+        return None
+    return get_writer().execute(_claim_job, worker_pid)
+
+def _update_job_progress(c, job_id, progress, message):
+    c.execute(
+        "UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ? AND status = 'running'",
+        (progress, message, job_id)
+    )
+
+def update_job_progress(job_id, progress, message=None):
+    """Grava o progresso (0 a 1) sem esperar o commit"""
+    get_writer().submit(_update_job_progress, job_id, progress, message)
+
+def _finish_job(c, job_id, status, result, error):
+    c.execute('''
+        UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?,
+               progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END
+        WHERE id = ?
+    ''', (status, json.dumps(result) if result is not None else None, error,
+          datetime.now().isoformat(timespec='seconds'), status, job_id))
+
+def finish_job(job_id, result=None, error=None):
+    """Marca a tarefa como concluída ('done') ou, com `error`, como 'failed'"""
+    get_writer().execute(_finish_job, job_id, 'failed' if error else 'done', result, error)
+
+def get_jobs(limit=20, active=None):
+    """Tarefas mais recentes, da mais nova para a mais antiga
+
+    `active=True` traz só as da fila e em execução; `active=False`, só as encerradas.
+    """
+    where = {None: '', True: "WHERE status IN ('queued', 'running')",
+             False: "WHERE status NOT IN ('queued', 'running')"}[active]
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(f'SELECT {JOB_COLUMNS} FROM jobs {where} ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    conn.close()
+    return [_job_from_row(row) for row in rows]
+
+def get_job(job_id):
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    row = conn.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    conn.close()
+    return _job_from_row(row) if row is not None else None
+
+def get_running_jobs():
+    """(id, worker_pid) das tarefas marcadas como em execução"""
+    conn = get_db()
+    rows = conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'").fetchall()
+    conn.close()
+    return rows
+
+def export_vehicles(progress=None):
+    """Monta o backup completo (veículos com fotos e manutenções) como dict
+
+    `progress(feitos, total)` é chamado a cada veículo.
+    """
+    vehicles = get_vehicles()
+
+    # Sequência lida antes dos dados: alterações feitas durante a exportação
+    # entram de novo na próxima exportação incremental
+    sequence = get_change_sequence()
+
+    # Adiciona manutenções para cada veículo; as fotos são lidas uma a uma
+    vehicles_data = []
+    for i, vehicle in enumerate(vehicles):
+        vehicle_data = vehicle.to_dict(include_image=True)
+        vehicle_data['maintenance'] = [record.to_dict() for record in get_vehicle_maintenance(vehicle.id)]
+        vehicles_data.append(vehicle_data)
+        if progress is not None:
+            progress(i + 1, len(vehicles))
+
+    return {
+        'vehicles': vehicles_data,
+        'export_date': datetime.now().isoformat(),
+        'sequence': sequence
+    }
+
+def get_change_sequence(c=None):
+    """Retorna o último número de sequência do log de alterações"""
+    if c is not None:
+        return c.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    conn = get_db()
+    try:
+        return get_change_sequence(conn.cursor())
+    finally:
+        conn.close()
+
+# Linhas do log mais antigas que isto são apagadas pela tarefa diária; quem
+# sincroniza depois disso recebe a exportação completa (ver export_changes)
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get("CHANGE_LOG_RETENTION_DAYS", "90"))
+
+def _change_log_floor(c):
+    """Última sequência já apagada do log (0 se nada foi podado)"""
+    # AUTOINCREMENT não reaproveita números e um rollback desfaz o contador:
+    # sem poda, a primeira linha é a sequência 1
+    return c.execute('SELECT COALESCE(MIN(seq), 1) - 1 FROM change_log').fetchone()[0]
+
+def _prune_change_log(c, retention_days):
+    # A última linha fica sempre: é ela que dá a sequência atual
+    floor = c.execute('''
+        SELECT MIN(MAX(seq), (SELECT MAX(seq) FROM change_log) - 1) FROM change_log
+        WHERE changed_at < datetime('now', ?)
+    ''', (f'-{retention_days} days',)).fetchone()[0]
+    if not floor:
+        return 0
+    c.execute('DELETE FROM change_log WHERE seq <= ?', (floor,))
+    return c.rowcount
+
+def prune_change_log(retention_days=CHANGE_LOG_RETENTION_DAYS):
+    """Apaga do log as alterações com mais de `retention_days` dias e retorna quantas"""
+    pruned = get_writer().execute(_prune_change_log, retention_days)
+    if pruned:
+        logger.info(f"Log de alterações: {pruned} linha(s) com mais de {retention_days} dias apagada(s)")
+    return pruned
+
+def export_changes(since_seq=0, include_images=True):
+    """Exporta as alterações em vehicles/maintenance posteriores a `since_seq`
+
+    Cada linha alterada aparece uma vez, com seu estado atual (ou como
+    exclusão). A foto só é incluída se mudou no intervalo; com
+    `include_images=False` ela é trocada pelo indicador 'has_image'.
+
+    Se parte do intervalo já foi podada do log (prune_change_log), as
+    exclusões não são mais conhecidas: a exportação é completa e marcada
+    com 'reset', para quem a aplica descartar as linhas que não vieram.
+    """
+    conn = get_db()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN')
+        until_seq = get_change_sequence(c)
+        reset = 0 < since_seq < _change_log_floor(c)
+        changes = {
+            'since': since_seq,
+            'until': until_seq,
+            'export_date': datetime.now().isoformat(),
+            'reset': reset,
+        }
+        for table in ('vehicles', 'maintenance'):
+            columns = [col[1] for col in c.execute(f'PRAGMA table_info({table})')]
+            if table == 'vehicles' and not include_images:
+                # Sem fotos: nem lê os blobs, só o indicador
+                columns = [f't.{col}' for col in columns if col != 'image_data']
+                columns.append('t.image_data IS NOT NULL AS has_image')
+            else:
+                columns = [f't.{col}' for col in columns]
+            if since_seq == 0 or reset:
+                # Exportação completa: inclui também as linhas anteriores ao log
+                c.execute(f'''
+                    SELECT {', '.join(columns)}, t.id AS change_row_id, 1 AS change_image
+                    FROM {table} t
+                ''')
+            else:
+                c.execute(f'''
+                    SELECT {', '.join(columns)}, ch.row_id AS change_row_id, ch.image_changed AS change_image
+                    FROM (
+                        SELECT row_id, MAX(image_changed) AS image_changed
+                        FROM change_log
+                        WHERE seq > ? AND seq <= ? AND table_name = ?
+                        GROUP BY row_id
+                    ) ch
+                    LEFT JOIN {table} t ON t.id = ch.row_id
+                ''', (since_seq, until_seq, table))
+
+            upserts = []
+            deletes = []
+            for current in c.fetchall():
+                row = dict(current)
+                row_id, image_changed = row.pop('change_row_id'), row.pop('change_image')
+                if row['id'] is None:
+                    deletes.append(row_id)
+                    continue
+                if table == 'vehicles' and include_images and not image_changed:
+                    row.pop('image_data')
+                upserts.append(row)
+            changes[table] = {'upserts': upserts, 'deletes': deletes}
+        conn.commit()
+        return changes
+    finally:
+        conn.close()
+
+def _upsert_rows(c, table, rows):
+    """Insere ou atualiza linhas mantendo o id de origem"""
+    columns = {col[1] for col in c.execute(f'PRAGMA table_info({table})')}
+    for row in rows:
+        fields = [field for field in row if field in columns]
+        updates = ', '.join(f'{field} = excluded.{field}' for field in fields if field != 'id')
+        c.execute(f'''
+            INSERT INTO {table} ({', '.join(fields)})
+            VALUES ({', '.join('?' for _ in fields)})
+            ON CONFLICT(id) DO UPDATE SET {updates}
+        ''', [row[field] for field in fields])
+
+def _apply_changes(c, changes):
+    if changes.get('reset'):
+        # Exportação completa no lugar do intervalo podado: o que não veio foi excluído
+        for table in ('maintenance', 'vehicles'):
+            ids = [row['id'] for row in changes[table]['upserts']]
+            c.execute(f'DELETE FROM {table} WHERE id NOT IN (SELECT value FROM json_each(?))', (json.dumps(ids),))
+    _upsert_rows(c, 'vehicles', changes['vehicles']['upserts'])
+    _upsert_rows(c, 'maintenance', changes['maintenance']['upserts'])
+    c.executemany('DELETE FROM maintenance WHERE id = ?',
+                  [(row_id,) for row_id in changes['maintenance']['deletes']])
+    c.executemany('DELETE FROM maintenance WHERE vehicle_id = ?',
+                  [(row_id,) for row_id in changes['vehicles']['deletes']])
+    c.executemany('DELETE FROM vehicles WHERE id = ?',
+                  [(row_id,) for row_id in changes['vehicles']['deletes']])
+
+def apply_changes(changes):
+    """Aplica um arquivo gerado por export_changes neste banco, numa única transação"""
+    get_writer().execute(_apply_changes, changes)
+    return {
+        table: len(changes[table]['upserts']) + len(changes[table]['deletes'])
+        for table in ('vehicles', 'maintenance')
+    }
+
+# Sincronização de clientes offline: o cliente baixa as alterações com
+# export_changes e envia as manutenções gravadas sem conexão com sync_push
+SYNC_MAINTENANCE_FIELDS = ('date', 'description', 'cost', 'mileage', 'author', 'next_maintenance_date')
+
+def _last_server_change(c, maintenance_id, base_seq):
+    """Horário da última alteração da manutenção no servidor depois de `base_seq` (ou None)"""
+    changed_at = c.execute('''
+        SELECT MAX(changed_at) FROM change_log
+        WHERE table_name = 'maintenance' AND row_id = ? AND seq > ?
+    ''', (maintenance_id, base_seq)).fetchone()[0]
+    if changed_at is None and base_seq < _change_log_floor(c):
+        # Parte do intervalo foi podada: uma alteração apagada do log é
+        # anterior à linha mais antiga que restou e conta como feita nela
+        changed_at = c.execute('SELECT MIN(changed_at) FROM change_log').fetchone()[0]
+    return changed_at
+
+def _merge_maintenance(op, current, server_changed_at):
+    """Junta campo a campo a edição do cliente com a versão atual do servidor
+
+    Campos alterados só de um lado ficam com esse lado. Se os dois lados
+    mudaram o mesmo campo para valores diferentes, vence a edição mais
+    recente (horário UTC do cliente contra o do log de alterações).
+    """
+    merged = dict(current)
+    conflicts = []
+    for field in SYNC_MAINTENANCE_FIELDS:
+        client_value, base_value = op['data'].get(field), op['base'].get(field)
+        if client_value == base_value:
+            continue
+        if current[field] != base_value and current[field] != client_value:
+            client_wins = server_changed_at is None or op['edited_at'] > server_changed_at
+            conflicts.append({
+                'field': field, 'client': client_value, 'server': current[field],
+                'winner': 'client' if client_wins else 'server',
+            })
+            if not client_wins:
+                continue
+        merged[field] = client_value
+    return merged, conflicts
+
+def _apply_sync_op(c, op):
+    kind = op['kind']
+    if kind == 'insert':
+        vehicle_id = op['data']['vehicle_id']
+        if c.execute('SELECT 1 FROM vehicles WHERE id = ?', (vehicle_id,)).fetchone() is None:
+            return {'status': 'rejected', 'reason': 'vehicle_deleted'}
+        maintenance = Maintenance.from_dict(dict(
+            {field: op['data'].get(field) for field in SYNC_MAINTENANCE_FIELDS}, vehicle_id=vehicle_id
+        ))
+        maintenance.author = maintenance.author or ''
+        _insert_maintenance(c, maintenance)
+        return {'status': 'applied', 'id': c.execute('SELECT last_insert_rowid()').fetchone()[0]}
+
+    maintenance_id = op['id']
+    row = c.execute('SELECT * FROM maintenance WHERE id = ?', (maintenance_id,)).fetchone()
+    if row is None:
+        return {'status': 'rejected', 'reason': 'deleted_on_server', 'id': maintenance_id}
+    current = dict(zip((col[0] for col in c.description), row))
+    server_changed_at = _last_server_change(c, maintenance_id, op['base_seq'])
+
+    if kind == 'delete':
+        if server_changed_at is not None:
+            # Editada no servidor depois que o cliente a viu: a edição é mantida
+            return {'status': 'rejected', 'reason': 'changed_on_server', 'id': maintenance_id}
+        _delete_maintenance(c, maintenance_id)
+        return {'status': 'applied', 'id': maintenance_id}
+
+    merged, conflicts = _merge_maintenance(op, current, server_changed_at)
+    _update_maintenance(c, maintenance_id, Maintenance.from_dict(merged))
+    return {'status': 'merged' if conflicts else 'applied', 'id': maintenance_id, 'conflicts': conflicts}
+
+def _sync_push(c, client_id, ops):
+    results = []
+    for op in ops:
+        stored = c.execute(
+            'SELECT result FROM sync_ops WHERE client_id = ? AND op_id = ?', (client_id, op['op_id'])
+        ).fetchone()
+        if stored is not None:
+            results.append(dict(json.loads(stored[0]), duplicate=True))
+            continue
+        result = dict(_apply_sync_op(c, op), op_id=op['op_id'])
+        c.execute(
+            'INSERT INTO sync_ops (client_id, op_id, result, applied_at) VALUES (?, ?, ?, ?)',
+            (client_id, op['op_id'], json.dumps(result), datetime.now().isoformat(timespec='seconds'))
+        )
+        results.append(result)
+    return {'results': results, 'sequence': get_change_sequence(c)}
+
+def sync_push(client_id, ops):
+    """Aplica as manutenções gravadas offline por um cliente, numa única transação
+
+    Cada operação tem `op_id` único (reenvios são ignorados), `kind`
+    ('insert', 'update' ou 'delete'), `data` com os campos, `base` com a
+    linha como o cliente a viu e `base_seq`, a sequência do log de
+    alterações na última sincronização do cliente. Retorna o resultado de
+    cada operação (com o id definitivo das inserções e os conflitos).
+    """
+    return get_writer().execute(_sync_push, client_id, ops)
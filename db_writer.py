@@ -0,0 +1,107 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from logger import setup_logger
+
+logger = setup_logger('db_writer')
+
+MAX_BATCH_SIZE = 64          # Operações por commit
+SLOW_COMMIT_SECONDS = 0.5    # Commits acima disso são registrados no log
+
+class DatabaseWriter:
+    """Thread única de escrita em um arquivo SQLite, com commit em grupo
+
+    As sessões enviam operações `op(cursor, *args)` pela fila e recebem um
+    Future. A thread junta o que estiver na fila em uma única transação
+    (cada operação em seu próprio SAVEPOINT, para que uma falha não desfaça
+    as outras) e faz um único commit/fsync para o grupo todo.
+    """
+
+    def __init__(self, path, max_batch_size=MAX_BATCH_SIZE):
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'commits': 0,
+            'operations': 0,
+            'failed_operations': 0,
+            'max_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=f"db-writer-{path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, *args):
+        future = Future()
+        self._queue.put((future, operation, args))
+        return future
+
+    def execute(self, operation, *args):
+        """Envia a operação e espera o resultado (ou a exceção) dela"""
+        return self.submit(operation, *args).result()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_commit_ms'] = stats['total_commit_ms'] / stats['commits'] if stats['commits'] else 0.0
+        return stats
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        c = conn.cursor()
+        results = []
+        start = time.perf_counter()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            for future, operation, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                c.execute('SAVEPOINT op')
+                try:
+                    results.append((future, operation(c, *args), None))
+                    c.execute('RELEASE op')
+                except Exception as e:
+                    c.execute('ROLLBACK TO op')
+                    c.execute('RELEASE op')
+                    results.append((future, None, e))
+            c.execute('COMMIT')
+        except Exception as e:
+            logger.error(f"Erro no commit do grupo de {len(batch)} operação(ões): {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats['commits'] += 1
+            self._stats['operations'] += len(results)
+            self._stats['failed_operations'] += sum(1 for _, _, error in results if error)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            self._stats['last_commit_ms'] = elapsed_ms
+            self._stats['total_commit_ms'] += elapsed_ms
+        if elapsed_ms > SLOW_COMMIT_SECONDS * 1000:
+            logger.warning(f"Commit lento: {elapsed_ms:.0f} ms para {len(batch)} operação(ões)")
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,93 @@
+"""Depreciação e valor de revenda a partir da série histórica de preços FIPE"""
+from datetime import date
+import numpy as np
+import pandas as pd
+from database import get_fipe_price_history
+from fipe_api import model_year_from_name
+
+SERIES_KEY = ['fipe_code', 'model_year']
+
+def history_frame(rows):
+    """DataFrame da série histórica com o mês de referência como inteiro (ano*12 + mês-1)"""
+    history = pd.DataFrame(rows, columns=['fipe_code', 'model_year', 'reference_month', 'value'])
+    history['month'] = (history['reference_month'].str.slice(0, 4).astype(int) * 12
+                        + history['reference_month'].str.slice(5, 7).astype(int) - 1)
+    return history
+
+def depreciation_curves(history):
+    """Ajusta log(valor) = a + b·mês para cada série (código FIPE, ano-modelo)
+
+    O ajuste por mínimos quadrados é feito para todas as séries de uma vez,
+    com somas agregadas pelo groupby. Séries com um único mês recebem a
+    mediana das inclinações ajustadas (ou zero, se nenhuma tiver histórico).
+    `monthly_rate` é a variação mensal do valor (negativa quando deprecia).
+    """
+    if history.empty:
+        # Mesmo índice e tipos das curvas ajustadas, para o merge e as contas de project_values
+        columns = {'months': int, 'last_month': int, 'last_reference': object, 'last_value': float,
+                   'slope': float, 'monthly_rate': float, 'fitted': bool}
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in columns.items()},
+                            index=pd.MultiIndex.from_arrays([[], []], names=SERIES_KEY))
+
+    df = history.assign(t=history['month'] - history['month'].min(), y=np.log(history['value']))
+    df['tt'] = df['t'] * df['t']
+    df['ty'] = df['t'] * df['y']
+    sums = df.groupby(SERIES_KEY).agg(
+        months=('t', 'size'), st=('t', 'sum'), sy=('y', 'sum'), stt=('tt', 'sum'), sty=('ty', 'sum')
+    )
+    denominator = sums['months'] * sums['stt'] - sums['st'] ** 2
+    numerator = sums['months'] * sums['sty'] - sums['st'] * sums['sy']
+    fitted = denominator > 0
+    slope = (numerator / denominator.where(fitted)).astype(float)
+    fallback = slope[fitted].median() if fitted.any() else 0.0
+    slope = slope.fillna(fallback)
+
+    latest = df.sort_values('month').groupby(SERIES_KEY).last()
+    curves = pd.DataFrame({
+        'months': sums['months'],
+        'last_month': latest['month'],
+        'last_reference': latest['reference_month'],
+        'last_value': latest['value'],
+        'slope': slope,
+        'monthly_rate': np.expm1(slope),
+        'fitted': fitted,
+    })
+    return curves
+
+def project_values(vehicles, curves, today=None):
+    """Valor projetado de cada veículo na data de venda planejada
+
+    Parte do último preço da série do veículo e aplica a taxa ajustada pelos
+    meses até a venda. Sem data planejada, projeta para hoje.
+    """
+    today = pd.Timestamp(today or date.today())
+    fleet = pd.DataFrame({
+        'id': [v.id for v in vehicles],
+        'vehicle': [f"{v.brand} {v.model} ({v.year})" for v in vehicles],
+        'fipe_code': [v.fipe_code for v in vehicles],
+        'model_year': [model_year_from_name(v.year) for v in vehicles],
+        'planned_sale_date': [v.planned_sale_date for v in vehicles],
+        'total_cost': [v.purchase_price + v.additional_costs for v in vehicles],
+        'fipe_price': [v.fipe_price for v in vehicles],
+    })
+    fleet = fleet.merge(curves, left_on=SERIES_KEY, right_index=True, how='left')
+
+    # Veículos sem série partem do fipe_price atual com a taxa mediana da frota
+    fitted = curves['fitted'].astype(bool)
+    fallback = curves.loc[fitted, 'slope'].median() if fitted.any() else 0.0
+    sale_date = pd.to_datetime(fleet['planned_sale_date'], errors='coerce').fillna(today)
+    sale_month = sale_date.dt.year * 12 + sale_date.dt.month - 1
+    base_month = fleet['last_month'].fillna(today.year * 12 + today.month - 1)
+    months_ahead = (sale_month - base_month).clip(lower=0)
+    base_value = fleet['last_value'].fillna(fleet['fipe_price'])
+
+    fleet['months_ahead'] = months_ahead.astype(int)
+    fleet['projected_value'] = base_value * np.exp(fleet['slope'].fillna(fallback) * months_ahead)
+    fleet['projected_result'] = fleet['projected_value'] - fleet['total_cost']
+    return fleet
+
+def fleet_projection(vehicles, today=None):
+    """Curvas de depreciação e projeção da frota, lendo só as séries dos seus códigos"""
+    codes = [v.fipe_code for v in vehicles if v.fipe_code]
+    history = history_frame(get_fipe_price_history(codes))
+    return project_values(vehicles, depreciation_curves(history), today)
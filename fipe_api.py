@@ -1,83 +1,248 @@
-import requests
-import pandas as pd
-from cache_manager import load_from_cache, save_to_cache
+import os
+import re
+import threading
+import time
+from cache_manager import cached_fetch_status, FIPE_CACHE_DURATION
+from database import record_fipe_price
 from logger import setup_logger
 
-BASE_URL = "https://parallelum.com.br/fipe/api/v1/carros"
+BASE_URL = os.environ.get("FIPE_BASE_URL", "https://parallelum.com.br/fipe/api/v1/carros")
 logger = setup_logger('fipe_api')
 
-def get_fipe_brands():
-    logger.info("Buscando marcas FIPE")
-    cached_data = load_from_cache('fipe_brands')
-    if cached_data is not None:
-        logger.debug("Dados de marcas encontrados no cache")
-        return pd.DataFrame(cached_data)
+# Intervalo do aquecimento em segundo plano; a cada rodada renova as entradas
+# que expirariam antes da próxima, então o cache da frota nunca chega a expirar
+PREFETCH_INTERVAL = FIPE_CACHE_DURATION / 4
+PREFETCH_REFRESH_WITHIN = PREFETCH_INTERVAL * 2
+
+MONTHS = ["janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+          "agosto", "setembro", "outubro", "novembro", "dezembro"]
+ZERO_KM_MODEL_YEAR = 32000  # Ano-modelo que a FIPE usa para veículos zero km
+
+REQUEST_TIMEOUT = float(os.environ.get("FIPE_REQUEST_TIMEOUT", "5"))        # Segundos por requisição
+BREAKER_FAILURES = int(os.environ.get("FIPE_BREAKER_FAILURES", "3"))        # Falhas seguidas para abrir
+BREAKER_RESET_SECONDS = float(os.environ.get("FIPE_BREAKER_RESET", "30"))   # Tempo aberto antes do teste
+
+class CircuitOpenError(Exception):
+    """A API FIPE está fora e o circuito não deixa a requisição sair"""
+
+class CircuitBreaker:
+    """Circuito que para de chamar a API depois de `failure_threshold` falhas seguidas
+
+    Aberto, falha na hora sem requisição. Depois de `reset_timeout` segundos
+    deixa passar uma única requisição de teste (meio-aberto): se ela der
+    certo o circuito fecha, se falhar volta a abrir.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'fechado', 'aberto', 'meio-aberto'
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def call(self, func, *args):
+        with self._lock:
+            state = self._state()
+            if state == self.OPEN:
+                raise CircuitOpenError("API FIPE indisponível, tentando novamente em instantes")
+            probe = state == self.HALF_OPEN
+            if probe:
+                self._probing = True
+        try:
+            result = func(*args)
+        except Exception:
+            with self._lock:
+                self._probing = False
+                self._failures += 1
+                if probe or self._failures >= self.failure_threshold:
+                    if self._opened_at is None or probe:
+                        logger.warning(f"Circuito da API FIPE aberto após {self._failures} falha(s)")
+                    self._opened_at = time.monotonic()
+            raise
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Circuito da API FIPE fechado")
+            self._probing = False
+            self._failures = 0
+            self._opened_at = None
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+breaker = CircuitBreaker()
+
+def parse_fipe_value(value):
+    """Converte 'R$ 12.345,67' em 12345.67"""
+    return float(value.replace('R$ ', '').replace('.', '').replace(',', '.'))
 
+def parse_reference_month(reference):
+    """Converte 'outubro de 2026' em '2026-10'"""
+    month, _, year = reference.strip().lower().partition(' de ')
+    return f"{int(year):04d}-{MONTHS.index(month) + 1:02d}"
+
+def model_year_from_name(year_name):
+    """Ano-modelo a partir do nome gravado em `vehicles.year` ('2015 Gasolina', 'Zero KM')"""
+    first = str(year_name or '').split(' ', 1)[0]
+    return int(first) if first.isdigit() else ZERO_KM_MODEL_YEAR
+
+def _record_price_history(data):
     try:
-        logger.debug("Fazendo requisição para API FIPE - marcas")
-        response = requests.get(f"{BASE_URL}/marcas")
+        record_fipe_price(
+            data['CodigoFipe'],
+            int(data['AnoModelo']),
+            parse_reference_month(data['MesReferencia']),
+            parse_fipe_value(data['Valor'])
+        )
+    except Exception as e:
+        logger.warning(f"Preço FIPE não guardado no histórico: {e}")
+
+def _request(path):
+    import requests  # Carregado só na primeira consulta à API
+    response = requests.get(f"{BASE_URL}{path}", timeout=REQUEST_TIMEOUT)
+    if response.status_code >= 500:
         response.raise_for_status()
-        data = response.json()
-        save_to_cache('fipe_brands', data)
+    return response
+
+def _get_json(path):
+    # Só erros de servidor e de conexão contam para o circuito; um 404 é da consulta
+    response = breaker.call(_request, path)
+    response.raise_for_status()
+    return response.json()
+
+def _frame(data, stale):
+    """DataFrame com `attrs['stale']` indicando se veio de um cache expirado"""
+    import pandas as pd
+    frame = pd.DataFrame(data)
+    frame.attrs['stale'] = stale
+    return frame
+
+def get_fipe_brands(refresh_within=None):
+    logger.info("Buscando marcas FIPE")
+
+    def fetch():
+        logger.debug("Fazendo requisição para API FIPE - marcas")
+        data = _get_json("/marcas")
         logger.info(f"Obtidas {len(data)} marcas da API FIPE")
-        return pd.DataFrame(data)
+        return data
+
+    try:
+        return _frame(*cached_fetch_status('fipe_brands', fetch, refresh_within=refresh_within))
     except Exception as e:
         logger.error(f"Erro ao obter marcas: {str(e)}")
         raise Exception("Erro ao obter marcas da tabela FIPE")
 
-def get_fipe_models(brand_code):
+def get_fipe_models(brand_code, refresh_within=None):
     logger.info(f"Buscando modelos para marca {brand_code}")
-    cached_data = load_from_cache(f'fipe_models_{brand_code}')
-    if cached_data is not None:
-        logger.debug(f"Dados de modelos para marca {brand_code} encontrados no cache")
-        return pd.DataFrame(cached_data)
 
-    try:
+    def fetch():
         logger.debug(f"Fazendo requisição para API FIPE - modelos da marca {brand_code}")
-        response = requests.get(f"{BASE_URL}/marcas/{brand_code}/modelos")
-        response.raise_for_status()
-        data = response.json()['modelos']
-        save_to_cache(f'fipe_models_{brand_code}', data)
+        data = _get_json(f"/marcas/{brand_code}/modelos")['modelos']
         logger.info(f"Obtidos {len(data)} modelos para marca {brand_code}")
-        return pd.DataFrame(data)
+        return data
+
+    try:
+        return _frame(*cached_fetch_status(f'fipe_models_{brand_code}', fetch, refresh_within=refresh_within))
     except Exception as e:
         logger.error(f"Erro ao obter modelos da marca {brand_code}: {str(e)}")
         raise Exception("Erro ao obter modelos da tabela FIPE")
 
-def get_fipe_years(brand_code, model_code):
+def get_fipe_years(brand_code, model_code, refresh_within=None):
     logger.info(f"Buscando anos para marca {brand_code}, modelo {model_code}")
-    cached_data = load_from_cache(f'fipe_years_{brand_code}_{model_code}')
-    if cached_data is not None:
-        logger.debug(f"Dados de anos encontrados no cache")
-        return pd.DataFrame(cached_data)
 
-    try:
+    def fetch():
         logger.debug(f"Fazendo requisição para API FIPE - anos")
-        response = requests.get(f"{BASE_URL}/marcas/{brand_code}/modelos/{model_code}/anos")
-        response.raise_for_status()
-        data = response.json()
-        save_to_cache(f'fipe_years_{brand_code}_{model_code}', data)
+        data = _get_json(f"/marcas/{brand_code}/modelos/{model_code}/anos")
         logger.info(f"Obtidos {len(data)} anos para o modelo")
-        return pd.DataFrame(data)
+        return data
+
+    try:
+        return _frame(*cached_fetch_status(f'fipe_years_{brand_code}_{model_code}', fetch, refresh_within=refresh_within))
     except Exception as e:
         logger.error(f"Erro ao obter anos: {str(e)}")
         raise Exception("Erro ao obter anos da tabela FIPE")
 
 def get_fipe_price(brand_code, model_code, year_code):
     logger.info(f"Buscando preço para marca {brand_code}, modelo {model_code}, ano {year_code}")
-    cached_data = load_from_cache(f'fipe_price_{brand_code}_{model_code}_{year_code}')
-    if cached_data is not None:
-        logger.debug("Dados de preço encontrados no cache")
-        return cached_data
 
-    try:
+    def fetch():
         logger.debug("Fazendo requisição para API FIPE - preço")
-        response = requests.get(f"{BASE_URL}/marcas/{brand_code}/modelos/{model_code}/anos/{year_code}")
-        response.raise_for_status()
-        data = response.json()
-        save_to_cache(f'fipe_price_{brand_code}_{model_code}_{year_code}', data)
+        data = _get_json(f"/marcas/{brand_code}/modelos/{model_code}/anos/{year_code}")
         logger.info(f"Preço obtido com sucesso: {data.get('Valor', 'N/A')}")
+        _record_price_history(data)
         return data
+
+    try:
+        data, stale = cached_fetch_status(f'fipe_price_{brand_code}_{model_code}_{year_code}', fetch)
+        return dict(data, stale=stale)
     except Exception as e:
         logger.error(f"Erro ao obter preço: {str(e)}")
         raise Exception("Erro ao obter preço da tabela FIPE")
+
+def prefetch_fipe_data(fleet_models, refresh_within=PREFETCH_REFRESH_WITHIN):
+    """Aquece o cache com as marcas e os modelos/anos das marcas da frota
+
+    `fleet_models` é uma lista de pares (marca, modelo) com os nomes FIPE
+    gravados em `vehicles`.
+    """
+    brands = get_fipe_brands(refresh_within=refresh_within)
+    brand_codes = dict(zip(brands['nome'], brands['codigo']))
+
+    models_by_brand = {}
+    for brand, model in fleet_models:
+        # Remove o sufixo " (1)" que add_vehicle acrescenta em duplicatas
+        models_by_brand.setdefault(brand, set()).add(re.sub(r" \(\d+\)$", "", model))
+
+    warmed = 0
+    for brand, model_names in models_by_brand.items():
+        brand_code = brand_codes.get(brand)
+        if brand_code is None:
+            logger.warning(f"Marca '{brand}' da frota não encontrada na tabela FIPE")
+            continue
+        try:
+            models = get_fipe_models(brand_code, refresh_within=refresh_within)
+            for model_code in models.loc[models['nome'].isin(model_names), 'codigo']:
+                get_fipe_years(brand_code, model_code, refresh_within=refresh_within)
+                warmed += 1
+        except Exception as e:
+            logger.warning(f"Falha ao aquecer cache da marca {brand}: {e}")
+    logger.info(f"Cache FIPE aquecido: {len(models_by_brand)} marca(s), {warmed} modelo(s)")
+
+_prefetch_thread = None
+_prefetch_lock = threading.Lock()
+
+def start_fipe_prefetch(load_fleet_models, interval=PREFETCH_INTERVAL):
+    """Inicia (uma vez por processo) a thread que mantém o cache FIPE aquecido"""
+    global _prefetch_thread
+    with _prefetch_lock:
+        if _prefetch_thread is not None and _prefetch_thread.is_alive():
+            return _prefetch_thread
+
+        def run():
+            while True:
+                try:
+                    prefetch_fipe_data(load_fleet_models())
+                except Exception as e:
+                    logger.error(f"Erro no aquecimento do cache FIPE: {e}")
+                time.sleep(interval.total_seconds())
+
+        _prefetch_thread = threading.Thread(target=run, name="fipe-prefetch", daemon=True)
+        _prefetch_thread.start()
+        logger.info("Aquecimento do cache FIPE iniciado")
+        return _prefetch_thread
@@ -0,0 +1,172 @@
+"""Índice de trigramas para achar os códigos FIPE a partir dos nomes gravados
+
+Os veículos antigos só têm os nomes FIPE (marca, modelo, ano), que podem
+ter ganhado o sufixo " (1)" ou mudado levemente na tabela. Cada lista da
+FIPE (marcas, modelos de uma marca, anos de um modelo) vira um índice em
+memória: o nome normalizado é procurado primeiro por igualdade e, se não
+houver, pelos trigramas em comum (coeficiente de Dice), consultando só as
+entradas que compartilham algum trigrama com o nome procurado.
+
+    python fipe_index.py   # preenche os códigos que faltam em todas as garagens
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from cache_manager import FIPE_CACHE_DURATION
+from database import get_vehicles, set_fipe_codes, split_model_suffix
+from fipe_api import get_fipe_brands, get_fipe_models, get_fipe_years
+from logger import setup_logger
+
+logger = setup_logger('fipe_index')
+
+MIN_SCORE = 0.6        # Semelhança mínima para aceitar marca e modelo
+YEAR_MIN_SCORE = 0.9   # Anos diferem em um ou dois dígitos: só variações de grafia passam
+INDEX_TTL = FIPE_CACHE_DURATION.total_seconds()  # Índices são refeitos junto com o cache FIPE
+BACKFILL_BATCH_SIZE = 500
+
+def normalize(name):
+    """Minúsculas, sem acentos e só com letras e números separados por espaço"""
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
+    """Índice de (código, nome) para busca aproximada pelo nome"""
+
+    def __init__(self, entries):
+        self.codes = []
+        self.names = []
+        self._sizes = []
+        self._exact = {}
+        self._postings = {}
+        for code, name in entries:
+            position = len(self.codes)
+            key = normalize(name)
+            grams = trigrams(key)
+            self.codes.append(code)
+            self.names.append(name)
+            self._sizes.append(len(grams))
+            self._exact.setdefault(key, position)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def search(self, name, limit=5, min_score=MIN_SCORE):
+        """As `limit` entradas mais parecidas como (código, nome, semelhança)"""
+        key = normalize(name)
+        position = self._exact.get(key)
+        if position is not None:
+            return [(self.codes[position], self.names[position], 1.0)]
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        scored = (
+            (2 * common / (len(grams) + self._sizes[position]), position)
+            for position, common in shared.items()
+        )
+        best = heapq.nlargest(limit, (item for item in scored if item[0] >= min_score))
+        return [(self.codes[position], self.names[position], score) for score, position in best]
+
+    def lookup(self, name, min_score=MIN_SCORE):
+        """Código da entrada mais parecida, ou None se nenhuma alcançar `min_score`"""
+        results = self.search(name, 1, min_score)
+        return results[0][0] if results else None
+
+class FipeCatalog:
+    """Índices das listas FIPE, montados na primeira consulta e refeitos após INDEX_TTL"""
+
+    def __init__(self, ttl=INDEX_TTL):
+        self.ttl = ttl
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index(self, key, load):
+        with self._lock:
+            entry = self._indexes.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
+        frame = load()
+        index = TrigramIndex(zip(frame['codigo'].astype(str), frame['nome']))
+        # Lista servida de um cache expirado (API fora): vale só para esta consulta
+        if not frame.attrs.get('stale'):
+            with self._lock:
+                self._indexes[key] = (index, time.monotonic())
+        return index
+
+    def brands(self):
+        return self._index(('brands',), get_fipe_brands)
+
+    def models(self, brand_code):
+        return self._index(('models', brand_code), lambda: get_fipe_models(brand_code))
+
+    def years(self, brand_code, model_code):
+        return self._index(('years', brand_code, model_code), lambda: get_fipe_years(brand_code, model_code))
+
+    def resolve(self, brand, model, year):
+        """(marca, modelo, ano) em códigos FIPE; None se algum dos nomes não for encontrado"""
+        brand_code = self.brands().lookup(brand)
+        if brand_code is None:
+            return None
+        model_code = self.models(brand_code).lookup(split_model_suffix(model)[0])
+        if model_code is None:
+            return None
+        year_code = self.years(brand_code, model_code).lookup(year, YEAR_MIN_SCORE)
+        if year_code is None:
+            return None
+        return brand_code, model_code, year_code
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+catalog = FipeCatalog()
+
+def vehicle_fipe_codes(vehicle):
+    """Códigos gravados no veículo ou, se faltarem, achados pelo nome; None se não achar"""
+    if vehicle.fipe_brand_code and vehicle.fipe_model_code and vehicle.fipe_year_code:
+        return vehicle.fipe_brand_code, vehicle.fipe_model_code, vehicle.fipe_year_code
+    return catalog.resolve(vehicle.brand, vehicle.model, vehicle.year)
+
+def backfill_fipe_codes(progress=None):
+    """Grava os códigos FIPE dos veículos da garagem ativa que ainda não os têm"""
+    missing = [v for v in get_vehicles() if not (v.fipe_brand_code and v.fipe_model_code and v.fipe_year_code)]
+    counts = {'updated': 0, 'not_found': 0}
+    updates = []
+    for i, vehicle in enumerate(missing):
+        try:
+            codes = catalog.resolve(vehicle.brand, vehicle.model, vehicle.year)
+        except Exception as e:
+            logger.warning(f"Erro ao buscar códigos FIPE do veículo {vehicle.id}: {e}")
+            codes = None
+        if codes is None:
+            counts['not_found'] += 1
+        else:
+            updates.append((vehicle.id, *codes))
+        if len(updates) >= BACKFILL_BATCH_SIZE:
+            counts['updated'] += set_fipe_codes(updates)
+            updates = []
+        if progress is not None:
+            progress(i + 1, len(missing))
+    if updates:
+        counts['updated'] += set_fipe_codes(updates)
+    logger.info(f"Códigos FIPE: {counts['updated']} veículo(s) atualizado(s), "
+                f"{counts['not_found']} não encontrado(s)")
+    return counts
+
+if __name__ == "__main__":
+    from database import init_tenants
+    from tenants import list_tenants, tenant_context
+
+    init_tenants()
+    for tenant in list_tenants():
+        with tenant_context(tenant):
+            print(tenant, backfill_fipe_codes())
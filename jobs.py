@@ -0,0 +1,256 @@
+"""Tarefas longas executadas por processos de trabalho, fora da sessão do Streamlit
+
+A fila fica na tabela `jobs` do banco: a página de administração enfileira
+a tarefa e acompanha o progresso; cada processo de trabalho reserva uma
+tarefa por vez, então várias rodam em paralelo, uma por núcleo. Como o
+estado está no banco, a tarefa continua mesmo que a sessão seja recarregada
+ou o navegador desconecte. Cada garagem tem sua fila, no seu banco; os
+processos percorrem as filas de todas as garagens.
+"""
+import json
+import os
+import time
+import uuid
+from dataclasses import replace
+from database import (
+    enqueue_job, claim_job, update_job_progress, finish_job, get_running_jobs,
+    import_vehicle, export_vehicles, create_backup, get_vehicles, update_vehicle, get_db_path,
+    reclaim_free_pages
+)
+from logger import setup_logger
+from tenants import list_tenants, tenant_dir, get_current_tenant, tenant_context
+
+logger = setup_logger('jobs')
+
+JOBS_DIR = "data/jobs"       # Arquivos de entrada e resultado das tarefas (garagem principal)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", min(4, os.cpu_count() or 1)))
+POLL_INTERVAL = 1.0          # Segundos entre verificações da fila por processo ocioso
+PROGRESS_INTERVAL = 0.5      # Intervalo mínimo entre gravações de progresso
+
+JOB_LABELS = {
+    'import_vehicles': "Importação de veículos",
+    'export_vehicles': "Exportação de veículos",
+    'backup': "Backup do banco",
+    'refresh_fipe_prices': "Atualização dos valores FIPE",
+    'backfill_fipe_codes': "Preenchimento dos códigos FIPE",
+    'reclaim_free_pages': "Recuperação de espaço do banco",
+    'reencode_images': "Recompressão das fotos",
+}
+
+def ensure_jobs_dir():
+    """Diretório de arquivos das tarefas da garagem ativa, criado se preciso"""
+    directory = tenant_dir(get_current_tenant())
+    jobs_dir = JOBS_DIR if directory is None else os.path.join(directory, "jobs")
+    if not os.path.exists(jobs_dir):
+        os.makedirs(jobs_dir, exist_ok=True)
+    return jobs_dir
+
+class JobProgress:
+    """Callback `progress(feitos, total, mensagem)` que grava no máximo a cada PROGRESS_INTERVAL"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, done, total, message=None):
+        now = time.monotonic()
+        if done < total and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        update_job_progress(self.job_id, done / total if total else 1.0, message or f"{done}/{total}")
+
+def import_vehicles(vehicles, replace=False, progress=None):
+    """Importa veículos exportados; retorna (importados, erros)"""
+    imported = 0
+    errors = []
+    for i, vehicle in enumerate(vehicles):
+        try:
+            # Substituir atualiza o veículo com a mesma chave e troca suas manutenções
+            import_vehicle(vehicle, mode='replace' if replace else 'keep_both')
+            imported += 1
+        except Exception as e:
+            errors.append(f"{vehicle.get('brand')} {vehicle.get('model')}: {e}")
+        if progress is not None:
+            progress(i + 1, len(vehicles))
+    return imported, errors
+
+def refresh_fipe_prices(progress=None):
+    """Consulta o valor FIPE atual de cada veículo da frota e grava os que mudaram
+
+    Usa os códigos da API gravados no veículo; os que não os têm são
+    achados pelo nome no índice de fipe_index.py e gravados junto. Valores
+    servidos do cache expirado (API fora do ar) não sobrescrevem o atual.
+    Um erro na consulta de um veículo (tempo esgotado, circuito aberto) é
+    contado em 'failed' e não interrompe os demais.
+    """
+    from fipe_api import get_fipe_price, parse_fipe_value
+    from fipe_index import vehicle_fipe_codes
+
+    vehicles = get_vehicles()
+    counts = {'updated': 0, 'unchanged': 0, 'not_found': 0, 'stale': 0, 'failed': 0}
+    for i, vehicle in enumerate(vehicles):
+        try:
+            codes = vehicle_fipe_codes(vehicle)
+            data = get_fipe_price(*codes) if codes is not None else None
+        except Exception as e:
+            logger.warning(f"Erro ao consultar o valor FIPE do veículo {vehicle.id}: {e}")
+            counts['failed'] += 1
+        else:
+            if codes is None:
+                counts['not_found'] += 1
+            else:
+                price = parse_fipe_value(data['Valor'])
+                fipe_code = data.get('CodigoFipe', vehicle.fipe_code)
+                refreshed = replace(vehicle, fipe_price=price, fipe_code=fipe_code, fipe_brand_code=codes[0],
+                                    fipe_model_code=codes[1], fipe_year_code=codes[2])
+                if data.get('stale'):
+                    counts['stale'] += 1
+                elif refreshed != vehicle:
+                    update_vehicle(vehicle.id, refreshed)
+                    counts['updated'] += 1
+                else:
+                    counts['unchanged'] += 1
+        if progress is not None:
+            progress(i + 1, len(vehicles))
+    return counts
+
+def _run_import(job, progress):
+    with open(job['params']['path'], encoding='utf-8') as f:
+        vehicles = json.load(f).get('vehicles', [])
+    imported, errors = import_vehicles(vehicles, job['params'].get('replace', False), progress)
+    os.remove(job['params']['path'])
+    result = {'imported': imported, 'errors': errors}
+    # Arquivos antigos não trazem os códigos FIPE: ficam para outra tarefa,
+    # para a importação não esperar pela API
+    if any(not vehicle.get('fipe_year_code') for vehicle in vehicles):
+        result['backfill_job'] = enqueue_job('backfill_fipe_codes')
+    return result
+
+def _run_export(job, progress):
+    export_data = export_vehicles(progress)
+    path = os.path.join(ensure_jobs_dir(), f"export_{job['id']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(export_data, f, indent=2, ensure_ascii=False)
+    return {'path': path, 'vehicles': len(export_data['vehicles'])}
+
+def _run_backup(job, progress):
+    return {'path': create_backup()}
+
+def _run_refresh_fipe_prices(job, progress):
+    return refresh_fipe_prices(progress)
+
+def _run_backfill_fipe_codes(job, progress):
+    from fipe_index import backfill_fipe_codes
+    return backfill_fipe_codes(progress)
+
+def _run_reclaim_free_pages(job, progress):
+    return reclaim_free_pages()
+
+def _run_reencode_images(job, progress):
+    from reencode_images import reencode_images
+    return reencode_images(restart=job['params'].get('restart', False), progress=progress)
+
+JOB_RUNNERS = {
+    'import_vehicles': _run_import,
+    'export_vehicles': _run_export,
+    'backup': _run_backup,
+    'refresh_fipe_prices': _run_refresh_fipe_prices,
+    'backfill_fipe_codes': _run_backfill_fipe_codes,
+    'reclaim_free_pages': _run_reclaim_free_pages,
+    'reencode_images': _run_reencode_images,
+}
+
+def submit_import(file_data, replace=False):
+    """Grava o arquivo enviado no diretório de tarefas e enfileira a importação"""
+    path = os.path.join(ensure_jobs_dir(), f"import_{uuid.uuid4().hex}.json")
+    with open(path, 'wb') as f:
+        f.write(file_data)
+    return enqueue_job('import_vehicles', {'path': path, 'replace': replace})
+
+def run_job(job):
+    """Executa uma tarefa já reservada e grava o resultado ou o erro"""
+    runner = JOB_RUNNERS.get(job['kind'])
+    start = time.perf_counter()
+    try:
+        if runner is None:
+            raise Exception(f"Tipo de tarefa desconhecido: {job['kind']}")
+        result = runner(job, JobProgress(job['id']))
+    except Exception as e:
+        logger.error(f"Erro na tarefa {job['id']} ({job['kind']}): {e}")
+        finish_job(job['id'], error=str(e))
+        return
+    finish_job(job['id'], result=result)
+    logger.info(f"Tarefa {job['id']} ({job['kind']}) concluída em {time.perf_counter() - start:.1f} s")
+
+def _initialized_tenants():
+    # Garagens cujo banco ainda não foi criado pelo init_db não têm fila
+    return [tenant for tenant in list_tenants() if os.path.exists(get_db_path(tenant))]
+
+def worker_loop(parent_pid=None):
+    """Laço de um processo de trabalho; termina se o processo do app sair
+
+    A cada volta reserva no máximo uma tarefa de cada garagem, para que uma
+    fila longa em uma garagem não atrase as outras.
+    """
+    pid = os.getpid()
+    logger.info(f"Processo de tarefas {pid} iniciado")
+    while parent_pid is None or os.getppid() == parent_pid:
+        ran = False
+        for tenant in _initialized_tenants():
+            with tenant_context(tenant):
+                try:
+                    job = claim_job(pid)
+                except Exception as e:
+                    logger.error(f"Erro ao consultar a fila de tarefas da garagem '{tenant}': {e}")
+                    continue
+                if job is not None:
+                    run_job(job)
+                    ran = True
+        if not ran:
+            time.sleep(POLL_INTERVAL)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def fail_interrupted_jobs():
+    """Marca como falhas as tarefas cujo processo morreu no meio da execução"""
+    interrupted = 0
+    for tenant in _initialized_tenants():
+        with tenant_context(tenant):
+            for job_id, worker_pid in get_running_jobs():
+                if worker_pid is None or not _pid_alive(worker_pid):
+                    finish_job(job_id, error="Interrompida: o processo de trabalho foi encerrado")
+                    interrupted += 1
+    if interrupted:
+        logger.warning(f"{interrupted} tarefa(s) interrompida(s) marcada(s) como falha")
+    return interrupted
+
+_workers = []
+
+def start_workers(count=JOB_WORKERS):
+    """Inicia (uma vez por processo) os processos de trabalho"""
+    import multiprocessing  # Só o processo do app precisa iniciar processos
+
+    alive = [process for process in _workers if process.is_alive()]
+    if alive:
+        return alive
+    fail_interrupted_jobs()
+    # spawn: o processo do app tem threads (escrita, FIPE) que não sobrevivem a um fork
+    context = multiprocessing.get_context('spawn')
+    _workers[:] = [
+        context.Process(target=worker_loop, args=(os.getpid(),), name=f"job-worker-{i}", daemon=True)
+        for i in range(count)
+    ]
+    for process in _workers:
+        process.start()
+    logger.info(f"{count} processo(s) de tarefas iniciado(s)")
+    return _workers
+
+if __name__ == "__main__":
+    worker_loop()
@@ -45,14 +45,17 @@ def cleanup_old_logs(days=15):
             except Exception as e:
                 print(f"Erro ao remover log antigo {filename}: {e}")
 
+_logs_ready = set()
+
 def setup_logger(name):
     """Configura e retorna um logger personalizado"""
-    # Limpa logs antigos antes de criar novo logger
-    cleanup_old_logs()
-    
-    # Cria o diretório de logs se não existir
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    # Limpa logs antigos e cria o diretório uma vez por processo (e diretório
+    # de trabalho), não a cada módulo
+    logs_dir = os.path.abspath('logs')
+    if logs_dir not in _logs_ready:
+        cleanup_old_logs()
+        os.makedirs('logs', exist_ok=True)
+        _logs_ready.add(logs_dir)
         
     # Cria o logger
     logger = logging.getLogger(name)
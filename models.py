@@ -0,0 +1,140 @@
+"""Registros tipados de veículos e manutenções"""
+from dataclasses import dataclass, fields
+
+class LazyImage:
+    """Foto de um veículo, lida do banco só no primeiro acesso
+
+    `loader(vehicle_id)` devolve o base64 da foto. Uma foto nova (upload)
+    é criada já carregada com `LazyImage.of(data)`.
+    """
+    __slots__ = ('vehicle_id', '_loader', '_data', 'loaded')
+
+    def __init__(self, vehicle_id=None, loader=None):
+        self.vehicle_id = vehicle_id
+        self._loader = loader
+        self._data = None
+        self.loaded = False
+
+    @classmethod
+    def of(cls, data):
+        image = cls()
+        image._data = data
+        image.loaded = True
+        return image
+
+    def get(self):
+        if not self.loaded:
+            if self._loader is None:
+                raise Exception(f"Foto do veículo {self.vehicle_id} sem origem para carregar")
+            self._data = self._loader(self.vehicle_id)
+            self.loaded = True
+        return self._data
+
+    def release(self):
+        """Descarta a foto da memória; ela volta a ser lida no próximo acesso"""
+        if self._loader is not None:
+            self._data = None
+            self.loaded = False
+
+# Colunas lidas nas listagens: a foto fica de fora e é trocada por um indicador
+VEHICLE_COLUMNS = '''id, brand, model, year, color, purchase_price, additional_costs,
+    fipe_price, natural_key, suffix, fipe_code, planned_sale_date,
+    fipe_brand_code, fipe_model_code, fipe_year_code,
+    image_data IS NOT NULL AS has_image'''
+
+@dataclass(slots=True, kw_only=True)
+class Vehicle:
+    brand: str
+    model: str
+    year: str
+    color: str | None = None
+    purchase_price: float = 0.0
+    additional_costs: float = 0.0
+    fipe_price: float = 0.0
+    image: LazyImage | None = None
+    id: int | None = None
+    natural_key: str | None = None
+    suffix: int = 0
+    fipe_code: str | None = None
+    planned_sale_date: str | None = None
+    # Códigos da API FIPE (marca, modelo, ano); os nomes acima são só para exibição
+    fipe_brand_code: str | None = None
+    fipe_model_code: str | None = None
+    fipe_year_code: str | None = None
+
+    @property
+    def image_data(self):
+        return self.image.get() if self.image is not None else None
+
+    @image_data.setter
+    def image_data(self, data):
+        self.image = LazyImage.of(data) if data is not None else None
+
+    @property
+    def has_image(self):
+        return self.image is not None
+
+    @property
+    def image_changed(self):
+        """Verdadeiro se a foto precisa ser gravada (nova, removida ou já lida)"""
+        return self.image is None or self.image.loaded
+
+    @classmethod
+    def from_dict(cls, data, image_loader=None):
+        """Monta o veículo a partir de um dict (cache, JSON exportado ou linha do banco)
+
+        Com 'image_data' a foto vem junto; com apenas 'has_image' ela é lida
+        por `image_loader` quando for acessada.
+        """
+        vehicle = cls(**{f.name: data[f.name] for f in fields(cls) if f.name != 'image' and f.name in data})
+        if data.get('image_data') is not None:
+            vehicle.image = LazyImage.of(data['image_data'])
+        elif data.get('has_image'):
+            vehicle.image = LazyImage(vehicle.id, image_loader)
+        return vehicle
+
+    @classmethod
+    def row_factory(cls, image_loader=None):
+        """row_factory do sqlite3 que devolve Vehicle em vez de tuplas"""
+        def factory(cursor, row):
+            return cls.from_dict({col[0]: value for col, value in zip(cursor.description, row)}, image_loader)
+        return factory
+
+    def to_dict(self, include_image=False):
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'image'}
+        if include_image:
+            data['image_data'] = self.image_data
+        else:
+            data['has_image'] = self.has_image
+        return data
+
+@dataclass(slots=True, kw_only=True)
+class Maintenance:
+    vehicle_id: int
+    date: str
+    description: str
+    cost: float
+    mileage: int | None = None
+    author: str = ''
+    next_maintenance_date: str | None = None
+    id: int | None = None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+    @classmethod
+    def row_factory(cls):
+        def factory(cursor, row):
+            return cls.from_dict({col[0]: value for col, value in zip(cursor.description, row)})
+        return factory
+
+    def to_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+@dataclass(slots=True, kw_only=True)
+class MaintenanceReport(Maintenance):
+    """Manutenção com a identificação do veículo, para relatórios"""
+    brand: str = ''
+    model: str = ''
+    year: str = ''
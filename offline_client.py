@@ -0,0 +1,313 @@
+"""Cliente offline: réplica local em SQLite e sincronização por alterações
+
+Pensado para o app móvel (buildozer.spec): o mecânico registra manutenções
+sem conexão e o cliente sincroniza quando a rede volta. A réplica guarda
+`vehicles` (sem as fotos) e `maintenance`; as escritas locais ficam em
+`pending_ops` até serem enviadas com `sync_push`. Depois do envio, o
+cliente baixa só as linhas alteradas desde a última sincronização
+(`export_changes`), já com o resultado da junção feita pelo servidor.
+
+Só manutenções são editáveis offline; veículos são somente leitura na réplica.
+"""
+import json
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+from models import Vehicle, Maintenance
+from logger import setup_logger
+
+logger = setup_logger('offline_client')
+
+SYNC_FIELDS = ('vehicle_id', 'date', 'description', 'cost', 'mileage', 'author', 'next_maintenance_date')
+
+class LocalTransport:
+    """Chama database.py direto; usado no simulador e quando cliente e servidor rodam juntos"""
+
+    def pull(self, since_seq):
+        from database import export_changes
+        return export_changes(since_seq, include_images=False)
+
+    def push(self, client_id, ops):
+        from database import sync_push
+        return sync_push(client_id, ops)
+
+class HttpTransport:
+    """Fala com as rotas /sync da API HTTP (api.py)"""
+
+    def __init__(self, base_url, token=None, timeout=30, tenant=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.headers = {'Accept-Encoding': 'gzip'}
+        if token:
+            self.headers['Authorization'] = f"Bearer {token}"
+        if tenant:
+            self.headers['X-Tenant'] = tenant
+
+    def pull(self, since_seq):
+        import requests
+        response = requests.get(f"{self.base_url}/sync/changes", params={'since': since_seq},
+                                headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def push(self, client_id, ops):
+        import requests
+        response = requests.post(f"{self.base_url}/sync/push", json={'client_id': client_id, 'ops': ops},
+                                 headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+def _utc_now():
+    # Mesmo formato do CURRENT_TIMESTAMP do log de alterações do servidor
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class OfflineClient:
+    def __init__(self, path, transport, client_id=None):
+        self.path = path
+        self.transport = transport
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+        self.client_id = client_id or self._state('client_id') or uuid.uuid4().hex
+        self._set_state('client_id', self.client_id)
+        self.conn.commit()
+
+    def _init_schema(self):
+        c = self.conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS vehicles (
+                id INTEGER PRIMARY KEY,
+                brand TEXT NOT NULL,
+                model TEXT NOT NULL,
+                year TEXT NOT NULL,
+                color TEXT,
+                purchase_price REAL,
+                additional_costs REAL DEFAULT 0,
+                fipe_price REAL,
+                natural_key TEXT,
+                suffix INTEGER NOT NULL DEFAULT 0,
+                fipe_code TEXT,
+                planned_sale_date TEXT,
+                has_image INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # Manutenções criadas offline recebem id negativo até o servidor devolver o definitivo
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS maintenance (
+                id INTEGER PRIMARY KEY,
+                vehicle_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                description TEXT NOT NULL,
+                cost REAL NOT NULL,
+                mileage INTEGER,
+                author TEXT NOT NULL DEFAULT '',
+                next_maintenance_date TEXT
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_maintenance_vehicle ON maintenance(vehicle_id)')
+        # Uma operação pendente por manutenção: edições seguidas são juntadas
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS pending_ops (
+                op_id TEXT PRIMARY KEY,
+                maintenance_id INTEGER NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                data TEXT NOT NULL,
+                base TEXT,
+                base_seq INTEGER NOT NULL,
+                edited_at TEXT NOT NULL
+            )
+        ''')
+        c.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _state(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, str(value)))
+
+    @property
+    def last_seq(self):
+        return int(self._state('last_seq', 0))
+
+    def close(self):
+        self.conn.close()
+
+    # Leitura
+
+    def get_vehicles(self, image_loader=None):
+        rows = self.conn.execute('SELECT * FROM vehicles ORDER BY id').fetchall()
+        return [Vehicle.from_dict(dict(row), image_loader) for row in rows]
+
+    def get_vehicle_maintenance(self, vehicle_id):
+        rows = self.conn.execute(
+            'SELECT * FROM maintenance WHERE vehicle_id = ? ORDER BY date DESC', (vehicle_id,)
+        ).fetchall()
+        return [Maintenance.from_dict(dict(row)) for row in rows]
+
+    def get_maintenance(self, maintenance_id):
+        row = self.conn.execute('SELECT * FROM maintenance WHERE id = ?', (maintenance_id,)).fetchone()
+        return Maintenance.from_dict(dict(row)) if row else None
+
+    def pending_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM pending_ops').fetchone()[0]
+
+    # Escrita offline
+
+    def _recalculate_additional_costs(self, vehicle_id):
+        self.conn.execute('''
+            UPDATE vehicles SET additional_costs = (
+                SELECT COALESCE(SUM(cost), 0) FROM maintenance WHERE vehicle_id = ?
+            ) WHERE id = ?
+        ''', (vehicle_id, vehicle_id))
+
+    def _row_data(self, maintenance_id):
+        row = self.conn.execute('SELECT * FROM maintenance WHERE id = ?', (maintenance_id,)).fetchone()
+        if row is None:
+            raise Exception(f"Manutenção {maintenance_id} não encontrada na réplica")
+        return {field: row[field] for field in SYNC_FIELDS}
+
+    def _pending(self, maintenance_id):
+        return self.conn.execute(
+            'SELECT * FROM pending_ops WHERE maintenance_id = ?', (maintenance_id,)
+        ).fetchone()
+
+    def add_maintenance(self, maintenance):
+        """Registra a manutenção na réplica e na fila de envio; retorna o id local (negativo)"""
+        data = {field: getattr(maintenance, field) for field in SYNC_FIELDS}
+        with self.conn:
+            local_id = self.conn.execute('SELECT MIN(0, COALESCE(MIN(id), 0)) - 1 FROM maintenance').fetchone()[0]
+            self.conn.execute(f'''
+                INSERT INTO maintenance (id, {', '.join(SYNC_FIELDS)})
+                VALUES (?, {', '.join('?' for _ in SYNC_FIELDS)})
+            ''', (local_id, *data.values()))
+            self.conn.execute(
+                'INSERT INTO pending_ops (op_id, maintenance_id, kind, data, base_seq, edited_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (uuid.uuid4().hex, local_id, 'insert', json.dumps(data), self.last_seq, _utc_now())
+            )
+            self._recalculate_additional_costs(maintenance.vehicle_id)
+        return local_id
+
+    def update_maintenance(self, maintenance_id, maintenance):
+        data = {field: getattr(maintenance, field) for field in SYNC_FIELDS}
+        data['vehicle_id'] = self._row_data(maintenance_id)['vehicle_id']
+        with self.conn:
+            pending = self._pending(maintenance_id)
+            if pending is None:
+                # Primeira edição desde a sincronização: guarda a linha como o servidor a mandou
+                base = self._row_data(maintenance_id)
+                self.conn.execute(
+                    'INSERT INTO pending_ops (op_id, maintenance_id, kind, data, base, base_seq, edited_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (uuid.uuid4().hex, maintenance_id, 'update', json.dumps(data), json.dumps(base),
+                     self.last_seq, _utc_now())
+                )
+            else:
+                self.conn.execute(
+                    'UPDATE pending_ops SET data = ?, edited_at = ? WHERE op_id = ?',
+                    (json.dumps(data), _utc_now(), pending['op_id'])
+                )
+            self.conn.execute(f'''
+                UPDATE maintenance SET {', '.join(f'{field} = ?' for field in SYNC_FIELDS)} WHERE id = ?
+            ''', (*data.values(), maintenance_id))
+            self._recalculate_additional_costs(data['vehicle_id'])
+
+    def delete_maintenance(self, maintenance_id):
+        vehicle_id = self._row_data(maintenance_id)['vehicle_id']
+        with self.conn:
+            pending = self._pending(maintenance_id)
+            if pending is not None and pending['kind'] == 'insert':
+                # Nunca chegou ao servidor: basta descartar
+                self.conn.execute('DELETE FROM pending_ops WHERE op_id = ?', (pending['op_id'],))
+            else:
+                base = json.loads(pending['base']) if pending is not None else self._row_data(maintenance_id)
+                self.conn.execute('DELETE FROM pending_ops WHERE maintenance_id = ?', (maintenance_id,))
+                self.conn.execute(
+                    'INSERT INTO pending_ops (op_id, maintenance_id, kind, data, base, base_seq, edited_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (uuid.uuid4().hex, maintenance_id, 'delete', '{}', json.dumps(base),
+                     pending['base_seq'] if pending is not None else self.last_seq, _utc_now())
+                )
+            self.conn.execute('DELETE FROM maintenance WHERE id = ?', (maintenance_id,))
+            self._recalculate_additional_costs(vehicle_id)
+
+    # Sincronização
+
+    def _push(self):
+        rows = self.conn.execute('SELECT * FROM pending_ops ORDER BY rowid').fetchall()
+        if not rows:
+            return []
+        ops = [{
+            'op_id': row['op_id'],
+            'kind': row['kind'],
+            'id': row['maintenance_id'],
+            'data': json.loads(row['data']),
+            'base': json.loads(row['base']) if row['base'] else {},
+            'base_seq': row['base_seq'],
+            'edited_at': row['edited_at'],
+        } for row in rows]
+        response = self.transport.push(self.client_id, ops)
+
+        with self.conn:
+            for op, result in zip(ops, response['results']):
+                if op['kind'] == 'insert':
+                    if result['status'] == 'rejected':
+                        self.conn.execute('DELETE FROM maintenance WHERE id = ?', (op['id'],))
+                    else:
+                        # Troca o id local pelo definitivo; o pull traz a linha do servidor
+                        self.conn.execute('UPDATE maintenance SET id = ? WHERE id = ?', (result['id'], op['id']))
+                self.conn.execute('DELETE FROM pending_ops WHERE op_id = ?', (op['op_id'],))
+        return response['results']
+
+    def _pull(self):
+        changes = self.transport.pull(self.last_seq)
+        with self.conn:
+            if changes.get('reset'):
+                # O servidor já podou parte do intervalo: a exportação é completa e
+                # o que não veio nela foi excluído (manutenções ainda não enviadas ficam)
+                ids = [row['id'] for row in changes['maintenance']['upserts']]
+                self.conn.execute('''
+                    DELETE FROM maintenance WHERE id NOT IN (SELECT value FROM json_each(?))
+                    AND id NOT IN (SELECT maintenance_id FROM pending_ops)
+                ''', (json.dumps(ids),))
+                ids = [row['id'] for row in changes['vehicles']['upserts']]
+                self.conn.execute('DELETE FROM vehicles WHERE id NOT IN (SELECT value FROM json_each(?))',
+                                  (json.dumps(ids),))
+            for row in changes['vehicles']['upserts']:
+                row = {key: value for key, value in row.items() if key != 'image_data'}
+                self._upsert('vehicles', row)
+            for row in changes['maintenance']['upserts']:
+                self._upsert('maintenance', row)
+            self.conn.executemany('DELETE FROM maintenance WHERE id = ?',
+                                  [(row_id,) for row_id in changes['maintenance']['deletes']])
+            self.conn.executemany('DELETE FROM maintenance WHERE vehicle_id = ?',
+                                  [(row_id,) for row_id in changes['vehicles']['deletes']])
+            self.conn.executemany('DELETE FROM vehicles WHERE id = ?',
+                                  [(row_id,) for row_id in changes['vehicles']['deletes']])
+            self._set_state('last_seq', changes['until'])
+        return changes
+
+    def _upsert(self, table, row):
+        columns = [col[1] for col in self.conn.execute(f'PRAGMA table_info({table})')]
+        fields = [field for field in row if field in columns]
+        updates = ', '.join(f'{field} = excluded.{field}' for field in fields if field != 'id')
+        self.conn.execute(f'''
+            INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})
+            ON CONFLICT(id) DO UPDATE SET {updates}
+        ''', [row[field] for field in fields])
+
+    def sync(self):
+        """Envia as operações pendentes e baixa as alterações do servidor
+
+        Sem conexão a exceção do transporte é repassada e nada é perdido:
+        as operações continuam pendentes até a próxima tentativa.
+        """
+        results = self._push()
+        changes = self._pull()
+        conflicts = [result for result in results if result['status'] in ('merged', 'rejected')]
+        pulled = sum(len(changes[table]['upserts']) + len(changes[table]['deletes'])
+                     for table in ('vehicles', 'maintenance'))
+        logger.info(f"Sincronização: {len(results)} enviada(s), {pulled} recebida(s), "
+                    f"{len(conflicts)} conflito(s), sequência {changes['until']}")
+        return {'pushed': len(results), 'pulled': pulled, 'conflicts': conflicts, 'sequence': changes['until']}
@@ -0,0 +1,159 @@
+"""Recompressão das fotos já gravadas com as configurações de `save_image`
+
+Até aqui o formulário gravava a foto como enviada (PNGs e JPEGs de câmera
+de vários MB, em base64). As fotos são lidas em lotes, recomprimidas por
+um conjunto de processos (redução para IMAGE_MAX_SIZE, JPEG em
+IMAGE_QUALITY, respeitando a rotação EXIF) e gravadas de volta em lote
+pela thread de escrita. O último id concluído fica num arquivo de
+progresso da garagem, então uma execução interrompida continua de onde
+parou. Ao final, as páginas liberadas são devolvidas ao sistema.
+
+    python reencode_images.py             # todas as garagens
+    python reencode_images.py --restart   # ignora o progresso salvo
+"""
+import base64
+import json
+import multiprocessing
+import os
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+from database import get_db, iter_vehicle_images, replace_vehicle_images, reclaim_free_pages
+from logger import setup_logger
+from tenants import tenant_dir, get_current_tenant
+from vehicle_manager import IMAGE_MAX_SIZE, IMAGE_QUALITY, encode_image
+
+logger = setup_logger('reencode_images')
+
+REENCODE_WORKERS = int(os.environ.get("REENCODE_WORKERS", os.cpu_count() or 1))
+REENCODE_BATCH_SIZE = 64   # Fotos lidas, recomprimidas e gravadas por vez
+PROGRESS_FILE = "reencode_images.json"
+EXIF_ORIENTATION = 0x0112
+
+def _progress_path():
+    directory = tenant_dir(get_current_tenant())
+    return os.path.join("data" if directory is None else directory, PROGRESS_FILE)
+
+def _settings():
+    return {'max_size': list(IMAGE_MAX_SIZE), 'quality': IMAGE_QUALITY}
+
+def _empty_totals():
+    return {'processed': 0, 'reencoded': 0, 'skipped': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+def load_progress():
+    """Progresso salvo da garagem ativa; descartado se as configurações de imagem mudaram"""
+    try:
+        with open(_progress_path(), encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('settings') == _settings() else None
+
+def _save_progress(last_id, totals):
+    path = _progress_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'settings': _settings(), 'last_id': last_id, 'totals': totals}, f)
+    os.replace(path + '.tmp', path)
+
+def _is_encoded(image_bytes):
+    """Já está como `save_image` grava: JPEG dentro do tamanho máximo e sem rotação pendente"""
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_bytes))  # Só o cabeçalho é lido
+    return (image.format == 'JPEG'
+            and image.width <= IMAGE_MAX_SIZE[0] and image.height <= IMAGE_MAX_SIZE[1]
+            and image.getexif().get(EXIF_ORIENTATION, 1) == 1)
+
+def reencode(image_data):
+    """Foto em base64 recomprimida, ou None se já estiver pronta ou não ficar menor
+
+    Retorna (foto nova, erro); roda nos processos do conjunto.
+    """
+    try:
+        image_bytes = base64.b64decode(image_data)
+        if _is_encoded(image_bytes):
+            return None, None
+        encoded = base64.b64encode(encode_image(image_bytes)).decode()
+        return (encoded if len(encoded) < len(image_data) else None), None
+    except Exception as e:
+        return None, str(e)
+
+def _pending_images(after_id):
+    conn = get_db()
+    try:
+        return conn.execute(
+            'SELECT COUNT(*) FROM vehicles WHERE id > ? AND image_data IS NOT NULL', (after_id,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+def _create_pool(workers):
+    if workers <= 1:
+        return None
+    # Processos de trabalho (jobs.py) são daemon e não podem ter filhos: lá
+    # usamos threads, já que o Pillow solta o GIL ao reduzir e comprimir
+    if multiprocessing.current_process().daemon:
+        return ThreadPool(workers)
+    return multiprocessing.get_context('spawn').Pool(workers)
+
+def reencode_images(workers=REENCODE_WORKERS, restart=False, progress=None):
+    """Recomprime as fotos da garagem ativa e retorna os totais, com os bytes economizados"""
+    state = None if restart else load_progress()
+    last_id = state['last_id'] if state else 0
+    totals = state['totals'] if state else _empty_totals()
+    if last_id:
+        logger.info(f"Recompressão retomada após o veículo {last_id}")
+    pending = _pending_images(last_id)
+    done = 0
+    pool = _create_pool(workers)
+    try:
+        for batch in iter_vehicle_images(last_id, REENCODE_BATCH_SIZE):
+            images = [image_data for _, image_data in batch]
+            results = pool.map(reencode, images) if pool else [reencode(image) for image in images]
+            updates = []
+            for (vehicle_id, image_data), (encoded, error) in zip(batch, results):
+                if error:
+                    logger.warning(f"Foto do veículo {vehicle_id} não recomprimida: {error}")
+                    totals['failed'] += 1
+                elif encoded is None:
+                    totals['skipped'] += 1
+                else:
+                    updates.append((vehicle_id, image_data, encoded))
+            if updates:
+                replaced = set(replace_vehicle_images(updates))
+                for vehicle_id, image_data, encoded in updates:
+                    if vehicle_id in replaced:
+                        totals['reencoded'] += 1
+                        totals['bytes_before'] += len(image_data)
+                        totals['bytes_after'] += len(encoded)
+                    else:
+                        totals['skipped'] += 1  # Foto trocada pelo usuário no meio tempo
+            totals['processed'] += len(batch)
+            last_id = batch[-1][0]
+            _save_progress(last_id, totals)
+            done += len(batch)
+            if progress is not None:
+                progress(min(done, pending), pending)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    # Concluída: a próxima execução percorre tudo de novo (e pula as fotos já prontas)
+    if os.path.exists(_progress_path()):
+        os.remove(_progress_path())
+    totals['bytes_saved'] = totals['bytes_before'] - totals['bytes_after']
+    totals['reclaimed_bytes'] = reclaim_free_pages()['bytes']
+    logger.info(f"Fotos: {totals['reencoded']} recomprimida(s), {totals['skipped']} mantida(s), "
+                f"{totals['failed']} com erro; {totals['bytes_saved'] / 1024 / 1024:.1f} MB economizados")
+    return totals
+
+if __name__ == "__main__":
+    import sys
+    from database import init_tenants
+    from tenants import list_tenants, tenant_context
+
+    init_tenants()
+    for tenant in list_tenants():
+        with tenant_context(tenant):
+            print(tenant, reencode_images(restart='--restart' in sys.argv))
@@ -0,0 +1,54 @@
+"""Tarefas diárias executadas em segundo plano"""
+import threading
+import time
+from datetime import datetime
+from database import claim_scheduled_task, release_scheduled_task
+from tenants import DEFAULT_TENANT, tenant_context
+from logger import setup_logger
+
+logger = setup_logger('scheduler')
+
+CHECK_INTERVAL = 3600  # Segundos entre verificações; a tarefa roda uma vez por dia
+
+_threads = {}
+_threads_lock = threading.Lock()
+
+def run_if_due(name, task, today=None):
+    """Executa a tarefa se ela ainda não rodou hoje (em nenhum processo)
+
+    O dia é reservado antes da execução, para que dois processos não rodem
+    a tarefa juntos; se ela falhar, a reserva é desfeita e a exceção repassada.
+    """
+    run_on = (today or datetime.now().date()).strftime('%Y-%m-%d')
+    if not claim_scheduled_task(name, run_on):
+        return False
+    start = time.perf_counter()
+    try:
+        task()
+    except BaseException:
+        release_scheduled_task(name, run_on)
+        raise
+    logger.info(f"Tarefa '{name}' executada em {(time.perf_counter() - start) * 1000:.0f} ms")
+    return True
+
+def start_daily_task(name, task, check_interval=CHECK_INTERVAL, tenant=DEFAULT_TENANT):
+    """Inicia (uma vez por processo e garagem) a thread que executa `task` uma vez por dia"""
+    with _threads_lock:
+        thread = _threads.get((name, tenant))
+        if thread is not None and thread.is_alive():
+            return thread
+
+        def run():
+            with tenant_context(tenant):
+                while True:
+                    try:
+                        run_if_due(name, task)
+                    except Exception as e:
+                        logger.error(f"Erro na tarefa '{name}' ({tenant}): {e}")
+                    time.sleep(check_interval)
+
+        thread = threading.Thread(target=run, name=f"daily-{name}-{tenant}", daemon=True)
+        thread.start()
+        _threads[(name, tenant)] = thread
+        logger.info(f"Tarefa diária '{name}' agendada para a garagem '{tenant}'")
+        return thread
@@ -0,0 +1,95 @@
+"""Garagens (tenants): cada uma com seu banco, seus backups e seu cache
+
+A garagem principal continua usando os caminhos de sempre (vehicles.db,
+data/backups e cache/); as demais ficam em data/tenants/<id>/ e
+cache/tenants/<id>/. A garagem ativa é guardada em uma ContextVar: o app
+define a da sessão no início de cada execução e as threads e processos em
+segundo plano usam `tenant_context` para trabalhar em uma garagem.
+"""
+import json
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logger import setup_logger
+
+logger = setup_logger('tenants')
+
+DEFAULT_TENANT = os.environ.get("DEFAULT_TENANT", "principal")
+TENANTS_DIR = "data/tenants"
+TENANT_FILE = "tenant.json"
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+_current_tenant = ContextVar('tenant', default=None)
+
+def validate_tenant_id(tenant):
+    """Garante que o id só tem caracteres seguros para nome de diretório"""
+    if not isinstance(tenant, str) or not TENANT_ID_PATTERN.match(tenant):
+        raise ValueError(f"Identificador de garagem inválido: {tenant!r}")
+    return tenant
+
+def tenant_dir(tenant):
+    """Diretório de dados da garagem; None para a principal, que usa os caminhos antigos"""
+    if tenant == DEFAULT_TENANT:
+        return None
+    return os.path.join(TENANTS_DIR, validate_tenant_id(tenant))
+
+def get_current_tenant():
+    return _current_tenant.get() or DEFAULT_TENANT
+
+def set_current_tenant(tenant):
+    """Define a garagem da execução atual (ex.: a da sessão do Streamlit)"""
+    if tenant != DEFAULT_TENANT and not tenant_exists(tenant):
+        raise ValueError(f"Garagem não encontrada: {tenant}")
+    _current_tenant.set(tenant)
+
+@contextmanager
+def tenant_context(tenant):
+    """Executa o bloco com `tenant` como garagem ativa"""
+    if tenant != DEFAULT_TENANT:
+        validate_tenant_id(tenant)
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+def tenant_exists(tenant):
+    if tenant == DEFAULT_TENANT:
+        return True
+    try:
+        return os.path.exists(os.path.join(tenant_dir(tenant), TENANT_FILE))
+    except ValueError:
+        return False
+
+def list_tenants():
+    """Ids das garagens cadastradas, a principal primeiro"""
+    tenants = [DEFAULT_TENANT]
+    if os.path.isdir(TENANTS_DIR):
+        tenants += sorted(
+            entry.name for entry in os.scandir(TENANTS_DIR)
+            if entry.is_dir() and entry.name != DEFAULT_TENANT
+            and TENANT_ID_PATTERN.match(entry.name)
+            and os.path.exists(os.path.join(entry.path, TENANT_FILE))
+        )
+    return tenants
+
+def get_tenant_name(tenant):
+    if tenant != DEFAULT_TENANT:
+        try:
+            with open(os.path.join(tenant_dir(tenant), TENANT_FILE), encoding='utf-8') as f:
+                return json.load(f).get('name') or tenant
+        except (OSError, ValueError):
+            pass
+    return tenant.capitalize() if tenant == DEFAULT_TENANT else tenant
+
+def create_tenant(tenant, name=None):
+    """Cadastra uma garagem; o banco é criado pelo init_db na primeira vez que ela é usada"""
+    directory = tenant_dir(validate_tenant_id(tenant))
+    if directory is None or tenant_exists(tenant):
+        raise ValueError(f"Garagem já existe: {tenant}")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, TENANT_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'name': name or tenant}, f, ensure_ascii=False)
+    logger.info(f"Garagem '{tenant}' criada em {directory}")
+    return tenant
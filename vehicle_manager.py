@@ -1,26 +1,43 @@
 import base64
-from PIL import Image
 from io import BytesIO
 
+IMAGE_MAX_SIZE = (800, 800)
+IMAGE_QUALITY = 85
+
+def encode_image(image_file):
+    """
+    Resize and compress an image (file or bytes) to JPEG bytes
+    """
+    from PIL import Image, ImageOps  # Pillow só é carregado quando há imagem
+
+    if isinstance(image_file, (bytes, bytearray)):
+        image_file = BytesIO(image_file)
+    image = Image.open(image_file)
+    # Fotos de celular vêm deitadas com a rotação só na tag EXIF, que o JPEG gravado não leva
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(IMAGE_MAX_SIZE, Image.LANCZOS)
+
+    # JPEG não tem transparência: PNGs com canal alfa vão sobre fundo branco
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
 def save_image(image_file):
     """
     Convert uploaded image to base64 string for storage
     """
     if image_file is None:
         return None
-        
+
     try:
-        # Open and compress the image
-        image = Image.open(image_file)
-        max_size = (800, 800)
-        image.thumbnail(max_size, Image.LANCZOS)
-        
-        # Convert to JPEG format
-        buffer = BytesIO()
-        image.save(buffer, format="JPEG", quality=85, optimize=True)
-        image_bytes = buffer.getvalue()
-        
-        # Convert to base64
-        return base64.b64encode(image_bytes).decode()
+        return base64.b64encode(encode_image(image_file)).decode()
     except Exception as e:
         raise Exception(f"Erro ao processar imagem: {str(e)}")